@@ -8,12 +8,13 @@ The middleware automatically injects the user's assigned variant into the reques
 """
 from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends, Request
 from fastapi.responses import JSONResponse
-from typing import Optional
+from types import MappingProxyType
+from typing import Annotated, Optional
 import tempfile
 import os
-import time
 
-from models.search import SearchResponse, ImageSearchResponse, ProductResult
+from config.settings import settings
+from models.search import TextSearchRequest, SearchResponse, ImageSearchResponse, ProductResult
 from services.ab_testing import get_experiment_manager, ExperimentVariant
 from services.search_variants import get_search_variant
 from api.ab_middleware import inject_variant, get_user_id, get_session_id
@@ -21,15 +22,41 @@ from api.ab_middleware import inject_variant, get_user_id, get_session_id
 
 router = APIRouter(prefix="/search-ab", tags=["search-ab"])
 
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Static variant descriptions, built once and served read-only
+VARIANT_INFO = MappingProxyType({
+    "search_v1": MappingProxyType({
+        "name": "search_v1",
+        "type": "baseline",
+        "description": "Vector similarity only",
+        "scoring_factors": ("vector_similarity",),
+        "reranking_enabled": False,
+        "speed": "fast",
+        "best_for": "Quick, simple similarity-based retrieval"
+    }),
+    "search_v2": MappingProxyType({
+        "name": "search_v2",
+        "type": "enhanced",
+        "description": "Vector + multi-factor ranking",
+        "scoring_factors": (
+            "vector_similarity (0.5)",
+            "color_match (0.2)",
+            "category_match (0.2)",
+            "text_similarity (0.1)"
+        ),
+        "reranking_enabled": True,
+        "speed": "standard",
+        "best_for": "Comprehensive ranking with semantic and metadata matching"
+    }),
+})
+
 
 @router.post("/text", response_model=SearchResponse)
 async def search_by_text_ab(
     request: Request,
-    query: str = Query(..., min_length=1, description="Text search query"),
-    top_k: int = Query(10, ge=1, le=100, description="Number of results"),
-    category: Optional[str] = Query(None, description="Filter by category"),
-    color: Optional[str] = Query(None, description="Filter by color"),
-    debug: bool = Query(False, description="Include debug scoring"),
+    params: Annotated[TextSearchRequest, Query()],
     variant: str = Depends(inject_variant),
     user_id: str = Depends(get_user_id),
     session_id: Optional[str] = Depends(get_session_id),
@@ -41,12 +68,15 @@ async def search_by_text_ab(
     request is executed using that variant. The search event is logged for
     metrics tracking.
     
+    Query parameters are validated in one pass against TextSearchRequest.
+    
     Args:
-        query: Text search query (required)
-        top_k: Number of results to return (1-100, default 10)
-        category: Optional category filter
-        color: Optional color filter
-        debug: Include debug scoring breakdown
+        params: Query parameters (TextSearchRequest)
+            - query: Text search query (required)
+            - top_k: Number of results to return (1-100, default 10)
+            - category: Optional category filter
+            - color: Optional color filter
+            - debug: Include debug scoring breakdown
         
     Returns:
         SearchResponse with results and metrics
@@ -62,28 +92,27 @@ async def search_by_text_ab(
         # Get search variant implementation
         search_variant = get_search_variant(variant)
         
-        # Execute search with timing
-        start_time = time.time()
+        # Execute search; the variant measures its own search time
         results, search_time_ms = search_variant.search_by_text(
-            query_text=query,
-            top_k=top_k,
-            category_filter=category,
-            color_filter=color,
-            debug=debug
+            query_text=params.query,
+            top_k=params.top_k,
+            category_filter=params.category,
+            color_filter=params.color,
+            debug=params.debug
         )
         
         # Log search event to A/B testing framework
         manager = get_experiment_manager()
         manager.log_search(
             user_id=user_id,
-            query=query,
+            query=params.query,
             results_count=len(results),
             search_time_ms=search_time_ms,
             session_id=session_id
         )
         
         return SearchResponse(
-            query=query,
+            query=params.query,
             results=results,
             total_results=len(results)
         )
@@ -129,23 +158,29 @@ async def search_by_image_ab(
           -H "X-User-ID: user123" \\
           -F "file=@/path/to/image.jpg"
     """
-    # Validate file type
+    # Validate file type before reading any of the body
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
     temp_path = None
     try:
-        # Save uploaded file temporarily
+        # Stream uploaded file to a temporary file, bounded by the upload limit
         with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
             temp_path = temp_file.name
+            size = 0
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.MAX_IMAGE_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Image exceeds {settings.MAX_IMAGE_UPLOAD_BYTES} bytes"
+                    )
+                temp_file.write(chunk)
         
         # Get search variant implementation
         search_variant = get_search_variant(variant)
         
-        # Execute search with timing
-        start_time = time.time()
+        # Execute search; the variant measures its own search time
         results, search_time_ms = search_variant.search_by_image(
             image_path=temp_path,
             top_k=top_k,
@@ -170,6 +205,8 @@ async def search_by_image_ab(
             total_results=len(results)
         )
         
+    except HTTPException:
+        raise
     except ValueError as e:
         # Variant not found
         raise HTTPException(status_code=400, detail=f"Invalid variant: {str(e)}")
@@ -237,36 +274,10 @@ async def get_variant_info(variant_name: str):
             "reranking_enabled": false
         }
     """
-    try:
-        variant = get_search_variant(variant_name)
-        
-        if variant_name == "search_v1":
-            return {
-                "name": "search_v1",
-                "type": "baseline",
-                "description": "Vector similarity only",
-                "scoring_factors": ["vector_similarity"],
-                "reranking_enabled": False,
-                "speed": "fast",
-                "best_for": "Quick, simple similarity-based retrieval"
-            }
-        elif variant_name == "search_v2":
-            return {
-                "name": "search_v2",
-                "type": "enhanced",
-                "description": "Vector + multi-factor ranking",
-                "scoring_factors": [
-                    "vector_similarity (0.5)",
-                    "color_match (0.2)",
-                    "category_match (0.2)",
-                    "text_similarity (0.1)"
-                ],
-                "reranking_enabled": True,
-                "speed": "standard",
-                "best_for": "Comprehensive ranking with semantic and metadata matching"
-            }
-        else:
-            raise ValueError(f"Unknown variant: {variant_name}")
-            
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+    info = VARIANT_INFO.get(variant_name)
+    if info is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown variant: {variant_name}. Available: {list(VARIANT_INFO)}"
+        )
+    return info
@@ -6,7 +6,8 @@ from fastapi.responses import JSONResponse
 from typing import Optional
 import tempfile
 import os
-import json
+
+import orjson
 
 from models.agent import RecommendRequest, RecommendResponse, Recommendation
 from services import get_search_service, get_llm_client
@@ -104,9 +105,9 @@ async def recommend(
         
         # Step 4: Parse LLM response and build recommendations
         try:
-            llm_json = json.loads(agent_response["llm_response"])
+            llm_json = orjson.loads(agent_response["llm_response"])
             recommendations_data = llm_json.get("recommendations", [])
-        except (json.JSONDecodeError, KeyError, TypeError):
+        except (orjson.JSONDecodeError, KeyError, TypeError):
             # Fallback if LLM response isn't valid JSON
             recommendations_data = [
                 {
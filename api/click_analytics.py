@@ -343,6 +343,37 @@ async def get_response_time(
         raise HTTPException(status_code=500, detail=f"Response time metrics failed: {str(e)}")
 
 
+@router.get("/metrics", response_model=dict)
+async def get_all_metrics(
+    user_id: Optional[str] = Query(None, description="Filter by user"),
+    variant: Optional[str] = Query(None, description="Filter by variant"),
+    days: int = Query(7, ge=1, le=365, description="Look back period")
+) -> dict:
+    """
+    Get CTR, rank, response-time and variant metrics together.
+    
+    Returns the same statistics as /ctr, /rank-metrics, /response-time and
+    /variants-comparison, computed in a single database round trip.
+    
+    Args:
+        user_id: Filter by user (optional)
+        variant: Filter by variant (optional)
+        days: Look back period in days
+        
+    Returns:
+        Metrics under "ctr", "rank", "response_time" and "variants"
+        
+    Example (curl):
+        curl "http://localhost:8000/analytics/metrics"
+        curl "http://localhost:8000/analytics/metrics?variant=search_v2&days=14"
+    """
+    try:
+        tracker = get_click_tracker()
+        return tracker.get_all_metrics(user_id=user_id, variant=variant, days=days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Metrics calculation failed: {str(e)}")
+
+
 @router.get("/user/{user_id}", response_model=dict)
 async def get_user_analytics(
     user_id: str,
@@ -11,9 +11,9 @@ from models.search import (
     TextSearchRequest,
     SearchResponse,
     ImageSearchResponse,
-    ProductResult,
     HealthResponse,
-    MultimodalSearchResponse
+    MultimodalSearchResponse,
+    to_product_results
 )
 from services import get_search_service, get_clip_service
 from db import WeaviateClient
@@ -50,20 +50,7 @@ async def search_by_text(request: TextSearchRequest):
         )
         
         # Convert to response model
-        product_results = [
-            ProductResult(
-                product_id=r.product_id,
-                title=r.title,
-                description=r.description,
-                color=r.color,
-                category=r.category,
-                image_path=r.image_path,
-                similarity=r.similarity,
-                distance=r.distance,
-                debug_scores=r.debug_scores
-            )
-            for r in results
-        ]
+        product_results = to_product_results(results)
         
         return SearchResponse(
             query=request.query,
@@ -125,20 +112,7 @@ async def search_by_image(
         )
         
         # Convert to response model
-        product_results = [
-            ProductResult(
-                product_id=r.product_id,
-                title=r.title,
-                description=r.description,
-                color=r.color,
-                category=r.category,
-                image_path=r.image_path,
-                similarity=r.similarity,
-                distance=r.distance,
-                debug_scores=r.debug_scores
-            )
-            for r in results
-        ]
+        product_results = to_product_results(results)
         
         return ImageSearchResponse(
             filename=file.filename,
@@ -202,20 +176,7 @@ async def search_multimodal(
             enable_debug=debug
         )
 
-        product_results = [
-            ProductResult(
-                product_id=r.product_id,
-                title=r.title,
-                description=r.description,
-                color=r.color,
-                category=r.category,
-                image_path=r.image_path,
-                similarity=r.similarity,
-                distance=r.distance,
-                debug_scores=r.debug_scores
-            )
-            for r in results
-        ]
+        product_results = to_product_results(results)
 
         return MultimodalSearchResponse(
             text=text,
@@ -11,19 +11,27 @@ load_dotenv()
 class Settings:
     """Application settings loaded from environment variables."""
 
-    # MongoDB
-    MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-    MONGO_DB_NAME: str = os.getenv("MONGO_DB_NAME", "omnisearch")
+    def __init__(self):
+        """Read every setting from the environment at construction time."""
+        # MongoDB
+        self.MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+        self.MONGO_DB_NAME: str = os.getenv("MONGO_DB_NAME", "omnisearch")
 
-    # Weaviate
-    WEAVIATE_URL: str = os.getenv("WEAVIATE_URL", "http://localhost:8080")
+        # Weaviate
+        self.WEAVIATE_URL: str = os.getenv("WEAVIATE_URL", "http://localhost:8080")
 
-    # Application
-    DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
-    DEV_MODE: bool = os.getenv("DEV_MODE", "False").lower() == "true"
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
-    APP_NAME: str = "omnisearch"
-    APP_VERSION: str = "0.1.0"
+        # Application
+        self.DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+        self.DEV_MODE: bool = os.getenv("DEV_MODE", "False").lower() == "true"
+        self.LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+        self.MAX_IMAGE_UPLOAD_BYTES: int = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+        self.APP_NAME: str = "omnisearch"
+        self.APP_VERSION: str = "0.1.0"
 
 
 settings = Settings()
+
+
+def get_snapshot() -> Settings:
+    """Return settings read from the current environment, not the import-time values."""
+    return Settings()
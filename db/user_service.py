@@ -1,33 +1,132 @@
 """
 MongoDB service for managing user profiles.
 """
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, UpdateOne, WriteConcern
 from pymongo.collection import Collection
 from pymongo.database import Database
-from typing import List, Optional, Dict, Any
+from pymongo.errors import DuplicateKeyError
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime
 
+from models.user import MAX_PURCHASE_HISTORY, UserStats, normalize_preference_values
+from services.preference_analyzer import PreferenceAnalyzer
+
 load_dotenv()
 
+# Price range given to new profiles until purchases widen it
+DEFAULT_PRICE_RANGE = {"min": 0, "max": 1000}
+
+
+# Fields returned by profile reads; timestamps are bookkeeping nobody reads back.
+# purchase_categories and preferences are optional fields ContextRetriever uses.
+_PROFILE_PROJECTION = {
+    "user_id": 1,
+    "past_purchases": 1,
+    "preferred_colors": 1,
+    "preferred_categories": 1,
+    "price_range": 1,
+    "purchase_categories": 1,
+    "preferences": 1
+}
+
+# Preference views skip the purchase history, the only field that grows
+_PREFERENCES_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "preferred_colors": 1,
+    "preferred_categories": 1,
+    "price_range": 1
+}
+
+_PURCHASES_PROJECTION = {"_id": 0, "past_purchases": 1}
+
+# Primary-only, unjournaled acknowledgement for writes that may be lost on failover
+_FAST_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+
+def _push_purchase(product_title: str) -> Dict[str, Any]:
+    """$push operand appending a purchase and keeping only the most recent ones."""
+    return {
+        "past_purchases": {"$each": [product_title], "$slice": -MAX_PURCHASE_HISTORY}
+    }
+
+
+class _StatsCache:
+    """Bounded, thread-safe LRU of user stats whose entries expire after a TTL."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, UserStats]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id: str) -> Optional[UserStats]:
+        """Return the cached stats, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, stats = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return stats
+    
+    def set(self, user_id: str, stats: UserStats) -> None:
+        """Cache stats, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, stats)
+            self._entries.move_to_end(user_id)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def pop(self, user_id: str) -> None:
+        """Drop a user's cached stats, if any."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
 
 class UserProfileService:
     """MongoDB service for managing user profiles."""
     
-    def __init__(self, uri: Optional[str] = None, db_name: str = "omnisearch"):
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        db_name: str = "omnisearch",
+        cache_size: int = 10_000,
+        cache_ttl: float = 60.0
+    ):
         """
         Initialize UserProfileService.
         
         Args:
             uri: MongoDB connection URI. If None, uses MONGO_URI from environment.
             db_name: Name of the database to use.
+            cache_size: Maximum users kept in the stats cache (0 disables it).
+            cache_ttl: Seconds cached stats stay valid.
         """
         self.uri = uri or os.getenv("MONGO_URI", "mongodb://localhost:27017")
         self.db_name = db_name
         self.client: Optional[MongoClient] = None
         self.db: Optional[Database] = None
         self.users: Optional[Collection] = None
+        
+        # Only derived stats are cached; profile reads always hit MongoDB
+        self._stats_cache = _StatsCache(maxsize=cache_size, ttl=cache_ttl)
+        self._analyzer = PreferenceAnalyzer()
     
     def connect(self) -> None:
         """Establish connection to MongoDB."""
@@ -36,8 +135,9 @@ class UserProfileService:
             self.db = self.client[self.db_name]
             self.users = self.db["users"]
             
-            # Create indexes for efficient querying
-            self.users.create_index([("user_id", ASCENDING)], unique=True)
+            # Create indexes for efficient querying; the unique user_id index
+            # also lets writes rely on upserts/inserts instead of existence checks
+            self.users.create_index([("user_id", ASCENDING)], unique=True, background=True)
             self.users.create_index([("created_at", ASCENDING)])
             
             # Test connection
@@ -83,23 +183,22 @@ class UserProfileService:
             raise RuntimeError("Not connected to MongoDB. Call connect() first.")
         
         try:
-            # Check if user already exists
-            existing = self.users.find_one({"user_id": user_id})
-            if existing:
-                raise ValueError(f"User profile with user_id '{user_id}' already exists")
-            
             now = datetime.utcnow()
             user_profile = {
                 "user_id": user_id,
-                "past_purchases": past_purchases or [],
-                "preferred_colors": preferred_colors or [],
-                "preferred_categories": preferred_categories or [],
-                "price_range": price_range or {"min": 0, "max": 1000},
+                "past_purchases": (past_purchases or [])[-MAX_PURCHASE_HISTORY:],
+                "preferred_colors": normalize_preference_values(preferred_colors or []),
+                "preferred_categories": normalize_preference_values(preferred_categories or []),
+                "price_range": price_range or dict(DEFAULT_PRICE_RANGE),
                 "created_at": now,
                 "updated_at": now
             }
             
-            result = self.users.insert_one(user_profile)
+            try:
+                result = self.users.insert_one(user_profile)
+            except DuplicateKeyError:
+                # The unique user_id index rejects existing users
+                raise ValueError(f"User profile with user_id '{user_id}' already exists") from None
             user_profile["_id"] = str(result.inserted_id)
             
             print(f"✓ Created user profile: {user_id}")
@@ -115,6 +214,8 @@ class UserProfileService:
         """
         Retrieve a user profile by user_id.
         
+        Only the fields in _PROFILE_PROJECTION are read; timestamps are omitted.
+        
         Args:
             user_id: Unique user identifier.
             
@@ -128,10 +229,7 @@ class UserProfileService:
             raise RuntimeError("Not connected to MongoDB. Call connect() first.")
         
         try:
-            user = self.users.find_one({"user_id": user_id})
-            
-            if user and "_id" in user:
-                user["_id"] = str(user["_id"])
+            user = self._find_profile(user_id, _PROFILE_PROJECTION)
             
             if user:
                 print(f"✓ Retrieved user profile: {user_id}")
@@ -144,6 +242,74 @@ class UserProfileService:
             print(f"✗ Failed to retrieve user profile: {e}")
             raise
     
+    def get_user_preferences(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve only a user's preference fields, without the purchase history.
+        
+        Args:
+            user_id: Unique user identifier.
+            
+        Returns:
+            Dictionary with user_id, preferred_colors, preferred_categories and
+            price_range, or None if not found.
+            
+        Raises:
+            RuntimeError: If not connected to MongoDB.
+        """
+        if not self.users:
+            raise RuntimeError("Not connected to MongoDB. Call connect() first.")
+        
+        try:
+            return self._find_profile(user_id, _PREFERENCES_PROJECTION)
+        except Exception as e:
+            print(f"✗ Failed to retrieve user preferences: {e}")
+            raise
+    
+    def _find_profile(self, user_id: str, projection: Dict[str, int]) -> Optional[Dict[str, Any]]:
+        """Read the projected fields of a user's profile, stringifying _id."""
+        user = self.users.find_one({"user_id": user_id}, projection)
+        if user and "_id" in user:
+            user["_id"] = str(user["_id"])
+        return user
+    
+    def get_user_stats(self, user_id: str) -> Optional[UserStats]:
+        """
+        Get aggregates derived from a user's purchase history.
+        
+        Stats are cached for cache_ttl seconds and dropped whenever a purchase
+        is recorded; editable profile fields are never served from the cache.
+        
+        Args:
+            user_id: Unique user identifier.
+            
+        Returns:
+            UserStats for the user, or None if the profile does not exist.
+            
+        Raises:
+            RuntimeError: If not connected to MongoDB.
+        """
+        cached = self._stats_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        if not self.users:
+            raise RuntimeError("Not connected to MongoDB. Call connect() first.")
+        
+        profile = self._find_profile(user_id, _PURCHASES_PROJECTION)
+        if profile is None:
+            return None
+        
+        analysis = self._analyzer.analyze_preferences(profile.get("past_purchases", []))
+        stats = UserStats(
+            user_id=user_id,
+            purchase_count=analysis["purchase_count"],
+            dominant_colors=analysis["dominant_colors"],
+            style_keywords=analysis["style_keywords"],
+            product_types=analysis["product_types"]
+        )
+        self._stats_cache.set(user_id, stats)
+        return stats
+    
     def update_preferences(
         self,
         user_id: str,
@@ -171,18 +337,23 @@ class UserProfileService:
         
         try:
             # Build update dict with only provided fields
-            update_fields = {"updated_at": datetime.utcnow()}
+            update_fields: Dict[str, Any] = {}
             
             if preferred_colors is not None:
-                update_fields["preferred_colors"] = preferred_colors
+                update_fields["preferred_colors"] = normalize_preference_values(preferred_colors)
             if preferred_categories is not None:
-                update_fields["preferred_categories"] = preferred_categories
+                update_fields["preferred_categories"] = normalize_preference_values(preferred_categories)
             if price_range is not None:
                 update_fields["price_range"] = price_range
             
+            # MongoDB stamps updated_at itself
+            update_ops: Dict[str, Any] = {"$currentDate": {"updated_at": True}}
+            if update_fields:
+                update_ops["$set"] = update_fields
+            
             result = self.users.find_one_and_update(
                 {"user_id": user_id},
-                {"$set": update_fields},
+                update_ops,
                 return_document=True
             )
             
@@ -203,6 +374,8 @@ class UserProfileService:
         """
         Add a product title to user's past purchases.
         
+        Only the most recent MAX_PURCHASE_HISTORY purchases are kept.
+        
         Args:
             user_id: Unique user identifier.
             product_title: Title of purchased product.
@@ -220,11 +393,12 @@ class UserProfileService:
             result = self.users.find_one_and_update(
                 {"user_id": user_id},
                 {
-                    "$addToSet": {"past_purchases": product_title},
-                    "$set": {"updated_at": datetime.utcnow()}
+                    "$push": _push_purchase(product_title),
+                    "$currentDate": {"updated_at": True}
                 },
                 return_document=True
             )
+            self._stats_cache.pop(user_id)
             
             if result:
                 if "_id" in result:
@@ -239,23 +413,108 @@ class UserProfileService:
             print(f"✗ Failed to add purchase: {e}")
             raise
     
+    def _users_for(self, durable: bool) -> Collection:
+        """Users collection with the default or the fast write concern."""
+        if durable:
+            return self.users
+        return self.users.with_options(write_concern=_FAST_WRITE_CONCERN)
+    
+    @staticmethod
+    def _memory_update(
+        product: Dict[str, Any],
+        auto_update_preferences: bool
+    ) -> Tuple[Dict[str, Any], Optional[float], Dict[str, Any]]:
+        """
+        Build the update that records one product in an existing profile.
+        
+        Returns the $addToSet preference fields and product price (needed
+        again for the first-write upsert) along with the full update document.
+        """
+        add_to_set: Dict[str, Any] = {}
+        product_price = None
+        
+        # Optionally update preferences based on the product
+        if auto_update_preferences:
+            # Stored values are lowercased, so $addToSet alone dedupes them
+            product_color = (product.get("color") or "").strip().lower()
+            if product_color:
+                add_to_set["preferred_colors"] = product_color
+            
+            product_category = (product.get("category") or "").strip().lower()
+            if product_category:
+                add_to_set["preferred_categories"] = product_category
+            
+            product_price = product.get("price")
+        
+        # Widen the price range in place rather than reading it first
+        update_ops: Dict[str, Any] = {
+            "$push": _push_purchase(product["title"]),
+            "$currentDate": {"updated_at": True}
+        }
+        if add_to_set:
+            update_ops["$addToSet"] = add_to_set
+        if product_price is not None:
+            update_ops["$min"] = {"price_range.min": product_price}
+            update_ops["$max"] = {"price_range.max": product_price}
+        
+        return add_to_set, product_price, update_ops
+    
+    @staticmethod
+    def _new_profile_update(
+        product_title: str,
+        add_to_set: Dict[str, Any],
+        product_price: Optional[float],
+        now: datetime
+    ) -> Dict[str, Any]:
+        """
+        Build the upsert that creates a profile on a user's first memory update.
+        
+        Defaults go in $setOnInsert, skipping fields the $addToSet already
+        writes, since MongoDB rejects two operators on the same path.
+        """
+        price_range = dict(DEFAULT_PRICE_RANGE)
+        if product_price is not None:
+            price_range = {
+                "min": min(price_range["min"], product_price),
+                "max": max(price_range["max"], product_price)
+            }
+        
+        on_insert: Dict[str, Any] = {"price_range": price_range, "created_at": now}
+        for field in ("preferred_colors", "preferred_categories"):
+            if field not in add_to_set:
+                on_insert[field] = []
+        
+        update_ops: Dict[str, Any] = {
+            "$setOnInsert": on_insert,
+            "$push": _push_purchase(product_title),
+            "$currentDate": {"updated_at": True}
+        }
+        if add_to_set:
+            update_ops["$addToSet"] = add_to_set
+        return update_ops
+    
     def update_user_memory(
         self, 
         user_id: str, 
         product: Dict[str, Any],
-        auto_update_preferences: bool = True
+        auto_update_preferences: bool = True,
+        durable: bool = True
     ) -> Optional[Dict[str, Any]]:
         """
         Update user memory after a recommendation is clicked or purchased.
         Appends product to purchase history and optionally updates preferences.
         
+        Existing profiles are updated with a single atomic find_one_and_update;
+        a missing profile is created by an upsert on the first update.
+        
         Args:
             user_id: Unique user identifier.
             product: Product dictionary with fields: title, color, category, price, etc.
             auto_update_preferences: If True, automatically update user preferences based on the product.
+            durable: If False, use a w=1, unjournaled write concern for lower latency.
             
         Returns:
-            Updated user profile or None if user not found.
+            Updated user profile, or None if the update returned nothing.
             
         Raises:
             RuntimeError: If not connected to MongoDB.
@@ -279,58 +538,30 @@ class UserProfileService:
             raise ValueError("Product must have 'title' field")
         
         try:
-            # Get current user profile
-            user_profile = self.get_user_profile(user_id)
-            
-            if not user_profile:
-                print(f"⚠ User not found: {user_id}. Creating new profile.")
-                # Create new profile if user doesn't exist
-                user_profile = self.create_user_profile(user_id)
-            
-            # Build update operations
-            update_ops = {
-                "$addToSet": {"past_purchases": product_title},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+            users = self._users_for(durable)
+            add_to_set, product_price, update_ops = self._memory_update(
+                product, auto_update_preferences
+            )
             
-            # Optionally update preferences based on the product
-            if auto_update_preferences:
-                preference_updates = {}
-                
-                # Add color preference
-                product_color = product.get("color")
-                if product_color and product_color.strip():
-                    color_lower = product_color.lower()
-                    current_colors = user_profile.get("preferred_colors", [])
-                    if color_lower not in [c.lower() for c in current_colors]:
-                        update_ops["$addToSet"]["preferred_colors"] = color_lower
-                
-                # Add category preference
-                product_category = product.get("category")
-                if product_category and product_category.strip():
-                    category_lower = product_category.lower()
-                    current_categories = user_profile.get("preferred_categories", [])
-                    if category_lower not in [c.lower() for c in current_categories]:
-                        update_ops["$addToSet"]["preferred_categories"] = category_lower
-                
-                # Update price range if product is outside current range
-                product_price = product.get("price")
-                if product_price is not None:
-                    current_price_range = user_profile.get("price_range", {"min": 0, "max": 1000})
-                    new_min = min(current_price_range.get("min", 0), product_price)
-                    new_max = max(current_price_range.get("max", 1000), product_price)
-                    
-                    # Only update if changed
-                    if new_min != current_price_range.get("min") or new_max != current_price_range.get("max"):
-                        update_ops["$set"]["price_range"] = {"min": new_min, "max": new_max}
-            
-            # Perform the update
-            result = self.users.find_one_and_update(
+            # Existing users: one atomic update
+            result = users.find_one_and_update(
                 {"user_id": user_id},
                 update_ops,
                 return_document=True
             )
             
+            if result is None:
+                # First write for this user: upsert a default profile holding the product
+                print(f"⚠ User not found: {user_id}. Creating new profile.")
+                now = datetime.utcnow()
+                result = users.find_one_and_update(
+                    {"user_id": user_id},
+                    self._new_profile_update(product_title, add_to_set, product_price, now),
+                    upsert=True,
+                    return_document=True
+                )
+            self._stats_cache.pop(user_id)
+            
             if result:
                 if "_id" in result:
                     result["_id"] = str(result["_id"])
@@ -349,6 +580,122 @@ class UserProfileService:
             print(f"✗ Failed to update user memory: {e}")
             raise
     
+    def update_user_memory_bulk(
+        self,
+        user_id: str,
+        products: List[Dict[str, Any]],
+        auto_update_preferences: bool = True,
+        durable: bool = True
+    ) -> int:
+        """
+        Record many products for one user, e.g. when importing order history.
+        
+        Sends one UpdateOne per product in a single unordered bulk_write
+        instead of a round-trip per update_user_memory call. The updates
+        commute, so their order does not matter.
+        
+        Args:
+            user_id: Unique user identifier.
+            products: Product dictionaries, each with at least a title.
+            auto_update_preferences: If True, update preferences from each product.
+            durable: If False, use a w=1, unjournaled write concern for lower latency.
+            
+        Returns:
+            Number of products recorded.
+            
+        Raises:
+            RuntimeError: If not connected to MongoDB.
+            ValueError: If any product is missing its title.
+        """
+        if not self.users:
+            raise RuntimeError("Not connected to MongoDB. Call connect() first.")
+        
+        if not all(product.get("title") for product in products):
+            raise ValueError("Product must have 'title' field")
+        
+        if not products:
+            return 0
+        
+        try:
+            ops = [
+                UpdateOne(
+                    {"user_id": user_id},
+                    self._memory_update(product, auto_update_preferences)[2]
+                )
+                for product in products
+            ]
+            
+            users = self._users_for(durable)
+            result = users.bulk_write(ops, ordered=False)
+            
+            if result.matched_count == 0:
+                # No profile yet: the first product creates it, the rest follow
+                self.update_user_memory(
+                    user_id, products[0], auto_update_preferences, durable=durable
+                )
+                if len(ops) > 1:
+                    users.bulk_write(ops[1:], ordered=False)
+            
+            self._stats_cache.pop(user_id)
+            print(f"✓ Updated user memory for: {user_id} ({len(products)} products)")
+            return len(products)
+            
+        except Exception as e:
+            print(f"✗ Failed to bulk update user memory: {e}")
+            raise
+    
+    def normalize_stored_preferences(self, batch_size: int = 500) -> int:
+        """
+        One-off migration lowercasing preferences stored before writes normalized them.
+        
+        Memory updates rely on $addToSet of lowercased values, so a stored
+        "Blue" would otherwise sit next to a newly added "blue". Each rewrite
+        only applies if the arrays are unchanged since they were read; rerun
+        until it returns 0 if profiles were updated concurrently.
+        
+        Args:
+            batch_size: Updates sent per bulk_write.
+            
+        Returns:
+            Number of profiles rewritten.
+            
+        Raises:
+            RuntimeError: If not connected to MongoDB.
+        """
+        if not self.users:
+            raise RuntimeError("Not connected to MongoDB. Call connect() first.")
+        
+        fields = ("preferred_colors", "preferred_categories")
+        # Values with uppercase letters or surrounding whitespace
+        unnormalized = {"$regex": r"[A-Z]|^\s|\s$"}
+        query = {"$or": [{field: unnormalized} for field in fields]}
+        
+        try:
+            modified = 0
+            ops: List[UpdateOne] = []
+            for doc in self.users.find(query, {field: 1 for field in fields}):
+                stored = {field: doc.get(field) for field in fields}
+                ops.append(UpdateOne(
+                    {"_id": doc["_id"], **stored},
+                    {"$set": {
+                        field: normalize_preference_values(values or [])
+                        for field, values in stored.items()
+                    }}
+                ))
+                if len(ops) >= batch_size:
+                    modified += self.users.bulk_write(ops, ordered=False).modified_count
+                    ops = []
+            if ops:
+                modified += self.users.bulk_write(ops, ordered=False).modified_count
+            
+            self._stats_cache.clear()
+            print(f"✓ Normalized preferences for {modified} user profiles")
+            return modified
+            
+        except Exception as e:
+            print(f"✗ Failed to normalize user preferences: {e}")
+            raise
+    
     def get_all_users(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Fetch all user profiles from the database.
@@ -402,6 +749,7 @@ class UserProfileService:
             raise RuntimeError("Not connected to MongoDB. Call connect() first.")
         
         try:
+            self._stats_cache.pop(user_id)
             result = self.users.delete_one({"user_id": user_id})
             
             if result.deleted_count > 0:
@@ -2,6 +2,7 @@
 FastAPI application for OmniSearch - Multimodal Product Search API.
 """
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from api import search_router, agent_router
 from api.ab_endpoints import router as ab_router
@@ -15,7 +16,8 @@ app = FastAPI(
     description="A Multimodal Retrieval and Ranking System for Cross-Modal E-Commerce Product Discovery using CLIP embeddings, vector databases, and advanced ranking algorithms",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Add A/B testing middleware (before CORS to capture all requests)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Any, Iterable, List, Optional, Dict
 
 
 class TextSearchRequest(BaseModel):
@@ -50,6 +50,24 @@ class ProductResult(BaseModel):
         }
 
 
+# Validates a whole result list in one call, reading fields by attribute
+_PRODUCT_RESULT_LIST = TypeAdapter(List[ProductResult])
+
+
+def to_product_results(results: Iterable[Any]) -> List[ProductResult]:
+    """
+    Convert search service results to ProductResult models.
+    
+    Args:
+        results: Objects exposing the ProductResult fields as attributes
+            (e.g. SearchResult)
+        
+    Returns:
+        List of ProductResult, in the same order
+    """
+    return _PRODUCT_RESULT_LIST.validate_python(list(results), from_attributes=True)
+
+
 class SearchResponse(BaseModel):
     """Response model for search results."""
     
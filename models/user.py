@@ -1,13 +1,30 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List, Dict
 from datetime import datetime
+import sys
+
+
+# Purchase history is capped to this many most recent titles
+MAX_PURCHASE_HISTORY = 200
+
+
+def normalize_preference_values(values: List[str]) -> List[str]:
+    """
+    Strip, lowercase and dedupe preference values, keeping first-seen order.
+    
+    Colors and categories come from a small vocabulary, so values are
+    interned and every profile shares one string object per value.
+    """
+    return list(dict.fromkeys(
+        sys.intern(value) for value in (raw.strip().lower() for raw in values) if value
+    ))
 
 
 class UserProfile(BaseModel):
     """User profile schema for MongoDB storage."""
     
     user_id: str = Field(..., description="Unique user identifier")
-    past_purchases: List[str] = Field(default_factory=list, description="List of purchased product titles")
+    past_purchases: List[str] = Field(default_factory=list, description="Purchased product titles, oldest first")
     preferred_colors: List[str] = Field(default_factory=list, description="Preferred product colors")
     preferred_categories: List[str] = Field(default_factory=list, description="Preferred product categories")
     price_range: dict = Field(
@@ -17,6 +34,17 @@ class UserProfile(BaseModel):
     created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
     
+    # Stored lowercased so $addToSet alone gives case-insensitive set semantics
+    @field_validator("preferred_colors", "preferred_categories")
+    @classmethod
+    def _normalize_preferences(cls, values: List[str]) -> List[str]:
+        return normalize_preference_values(values)
+    
+    @property
+    def recent_purchases(self) -> List[str]:
+        """The retained purchase history (at most MAX_PURCHASE_HISTORY titles), newest first."""
+        return self.past_purchases[:-MAX_PURCHASE_HISTORY - 1:-1]
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -38,6 +66,29 @@ class UserProfileInDB(UserProfile):
         populate_by_name = True
 
 
+class UserStats(BaseModel):
+    """Aggregates derived from a user's purchase history, safe to cache."""
+    
+    user_id: str = Field(..., description="Unique user identifier")
+    purchase_count: int = Field(default=0, description="Number of past purchases")
+    dominant_colors: Dict[str, int] = Field(default_factory=dict, description="Top colors by frequency")
+    style_keywords: Dict[str, int] = Field(default_factory=dict, description="Top style keywords by frequency")
+    product_types: Dict[str, int] = Field(default_factory=dict, description="Top product types by frequency")
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    class Config:
+        frozen = True
+        json_schema_extra = {
+            "example": {
+                "user_id": "USER-001",
+                "purchase_count": 3,
+                "dominant_colors": {"blue": 2, "black": 1},
+                "style_keywords": {"casual": 2},
+                "product_types": {"shoes": 1, "shirt": 1}
+            }
+        }
+
+
 class UserPreferences(BaseModel):
     """Schema for updating user preferences."""
     
@@ -45,6 +96,11 @@ class UserPreferences(BaseModel):
     preferred_categories: Optional[List[str]] = None
     price_range: Optional[dict] = None
     
+    @field_validator("preferred_colors", "preferred_categories")
+    @classmethod
+    def _normalize_preferences(cls, values: Optional[List[str]]) -> Optional[List[str]]:
+        return None if values is None else normalize_preference_values(values)
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -1,32 +1,49 @@
-from .clip_service import CLIPEmbeddingService, get_clip_service
-from .search_service import ProductSearchService, SearchResult, get_search_service
-from .ranking import (
-    text_similarity,
-    exact_match_boost,
-    compute_final_score,
-    rerank_results,
-    cosine_similarity_embeddings,
-)
-from .preference_analyzer import PreferenceAnalyzer
-from .context_retrieval import ContextRetriever, retrieve_context
-from .personal_shopper_agent import PersonalShopperAgent
-from .llm_client import LLMClient, get_llm_client
+from importlib import import_module
+from typing import TYPE_CHECKING
 
-__all__ = [
-    "CLIPEmbeddingService", 
-    "get_clip_service",
-    "ProductSearchService",
-    "SearchResult",
-    "get_search_service",
-    "text_similarity",
-    "exact_match_boost",
-    "compute_final_score",
-    "rerank_results",
-    "cosine_similarity_embeddings",
-    "PreferenceAnalyzer",
-    "ContextRetriever",
-    "retrieve_context",
-    "PersonalShopperAgent",
-    "LLMClient",
-    "get_llm_client",
-]
+if TYPE_CHECKING:
+    from .clip_service import CLIPEmbeddingService, get_clip_service
+    from .search_service import ProductSearchService, SearchResult, get_search_service
+    from .ranking import (
+        text_similarity,
+        exact_match_boost,
+        compute_final_score,
+        rerank_results,
+        cosine_similarity_embeddings,
+    )
+    from .preference_analyzer import PreferenceAnalyzer
+    from .context_retrieval import ContextRetriever, get_context_retriever, retrieve_context
+    from .personal_shopper_agent import PersonalShopperAgent
+    from .llm_client import LLMClient, get_llm_client
+
+# Exports are resolved on first access so that lightweight submodules
+# (e.g. services.ab_testing) don't pull in torch/CLIP/Weaviate on import.
+_EXPORTS = {
+    "CLIPEmbeddingService": ".clip_service",
+    "get_clip_service": ".clip_service",
+    "ProductSearchService": ".search_service",
+    "SearchResult": ".search_service",
+    "get_search_service": ".search_service",
+    "text_similarity": ".ranking",
+    "exact_match_boost": ".ranking",
+    "compute_final_score": ".ranking",
+    "rerank_results": ".ranking",
+    "cosine_similarity_embeddings": ".ranking",
+    "PreferenceAnalyzer": ".preference_analyzer",
+    "ContextRetriever": ".context_retrieval",
+    "retrieve_context": ".context_retrieval",
+    "get_context_retriever": ".context_retrieval",
+    "PersonalShopperAgent": ".personal_shopper_agent",
+    "LLMClient": ".llm_client",
+    "get_llm_client": ".llm_client",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -7,10 +7,14 @@ Supports in-memory and Redis-based storage.
 
 from typing import Dict, Optional, Any, List
 from dataclasses import dataclass, asdict, field
+from collections import defaultdict, deque
+from contextvars import ContextVar, Token
 from datetime import datetime
+from itertools import islice
 import random
 import json
 import logging
+import sys
 from enum import Enum
 import os
 
@@ -23,7 +27,15 @@ class ExperimentVariant(str, Enum):
     SEARCH_V2 = "search_v2"
 
 
-@dataclass
+# Interned event type tags so filter comparisons hit the identity fast path
+EVENT_SEARCH = sys.intern("search")
+EVENT_CLICK = sys.intern("click")
+
+# Precomputed variant -> wire value table used by the to_dict() serializers
+_VARIANT_STR: Dict[ExperimentVariant, str] = {v: v.value for v in ExperimentVariant}
+
+
+@dataclass(slots=True)
 class ExperimentAssignment:
     """User's experiment assignment."""
     user_id: str
@@ -35,13 +47,13 @@ class ExperimentAssignment:
         """Convert to dictionary."""
         return {
             "user_id": self.user_id,
-            "variant": self.variant.value,
+            "variant": _VARIANT_STR[self.variant],
             "assigned_at": self.assigned_at.isoformat(),
             "metadata": self.metadata
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class ExperimentEvent:
     """Base event for experiment tracking."""
     user_id: str
@@ -55,7 +67,7 @@ class ExperimentEvent:
         """Convert to dictionary."""
         return {
             "user_id": self.user_id,
-            "variant": self.variant.value,
+            "variant": _VARIANT_STR[self.variant],
             "timestamp": self.timestamp.isoformat(),
             "query": self.query,
             "session_id": self.session_id,
@@ -63,16 +75,16 @@ class ExperimentEvent:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class SearchEvent(ExperimentEvent):
     """Search query event."""
     results_count: int = 0
     search_time_ms: float = 0.0
-    event_type: str = "search"
+    event_type: str = EVENT_SEARCH
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary."""
-        d = super().to_dict()
+        d = ExperimentEvent.to_dict(self)
         d.update({
             "results_count": self.results_count,
             "search_time_ms": self.search_time_ms,
@@ -81,17 +93,17 @@ class SearchEvent(ExperimentEvent):
         return d
 
 
-@dataclass
+@dataclass(slots=True)
 class ClickEvent(ExperimentEvent):
     """Click/interaction event."""
     product_id: str = ""
     product_title: str = ""
     position: int = -1
-    event_type: str = "click"
+    event_type: str = EVENT_CLICK
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary."""
-        d = super().to_dict()
+        d = ExperimentEvent.to_dict(self)
         d.update({
             "product_id": self.product_id,
             "product_title": self.product_title,
@@ -122,7 +134,16 @@ class ExperimentManager:
         
         # In-memory storage
         self._assignments: Dict[str, ExperimentAssignment] = {}
-        self._events: List[ExperimentEvent] = []
+        
+        # Most recent events, bounded to cap memory on long-running processes
+        self.event_retention = int(os.getenv("AB_EVENT_RETENTION", "100000"))
+        self._events: deque = deque()
+        
+        # Secondary indexes: the retained events per key, oldest first.
+        # Evictions remove from them too, so every read sees the same window.
+        self._events_by_user: Dict[str, deque] = defaultdict(deque)
+        self._events_by_type: Dict[Optional[str], deque] = defaultdict(deque)
+        self._events_by_variant: Dict[ExperimentVariant, deque] = defaultdict(deque)
         
         # Redis client (lazy initialized)
         self._redis = None
@@ -188,6 +209,45 @@ class ExperimentManager:
         logger.info(f"Assigned user {user_id} to {variant.value}")
         return assignment
     
+    def assign_variants_bulk(self, user_ids: List[str]) -> Dict[str, ExperimentAssignment]:
+        """
+        Assign many users to variants in one pass (e.g. backfills, simulations).
+        
+        Existing assignments are kept. New users are bucketed with the same
+        split_ratio rule as assign_variant, without per-user logging.
+        
+        Args:
+            user_ids: User identifiers to assign
+        
+        Returns:
+            Dict mapping each user_id to its ExperimentAssignment
+        """
+        if self.storage_backend != "memory":
+            return {user_id: self.assign_variant(user_id) for user_id in user_ids}
+        
+        assignments = self._assignments
+        first, second = self.variants[0], self.variants[1]
+        threshold = self.split_ratio
+        draw = random.random
+        now = datetime.utcnow()
+        
+        result = {}
+        new_count = 0
+        for user_id in user_ids:
+            assignment = assignments.get(user_id)
+            if assignment is None:
+                assignment = ExperimentAssignment(
+                    user_id=user_id,
+                    variant=first if draw() < threshold else second,
+                    assigned_at=now
+                )
+                assignments[user_id] = assignment
+                new_count += 1
+            result[user_id] = assignment
+        
+        logger.info(f"Bulk-assigned {new_count} new users ({len(result)} requested)")
+        return result
+    
     def get_assignment(self, user_id: str) -> Optional[ExperimentAssignment]:
         """
         Get existing assignment for a user.
@@ -232,8 +292,13 @@ class ExperimentManager:
         Args:
             event: ExperimentEvent instance
         """
-        # In-memory log
+        # In-memory log, dropping the oldest events past the retention limit
+        while self._events and len(self._events) >= self.event_retention:
+            self._evict_oldest_event()
         self._events.append(event)
+        self._events_by_user[event.user_id].append(event)
+        self._events_by_type[getattr(event, 'event_type', None)].append(event)
+        self._events_by_variant[event.variant].append(event)
         
         # File log (JSONL)
         try:
@@ -248,6 +313,20 @@ class ExperimentManager:
             self._redis.lpush(key, json.dumps(event.to_dict()))
             self._redis.expire(key, 86400 * 30)  # 30 days
     
+    def _evict_oldest_event(self):
+        """Drop the oldest in-memory event from the log and every index."""
+        oldest = self._events.popleft()
+        # Indexes are filled in log order, so it is also the oldest in each
+        for index, key in (
+            (self._events_by_user, oldest.user_id),
+            (self._events_by_type, getattr(oldest, 'event_type', None)),
+            (self._events_by_variant, oldest.variant),
+        ):
+            bucket = index[key]
+            bucket.popleft()
+            if not bucket:
+                del index[key]
+    
     def log_search(self, 
                   user_id: str,
                   query: str,
@@ -325,6 +404,8 @@ class ExperimentManager:
         """
         Get events from in-memory storage.
         
+        Only the most recent event_retention events are kept, for every filter.
+        
         Args:
             user_id: Filter by user (optional)
             variant: Filter by variant (optional)
@@ -334,16 +415,44 @@ class ExperimentManager:
         Returns:
             List of matching events
         """
-        events = self._events
+        if not (user_id or variant or event_type):
+            # Last N events
+            events = list(islice(reversed(self._events), limit))
+            events.reverse()
+            return events
         
-        if user_id:
-            events = [e for e in events if e.user_id == user_id]
-        if variant:
-            events = [e for e in events if e.variant == variant]
         if event_type:
-            events = [e for e in events if getattr(e, 'event_type', None) == event_type]
+            # Filters arrive as runtime strings (e.g. query params)
+            event_type = sys.intern(event_type)
+        
+        # Walk the most selective index
+        candidates = reversed(min(
+            (
+                index.get(key, ())
+                for index, key in (
+                    (self._events_by_user, user_id),
+                    (self._events_by_type, event_type),
+                    (self._events_by_variant, variant),
+                )
+                if key
+            ),
+            key=len
+        ))
+        
+        events = []
+        for event in candidates:  # newest first
+            if user_id and event.user_id != user_id:
+                continue
+            if variant and event.variant != variant:
+                continue
+            if event_type and getattr(event, 'event_type', None) != event_type:
+                continue
+            events.append(event)
+            if len(events) == limit:
+                break
         
-        return events[-limit:]  # Last N events
+        events.reverse()
+        return events
     
     def get_metrics(self) -> Dict[str, Any]:
         """
@@ -390,15 +499,30 @@ class ExperimentManager:
         """Clear all in-memory data (useful for testing)."""
         self._assignments.clear()
         self._events.clear()
+        self._events_by_user.clear()
+        self._events_by_type.clear()
+        self._events_by_variant.clear()
         logger.info("A/B testing data cleared")
 
 
-# Global instance
+# Global instance (per process), with an optional per-context override
 _experiment_manager: Optional[ExperimentManager] = None
+_experiment_manager_override: ContextVar[Optional[ExperimentManager]] = ContextVar(
+    "experiment_manager_override", default=None
+)
 
 
 def get_experiment_manager() -> ExperimentManager:
-    """Get or create the global experiment manager instance."""
+    """
+    Get the experiment manager for the current context.
+    
+    Returns the context-local override if one was set via
+    set_experiment_manager(), otherwise the process-wide instance.
+    """
+    override = _experiment_manager_override.get()
+    if override is not None:
+        return override
+    
     global _experiment_manager
     if _experiment_manager is None:
         storage_backend = os.getenv("AB_STORAGE", "memory")
@@ -410,7 +534,24 @@ def get_experiment_manager() -> ExperimentManager:
     return _experiment_manager
 
 
+def set_experiment_manager(manager: Optional[ExperimentManager]) -> Token:
+    """
+    Override the experiment manager for the current context only.
+    
+    Other threads and async tasks keep seeing their own manager, which lets
+    concurrent tests or workers run against isolated state.
+    
+    Args:
+        manager: Manager to use in this context (None clears the override)
+        
+    Returns:
+        Token that can be passed to ContextVar.reset() to restore the previous value
+    """
+    return _experiment_manager_override.set(manager)
+
+
 def reset_experiment_manager():
-    """Reset the global instance (useful for testing)."""
+    """Reset the global instance and any context override (useful for testing)."""
     global _experiment_manager
     _experiment_manager = None
+    _experiment_manager_override.set(None)
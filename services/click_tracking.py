@@ -8,22 +8,48 @@ Records:
 - Response times
 - Stores metrics in MongoDB for analysis
 """
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 from enum import Enum
+import atexit
+import logging
 import os
+import threading
+import time
+import weakref
 
 
 # MongoDB setup
 try:
-    from pymongo import MongoClient
+    from pymongo import MongoClient, InsertOne
     from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
     MONGODB_AVAILABLE = True
 except ImportError:
     MONGODB_AVAILABLE = False
 
 
+logger = logging.getLogger(__name__)
+
+
+# Variants compared by the analytics endpoints
+VARIANTS = ("search_v1", "search_v2")
+
+# Naive UTC epoch, matching the datetime.utcnow() cutoffs used by the queries
+_EPOCH = datetime(1970, 1, 1)
+
+# Covering indexes for the per-variant scans in get_variant_comparison
+CLICKS_VARIANT_INDEX = "variant_timestamp_rank"
+IMPRESSIONS_VARIANT_INDEX = "variant_timestamp_response_time"
+
+# MongoDB duplicate-key error code; such documents were already stored
+DUPLICATE_KEY_ERROR = 11000
+
+# Longest wait between write retries while MongoDB keeps failing
+MAX_RETRY_DELAY_S = 60.0
+
+
 class ClickSource(str, Enum):
     """Source of the click event."""
     SEARCH_RESULTS = "search_results"
@@ -32,7 +58,7 @@ class ClickSource(str, Enum):
     OTHER = "other"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ClickEvent:
     """Click event data."""
     user_id: str
@@ -43,16 +69,34 @@ class ClickEvent:
     response_time_ms: float
     session_id: Optional[str] = None
     source: str = ClickSource.SEARCH_RESULTS.value
-    timestamp: datetime = field(default_factory=datetime.utcnow)
+    timestamp_ns: int = field(default_factory=time.time_ns)
+    _doc: Dict[str, Any] = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Build the storage fields once; to_dict only copies them per write
+        object.__setattr__(self, '_doc', {
+            'user_id': self.user_id,
+            'product_id': self.product_id,
+            'rank': self.rank,
+            'search_query': self.search_query,
+            'variant': self.variant,
+            'response_time_ms': self.response_time_ms,
+            'session_id': self.session_id,
+            'source': self.source,
+        })
+    
+    @property
+    def timestamp(self) -> datetime:
+        """Event time as a naive UTC datetime."""
+        return _EPOCH + timedelta(microseconds=self.timestamp_ns // 1000)
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for storage."""
-        data = asdict(self)
-        data['timestamp'] = self.timestamp
-        return data
+        """Convert to a new dictionary for storage."""
+        # Fresh copy: the insert writes _id into it, and the event is frozen
+        return {**self._doc, 'timestamp': self.timestamp}
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SearchImpression:
     """Search impression (query executed)."""
     user_id: str
@@ -61,34 +105,92 @@ class SearchImpression:
     results_count: int
     response_time_ms: float
     session_id: Optional[str] = None
-    timestamp: datetime = field(default_factory=datetime.utcnow)
+    timestamp_ns: int = field(default_factory=time.time_ns)
+    _doc: Dict[str, Any] = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, '_doc', {
+            'user_id': self.user_id,
+            'query': self.query,
+            'variant': self.variant,
+            'results_count': self.results_count,
+            'response_time_ms': self.response_time_ms,
+            'session_id': self.session_id,
+        })
+    
+    @property
+    def timestamp(self) -> datetime:
+        """Event time as a naive UTC datetime."""
+        return _EPOCH + timedelta(microseconds=self.timestamp_ns // 1000)
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for storage."""
-        data = asdict(self)
-        data['timestamp'] = self.timestamp
-        return data
+        """Convert to a new dictionary for storage."""
+        # Fresh copy: the insert writes _id into it, and the event is frozen
+        return {**self._doc, 'timestamp': self.timestamp}
 
 
 class ClickTrackingService:
     """Service for tracking clicks and calculating metrics."""
     
-    def __init__(self, mongodb_uri: Optional[str] = None):
+    def __init__(self, mongodb_uri: Optional[str] = None, db=None):
         """
         Initialize click tracking service.
         
+        The MongoDB connection is opened lazily, the first time db is read.
+        
         Args:
             mongodb_uri: MongoDB connection URI
                         (defaults to MONGODB_URI env var or localhost)
+            db: Already-connected database to use instead of connecting
         """
         self.mongodb_uri = mongodb_uri or os.getenv(
             'MONGODB_URI',
             'mongodb://localhost:27017'
         )
-        self.db = None
+        self._db = None
+        self._connected = False
+        # Set once the covering indexes exist, so queries may hint them
+        self._covering_indexes = False
         self.clicks_collection = None
         self.impressions_collection = None
-        self._initialize_mongodb()
+        
+        # Write buffers, flushed with one bulk_write per collection
+        self.flush_size = int(os.getenv("CLICK_FLUSH_SIZE", "500"))
+        self.flush_interval_s = float(os.getenv("CLICK_FLUSH_INTERVAL_S", "1.0"))
+        self._click_buf: List[Dict[str, Any]] = []
+        self._imp_buf: List[Dict[str, Any]] = []
+        self._buf_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_timer: Optional[threading.Timer] = None
+        
+        # Bound on each buffer while writes fail; the oldest events are dropped
+        self.max_buffered = int(os.getenv("CLICK_MAX_BUFFERED", "10000"))
+        self.dropped_events = 0
+        
+        # After a failed flush, writes only trigger another one once this passes
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+        
+        if db is not None:
+            self.db = db
+            self.clicks_collection = db['clicks']
+            self.impressions_collection = db['impressions']
+        
+        # Buffered events are flushed at exit without keeping the tracker alive
+        _live_trackers.add(self)
+    
+    @property
+    def db(self):
+        """MongoDB database, connected on first access (None if unavailable)."""
+        if not self._connected:
+            self._connected = True
+            self._initialize_mongodb()
+        return self._db
+    
+    @db.setter
+    def db(self, value):
+        self._db = value
+        self._connected = True
     
     def _initialize_mongodb(self):
         """Initialize MongoDB connection and collections."""
@@ -104,16 +206,16 @@ class ClickTrackingService:
             )
             # Verify connection
             client.admin.command('ping')
-            self.db = client['omnisearch']
-            self.clicks_collection = self.db['clicks']
-            self.impressions_collection = self.db['impressions']
+            self._db = client['omnisearch']
+            self.clicks_collection = self._db['clicks']
+            self.impressions_collection = self._db['impressions']
             
             # Create indexes for common queries
             self._create_indexes()
             
         except (ConnectionFailure, ServerSelectionTimeoutError):
             print(f"Warning: Could not connect to MongoDB at {self.mongodb_uri}")
-            self.db = None
+            self._db = None
     
     def _create_indexes(self):
         """Create indexes for efficient querying."""
@@ -133,46 +235,177 @@ class ClickTrackingService:
         self.impressions_collection.create_index('timestamp')
         self.impressions_collection.create_index([('user_id', 1), ('timestamp', -1)])
         self.impressions_collection.create_index([('variant', 1), ('timestamp', -1)])
+        
+        # Covering indexes: variant filter, time window, then the aggregated field
+        try:
+            self.clicks_collection.create_index(
+                [('variant', 1), ('timestamp', -1), ('rank', 1)],
+                name=CLICKS_VARIANT_INDEX
+            )
+            self.impressions_collection.create_index(
+                [('variant', 1), ('timestamp', -1), ('response_time_ms', 1)],
+                name=IMPRESSIONS_VARIANT_INDEX
+            )
+            self._covering_indexes = True
+        except Exception as e:
+            print(f"Warning: Could not create covering indexes: {str(e)}")
     
     def log_click(self, click_event: ClickEvent) -> bool:
         """
         Log a click event.
         
+        Events are buffered and written in bulk once the buffer reaches
+        flush_size or flush_interval_s has passed since the last flush, so
+        a True result does not mean the click is stored yet. Batches that
+        fail to write stay buffered, up to max_buffered events per buffer,
+        and are retried with exponential backoff.
+        
         Args:
             click_event: ClickEvent object with click data
             
         Returns:
-            True if logged successfully, False otherwise
+            True if buffered (or written by a flush it triggered),
+            False if the database is unavailable or that flush failed
         """
         if not self.db:
             return False
         
-        try:
-            result = self.clicks_collection.insert_one(click_event.to_dict())
-            return result.acknowledged
-        except Exception as e:
-            print(f"Error logging click: {str(e)}")
-            return False
+        return self._buffer(self._click_buf, click_event.to_dict())
     
     def log_impression(self, impression: SearchImpression) -> bool:
         """
         Log a search impression (query executed).
         
+        Buffered the same way as log_click, so a True result does not mean
+        the impression is stored yet.
+        
         Args:
             impression: SearchImpression object
             
         Returns:
-            True if logged successfully, False otherwise
+            True if buffered (or written by a flush it triggered),
+            False if the database is unavailable or that flush failed
         """
         if not self.db:
             return False
         
-        try:
-            result = self.impressions_collection.insert_one(impression.to_dict())
-            return result.acknowledged
-        except Exception as e:
-            print(f"Error logging impression: {str(e)}")
+        return self._buffer(self._imp_buf, impression.to_dict())
+    
+    def _buffer(self, buf: List[Dict[str, Any]], doc: Dict[str, Any]) -> bool:
+        """Append a document to a write buffer, flushing when it is due."""
+        with self._buf_lock:
+            buf.append(doc)
+            self._drop_oldest(buf)
+            now = time.monotonic()
+            due = now >= self._retry_at and (
+                len(buf) >= self.flush_size
+                or now - self._last_flush > self.flush_interval_s
+            )
+            if not due and self._flush_timer is None:
+                # Make sure a quiet buffer still drains, once any backoff ends
+                delay = max(self.flush_interval_s, self._retry_at - now)
+                self._flush_timer = threading.Timer(delay, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        
+        if due:
+            return self.flush()
+        return True
+    
+    def flush(self) -> bool:
+        """
+        Write all buffered clicks and impressions to MongoDB.
+        
+        Documents from a failed write are put back at the front of their
+        buffer, and writes wait out an exponential backoff before they
+        trigger another flush.
+        
+        Returns:
+            True if every pending batch was acknowledged, False otherwise
+        """
+        with self._buf_lock:
+            clicks = self._click_buf.copy()
+            impressions = self._imp_buf.copy()
+            self._click_buf.clear()
+            self._imp_buf.clear()
+            self._last_flush = time.monotonic()
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        
+        if not (clicks or impressions):
+            return True
+        
+        if not self.db:
+            self._requeue(self._click_buf, clicks)
+            self._requeue(self._imp_buf, impressions)
             return False
+        
+        ok = True
+        for collection, batch, buf in ((self.clicks_collection, clicks, self._click_buf),
+                                       (self.impressions_collection, impressions, self._imp_buf)):
+            if not batch:
+                continue
+            try:
+                result = collection.bulk_write(
+                    [InsertOne(doc) for doc in batch],
+                    ordered=False
+                )
+                if not result.acknowledged:
+                    self._requeue(buf, batch)
+                    ok = False
+            except Exception as e:
+                logger.exception("Error flushing %d events", len(batch))
+                self._requeue(buf, self._unwritten(batch, e))
+                ok = False
+        
+        with self._buf_lock:
+            if ok:
+                self._retry_delay = 0.0
+                self._retry_at = 0.0
+            else:
+                self._retry_delay = min(
+                    max(self._retry_delay * 2, self.flush_interval_s),
+                    MAX_RETRY_DELAY_S
+                )
+                self._retry_at = time.monotonic() + self._retry_delay
+        return ok
+    
+    def _requeue(self, buf: List[Dict[str, Any]], docs: List[Dict[str, Any]]):
+        """Put unwritten documents back at the front of a write buffer."""
+        if docs:
+            with self._buf_lock:
+                buf[:0] = docs
+                self._drop_oldest(buf)
+    
+    def _drop_oldest(self, buf: List[Dict[str, Any]]):
+        """Trim a write buffer to max_buffered events, oldest first (lock held)."""
+        excess = len(buf) - self.max_buffered
+        if excess > 0:
+            del buf[:excess]
+            self.dropped_events += excess
+            logger.warning(
+                "Click tracking buffer full; dropped %d oldest events (%d in total)",
+                excess, self.dropped_events
+            )
+    
+    @staticmethod
+    def _unwritten(batch: List[Dict[str, Any]], error: Exception) -> List[Dict[str, Any]]:
+        """
+        Documents of a failed bulk_write that should be retried.
+        
+        A BulkWriteError lists the failed documents by index, and the rest of
+        an unordered batch was written; duplicate-key failures were stored by
+        an earlier attempt. Any other error may have written nothing.
+        """
+        details = getattr(error, 'details', None)
+        if not isinstance(details, dict):
+            return batch
+        return [
+            batch[write_error['index']]
+            for write_error in details.get('writeErrors', [])
+            if write_error.get('code') != DUPLICATE_KEY_ERROR
+        ]
     
     def get_ctr(self,
                 user_id: Optional[str] = None,
@@ -192,6 +425,7 @@ class ClickTrackingService:
         if not self.db:
             return {"ctr": 0.0, "clicks": 0, "impressions": 0}
         
+        self.flush()
         cutoff_time = datetime.utcnow() - timedelta(days=days)
         
         # Build filters
@@ -259,6 +493,7 @@ class ClickTrackingService:
         if not self.db:
             return {"avg_rank": 0, "clicks_by_rank": {}}
         
+        self.flush()
         cutoff_time = datetime.utcnow() - timedelta(days=days)
         
         # Build filter
@@ -269,32 +504,29 @@ class ClickTrackingService:
             filter_dict['variant'] = variant
         
         try:
-            clicks = list(self.clicks_collection.find(filter_dict))
+            # Fetch only the rank column and sort it once for every statistic
+            ranks = sorted(
+                click['rank']
+                for click in self.clicks_collection.find(filter_dict, {'rank': 1, '_id': 0})
+            )
             
-            if not clicks:
+            if not ranks:
                 return {
                     "avg_rank": 0,
                     "clicks_by_rank": {},
                     "total_clicks": 0
                 }
             
-            # Calculate statistics
-            ranks = [click['rank'] for click in clicks]
-            avg_rank = sum(ranks) / len(ranks)
-            
-            # Count clicks by rank
-            clicks_by_rank = {}
-            for click in clicks:
-                rank = click['rank']
-                clicks_by_rank[rank] = clicks_by_rank.get(rank, 0) + 1
+            # Ranks are sorted, so the counts come out in rank order
+            clicks_by_rank = Counter(ranks)
             
             return {
-                "avg_rank": round(avg_rank, 2),
-                "median_rank": sorted(ranks)[len(ranks) // 2],
-                "min_rank": min(ranks),
-                "max_rank": max(ranks),
-                "clicks_by_rank": dict(sorted(clicks_by_rank.items())),
-                "total_clicks": len(clicks)
+                "avg_rank": round(sum(ranks) / len(ranks), 2),
+                "median_rank": ranks[len(ranks) // 2],
+                "min_rank": ranks[0],
+                "max_rank": ranks[-1],
+                "clicks_by_rank": dict(clicks_by_rank),
+                "total_clicks": len(ranks)
             }
             
         except Exception as e:
@@ -319,6 +551,7 @@ class ClickTrackingService:
         if not self.db:
             return {"avg_response_time_ms": 0, "count": 0}
         
+        self.flush()
         cutoff_time = datetime.utcnow() - timedelta(days=days)
         
         # Build filter
@@ -329,9 +562,13 @@ class ClickTrackingService:
             filter_dict['variant'] = variant
         
         try:
-            impressions = list(self.impressions_collection.find(filter_dict))
+            # Fetch only the response-time column, sorted for min/max/p95
+            times = sorted(
+                imp['response_time_ms']
+                for imp in self.impressions_collection.find(filter_dict, {'response_time_ms': 1, '_id': 0})
+            )
             
-            if not impressions:
+            if not times:
                 return {
                     "avg_response_time_ms": 0,
                     "min_response_time_ms": 0,
@@ -339,14 +576,11 @@ class ClickTrackingService:
                     "count": 0
                 }
             
-            times = [imp['response_time_ms'] for imp in impressions]
-            avg_time = sum(times) / len(times)
-            
             return {
-                "avg_response_time_ms": round(avg_time, 2),
-                "min_response_time_ms": round(min(times), 2),
-                "max_response_time_ms": round(max(times), 2),
-                "p95_response_time_ms": round(sorted(times)[int(len(times) * 0.95)], 2),
+                "avg_response_time_ms": round(sum(times) / len(times), 2),
+                "min_response_time_ms": round(times[0], 2),
+                "max_response_time_ms": round(times[-1], 2),
+                "p95_response_time_ms": round(times[int(len(times) * 0.95)], 2),
                 "count": len(times)
             }
             
@@ -371,6 +605,8 @@ class ClickTrackingService:
         if not self.db:
             return {"user_id": user_id, "error": "Database unavailable"}
         
+        self.flush()
+        
         try:
             clicks = list(self.clicks_collection.find(filter_dict))
             impressions = list(self.impressions_collection.find(filter_dict))
@@ -409,38 +645,33 @@ class ClickTrackingService:
         if not self.db:
             return {"error": "Database unavailable"}
         
+        self.flush()
+        
         try:
-            results = {}
+            # One pass per collection instead of four queries per variant
+            v_filter = {**filter_dict, 'variant': {'$in': list(VARIANTS)}}
+            # Hinting a missing index fails the query, so leave it to the planner
+            covering = self._covering_indexes
+            click_stats = self._sum_by_variant(
+                self.clicks_collection, v_filter, 'rank',
+                CLICKS_VARIANT_INDEX if covering else None
+            )
+            impression_stats = self._sum_by_variant(
+                self.impressions_collection, v_filter, 'response_time_ms',
+                IMPRESSIONS_VARIANT_INDEX if covering else None
+            )
             
-            for variant in ["search_v1", "search_v2"]:
-                v_filter = {**filter_dict, 'variant': variant}
-                
-                clicks = self.clicks_collection.count_documents(v_filter)
-                impressions = self.impressions_collection.count_documents(v_filter)
-                
-                # Get response times
-                imps = list(self.impressions_collection.find(
-                    {**filter_dict, 'variant': variant},
-                    {'response_time_ms': 1}
-                ))
-                
-                response_times = [imp.get('response_time_ms', 0) for imp in imps]
-                avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-                
-                # Get rank metrics
-                cls = list(self.clicks_collection.find(
-                    v_filter,
-                    {'rank': 1}
-                ))
-                ranks = [c.get('rank', 0) for c in cls]
-                avg_rank = sum(ranks) / len(ranks) if ranks else 0
+            results = {}
+            for variant in VARIANTS:
+                clicks, rank_sum = click_stats[variant]
+                impressions, time_sum = impression_stats[variant]
                 
                 results[variant] = {
                     "clicks": clicks,
                     "impressions": impressions,
                     "ctr": round(clicks / impressions, 4) if impressions else 0.0,
-                    "avg_rank_clicked": round(avg_rank, 2),
-                    "avg_response_time_ms": round(avg_response_time, 2)
+                    "avg_rank_clicked": round(rank_sum / clicks, 2) if clicks else 0,
+                    "avg_response_time_ms": round(time_sum / impressions, 2) if impressions else 0
                 }
             
             return {
@@ -453,8 +684,198 @@ class ClickTrackingService:
             print(f"Error comparing variants: {str(e)}")
             return {"error": str(e)}
     
+    def get_all_metrics(self,
+                        user_id: Optional[str] = None,
+                        variant: Optional[str] = None,
+                        days: int = 7) -> Dict[str, Any]:
+        """
+        Get CTR, rank, response-time and per-variant metrics in one round trip.
+        
+        Clicks and impressions are combined with $unionWith and reduced by a
+        single $facet stage, instead of one query per metric. Every facet
+        groups down to a bounded result (p95 uses $percentile, MongoDB 7.0+),
+        so no per-event values are collected into the output document.
+        
+        Args:
+            user_id: Filter by user (optional)
+            variant: Filter by variant (optional)
+            days: Look back period in days
+            
+        Returns:
+            Dict with "ctr", "rank", "response_time" and "variants" sections
+        """
+        if not self.db:
+            return {"error": "Database unavailable"}
+        
+        self.flush()
+        cutoff_time = datetime.utcnow() - timedelta(days=days)
+        
+        # Build filter
+        filter_dict = {'timestamp': {'$gte': cutoff_time}}
+        if user_id:
+            filter_dict['user_id'] = user_id
+        if variant:
+            filter_dict['variant'] = variant
+        
+        pipeline = [
+            {'$match': filter_dict},
+            {'$project': {'_id': 0, 'kind': {'$literal': 'click'}, 'variant': 1, 'rank': 1}},
+            {'$unionWith': {
+                'coll': self.impressions_collection.name,
+                'pipeline': [
+                    {'$match': filter_dict},
+                    {'$project': {'_id': 0, 'kind': {'$literal': 'impression'},
+                                  'variant': 1, 'response_time_ms': 1}}
+                ]
+            }},
+            {'$facet': {
+                'counts': [
+                    {'$group': {
+                        '_id': {'kind': '$kind', 'variant': '$variant'},
+                        'n': {'$sum': 1},
+                        'rank_sum': {'$sum': '$rank'},
+                        'time_sum': {'$sum': '$response_time_ms'}
+                    }}
+                ],
+                'ranks': [
+                    {'$match': {'kind': 'click', 'rank': {'$type': 'number'}}},
+                    {'$group': {'_id': '$rank', 'n': {'$sum': 1}}},
+                    {'$sort': {'_id': 1}}
+                ],
+                'times': [
+                    {'$match': {'kind': 'impression', 'response_time_ms': {'$type': 'number'}}},
+                    {'$group': {
+                        '_id': None,
+                        'count': {'$sum': 1},
+                        'avg': {'$avg': '$response_time_ms'},
+                        'min': {'$min': '$response_time_ms'},
+                        'max': {'$max': '$response_time_ms'},
+                        'p95': {'$percentile': {
+                            'input': '$response_time_ms',
+                            'p': [0.95],
+                            'method': 'approximate'
+                        }}
+                    }}
+                ]
+            }}
+        ]
+        
+        try:
+            facets = next(iter(self.clicks_collection.aggregate(pipeline)), {})
+            
+            # Per-variant totals
+            per_variant = {v: {"clicks": 0, "impressions": 0, "rank_sum": 0, "time_sum": 0} for v in VARIANTS}
+            for row in facets.get('counts', []):
+                entry = per_variant.get(row['_id'].get('variant'))
+                if entry is None:
+                    continue
+                if row['_id']['kind'] == 'click':
+                    entry["clicks"] = row['n']
+                    entry["rank_sum"] = row['rank_sum']
+                else:
+                    entry["impressions"] = row['n']
+                    entry["time_sum"] = row['time_sum']
+            
+            clicks = sum(e["clicks"] for e in per_variant.values())
+            impressions = sum(e["impressions"] for e in per_variant.values())
+            ctr = {
+                "ctr": round(clicks / impressions, 4) if impressions else 0.0,
+                "clicks": clicks,
+                "impressions": impressions,
+                "period_days": days
+            }
+            
+            variants = {}
+            for v, e in per_variant.items():
+                variants[v] = {
+                    "clicks": e["clicks"],
+                    "impressions": e["impressions"],
+                    "ctr": round(e["clicks"] / e["impressions"], 4) if e["impressions"] else 0.0,
+                    "avg_rank_clicked": round(e["rank_sum"] / e["clicks"], 2) if e["clicks"] else 0,
+                    "avg_response_time_ms": round(e["time_sum"] / e["impressions"], 2) if e["impressions"] else 0
+                }
+            
+            # Rank statistics from the sorted rank histogram
+            clicks_by_rank = {row['_id']: row['n'] for row in facets.get('ranks', [])}
+            rank = {"avg_rank": 0, "clicks_by_rank": {}, "total_clicks": 0}
+            total_clicks = sum(clicks_by_rank.values())
+            if total_clicks:
+                median_rank, seen = None, 0
+                for r, n in clicks_by_rank.items():
+                    seen += n
+                    if seen > total_clicks // 2:
+                        median_rank = r
+                        break
+                rank = {
+                    "avg_rank": round(sum(r * n for r, n in clicks_by_rank.items()) / total_clicks, 2),
+                    "median_rank": median_rank,
+                    "min_rank": next(iter(clicks_by_rank)),
+                    "max_rank": next(reversed(clicks_by_rank)),
+                    "clicks_by_rank": clicks_by_rank,
+                    "total_clicks": total_clicks
+                }
+            
+            # Response-time statistics, already reduced by the server
+            response_time = {
+                "avg_response_time_ms": 0,
+                "min_response_time_ms": 0,
+                "max_response_time_ms": 0,
+                "count": 0
+            }
+            times_rows = facets.get('times', [])
+            if times_rows:
+                times = times_rows[0]
+                response_time = {
+                    "avg_response_time_ms": round(times['avg'], 2),
+                    "min_response_time_ms": round(times['min'], 2),
+                    "max_response_time_ms": round(times['max'], 2),
+                    "p95_response_time_ms": round(times['p95'][0], 2),
+                    "count": times['count']
+                }
+            
+            return {
+                "ctr": ctr,
+                "rank": rank,
+                "response_time": response_time,
+                "variants": {
+                    "period_days": days,
+                    "variants": variants,
+                    "winner_by_ctr": max(variants.items(), key=lambda x: x[1]['ctr'])[0]
+                }
+            }
+            
+        except Exception as e:
+            print(f"Error calculating metrics: {str(e)}")
+            return {"error": str(e)}
+    
+    @staticmethod
+    def _sum_by_variant(collection,
+                        filter_dict: Dict[str, Any],
+                        value_field: str,
+                        index_name: Optional[str] = None) -> Dict[str, List[float]]:
+        """
+        Count documents and total one numeric field per variant in a single scan.
+        
+        With a covering index_name hint the scan reads only the index.
+        
+        Returns:
+            Dict mapping each variant to [document count, field total]
+        """
+        stats = {variant: [0, 0] for variant in VARIANTS}
+        projection = {'variant': 1, value_field: 1, '_id': 0}
+        for doc in collection.find(filter_dict, projection, hint=index_name):
+            entry = stats.get(doc.get('variant'))
+            if entry is not None:
+                entry[0] += 1
+                entry[1] += doc.get(value_field, 0)
+        return stats
+    
     def reset(self) -> bool:
         """Delete all tracked data (careful!)."""
+        with self._buf_lock:
+            self._click_buf.clear()
+            self._imp_buf.clear()
+        
         if not self.db:
             return False
         
@@ -470,6 +891,16 @@ class ClickTrackingService:
 # Global singleton
 _click_tracker = None
 
+# Trackers whose buffers still need flushing at interpreter exit
+_live_trackers: "weakref.WeakSet[ClickTrackingService]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_live_trackers():
+    """Flush every tracker that is still alive at interpreter exit."""
+    for tracker in list(_live_trackers):
+        tracker.flush()
+
 
 def get_click_tracker(mongodb_uri: Optional[str] = None) -> ClickTrackingService:
     """Get or create global click tracking service."""
@@ -480,6 +911,8 @@ def get_click_tracker(mongodb_uri: Optional[str] = None) -> ClickTrackingService
 
 
 def reset_click_tracker():
-    """Reset global click tracker (for testing)."""
+    """Reset global click tracker (for testing), flushing its buffered events."""
     global _click_tracker
+    if _click_tracker is not None:
+        _click_tracker.flush()
     _click_tracker = None
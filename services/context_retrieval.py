@@ -4,9 +4,96 @@ Retrieves user preferences and search results in structured format for LLM consu
 """
 from typing import List, Dict, Any, Optional
 import importlib.util
+from itertools import islice
 from pathlib import Path
 
 
+# Optional search result fields, in output order, with their line templates
+_RESULT_FIELDS = (
+    ("description", "Description: %s"),
+    ("category", "Category: %s"),
+    ("color", "Color: %s"),
+    ("price", "Price: $%s"),
+    ("score", "Relevance Score: %.2f"),
+    ("size", "Size: %s"),
+    ("brand", "Brand: %s"),
+)
+
+
+def format_preferences(
+    preferences_analysis: Dict[str, Any],
+    user_profile: Optional[Dict[str, Any]] = None,
+    style_profile: str = "Unknown"
+) -> str:
+    """
+    Format analyzed user preferences as the USER PREFERENCES summary lines.
+    
+    Args:
+        preferences_analysis: Output of PreferenceAnalyzer.analyze_preferences
+        user_profile: User profile dict, read for explicit preferences
+        style_profile: Inferred style profile ("Unknown" is omitted)
+    
+    Returns:
+        Newline-separated summary, or a placeholder line when empty
+    """
+    lines = []
+    
+    # Dominant colors
+    colors = preferences_analysis.get("dominant_colors", {})
+    if colors:
+        color_str = ", ".join(
+            f"{color} ({freq})"
+            for color, freq in islice(colors.items(), 5)
+        )
+        lines.append(f"- Preferred Colors: {color_str}")
+    
+    # Most frequent categories
+    categories = preferences_analysis.get("most_frequent_categories", {})
+    if categories:
+        cat_str = ", ".join(
+            f"{cat} ({freq})"
+            for cat, freq in islice(categories.items(), 5)
+        )
+        lines.append(f"- Favorite Categories: {cat_str}")
+    
+    # Style profile
+    if style_profile != "Unknown":
+        lines.append(f"- Style Profile: {style_profile}")
+    
+    # Popular style keywords
+    keywords = preferences_analysis.get("style_keywords", {})
+    if keywords:
+        keyword_str = ", ".join(
+            f"{kw}"
+            for kw in islice(keywords.keys(), 5)
+        )
+        lines.append(f"- Popular Styles: {keyword_str}")
+    
+    # Preferred product types
+    product_types = preferences_analysis.get("product_types", {})
+    if product_types:
+        type_str = ", ".join(
+            f"{ptype}"
+            for ptype in islice(product_types.keys(), 5)
+        )
+        lines.append(f"- Preferred Types: {type_str}")
+    
+    # Purchase history stats
+    purchase_count = preferences_analysis.get("purchase_count", 0)
+    if purchase_count > 0:
+        lines.append(f"- Total Purchases Analyzed: {purchase_count}")
+    
+    # User preferences from profile
+    prefs = (user_profile or {}).get("preferences")
+    if prefs:
+        if prefs.get("price_range"):
+            lines.append(f"- Price Range: {prefs['price_range']}")
+        if prefs.get("size_preference"):
+            lines.append(f"- Size Preference: {prefs['size_preference']}")
+    
+    return "\n".join(lines) if lines else "- No preference data available"
+
+
 class ContextRetriever:
     """Retrieves and formats user context and search results for LLM input."""
     
@@ -89,11 +176,14 @@ class ContextRetriever:
             [...]
             ```
         """
+        # Cap results once; the formatters below take the truncated list as-is
+        search_results = search_results[:max_results]
+        
         # Fetch user profile and preferences
         user_profile = self.user_service.get_user_profile(user_id)
         
         if not user_profile:
-            return self._format_empty_context(search_results, max_results)
+            return self._format_empty_context(search_results)
         
         # Analyze user preferences from purchase history
         past_purchases = user_profile.get("past_purchases", [])
@@ -109,13 +199,13 @@ class ContextRetriever:
         )
         
         # Format search results
-        results_summary = self._format_search_results(search_results, max_results)
+        results_summary = self._format_search_results(search_results)
         
         # Combine into structured context for LLM
         context = f"""USER PREFERENCES:
 {preferences_summary}
 
-SEARCH RESULTS ({min(len(search_results), max_results)} items):
+SEARCH RESULTS ({len(search_results)} items):
 {results_summary}"""
         
         return context
@@ -126,119 +216,40 @@ SEARCH RESULTS ({min(len(search_results), max_results)} items):
         preferences_analysis: Dict[str, Any]
     ) -> str:
         """Build formatted user preferences summary."""
-        lines = []
-        
-        # Dominant colors
-        colors = preferences_analysis.get("dominant_colors", {})
-        if colors:
-            color_str = ", ".join(
-                f"{color} ({freq})"
-                for color, freq in list(colors.items())[:5]
-            )
-            lines.append(f"- Preferred Colors: {color_str}")
-        
-        # Most frequent categories
-        categories = preferences_analysis.get("most_frequent_categories", {})
-        if categories:
-            cat_str = ", ".join(
-                f"{cat} ({freq})"
-                for cat, freq in list(categories.items())[:5]
-            )
-            lines.append(f"- Favorite Categories: {cat_str}")
-        
-        # Style profile
         style_profile = self.preference_analyzer.infer_style_profile(
             user_profile.get("past_purchases", [])
         )
-        if style_profile != "Unknown":
-            lines.append(f"- Style Profile: {style_profile}")
-        
-        # Popular style keywords
-        keywords = preferences_analysis.get("style_keywords", {})
-        if keywords:
-            keyword_str = ", ".join(
-                f"{kw}"
-                for kw in list(keywords.keys())[:5]
-            )
-            lines.append(f"- Popular Styles: {keyword_str}")
-        
-        # Preferred product types
-        product_types = preferences_analysis.get("product_types", {})
-        if product_types:
-            type_str = ", ".join(
-                f"{ptype}"
-                for ptype in list(product_types.keys())[:5]
-            )
-            lines.append(f"- Preferred Types: {type_str}")
-        
-        # Purchase history stats
-        purchase_count = preferences_analysis.get("purchase_count", 0)
-        if purchase_count > 0:
-            lines.append(f"- Total Purchases Analyzed: {purchase_count}")
-        
-        # User preferences from profile
-        if "preferences" in user_profile:
-            prefs = user_profile["preferences"]
-            if prefs.get("price_range"):
-                lines.append(f"- Price Range: {prefs['price_range']}")
-            if prefs.get("size_preference"):
-                lines.append(f"- Size Preference: {prefs['size_preference']}")
-        
-        return "\n".join(lines) if lines else "- No preference data available"
+        return format_preferences(preferences_analysis, user_profile, style_profile)
     
-    def _format_search_results(
-        self,
-        search_results: List[Dict[str, Any]],
-        max_results: int = 5
-    ) -> str:
-        """Format search results for LLM consumption."""
+    @staticmethod
+    def _format_search_results(search_results: List[Dict[str, Any]]) -> str:
+        """Format already-truncated search results for LLM consumption."""
         if not search_results:
             return "No search results available."
         
         formatted_results = []
         
-        for i, result in enumerate(search_results[:max_results], 1):
-            result_text = f"\nResult {i}: {result.get('title', 'Untitled')}"
-            
-            if result.get("description"):
-                result_text += f"\nDescription: {result['description']}"
-            
-            if result.get("category"):
-                result_text += f"\nCategory: {result['category']}"
-            
-            if result.get("color"):
-                result_text += f"\nColor: {result['color']}"
-            
-            if result.get("price"):
-                result_text += f"\nPrice: ${result['price']}"
-            
-            if result.get("score") is not None:
-                score = result['score']
-                result_text += f"\nRelevance Score: {score:.2f}"
-            
-            # Add any additional relevant fields
-            if result.get("size"):
-                result_text += f"\nSize: {result['size']}"
-            
-            if result.get("brand"):
-                result_text += f"\nBrand: {result['brand']}"
-            
-            formatted_results.append(result_text)
+        for i, result in enumerate(search_results, 1):
+            get = result.get
+            lines = [f"\nResult {i}: {get('title', 'Untitled')}"]
+            # Empty fields are skipped, except a score of 0 which is still reported
+            lines += [
+                template % (value,)
+                for key, template in _RESULT_FIELDS
+                if (value := get(key)) or (value is not None and key == "score")
+            ]
+            formatted_results.append("\n".join(lines))
         
         return "\n".join(formatted_results)
     
-    def _format_empty_context(
-        self,
-        search_results: List[Dict[str, Any]],
-        max_results: int = 5
-    ) -> str:
+    def _format_empty_context(self, search_results: List[Dict[str, Any]]) -> str:
         """Format context when user profile not found."""
-        results_summary = self._format_search_results(search_results, max_results)
+        results_summary = self._format_search_results(search_results)
         
         context = f"""USER PREFERENCES:
 - No user profile found. Showing general search results.
 
-SEARCH RESULTS ({min(len(search_results), max_results)} items):
+SEARCH RESULTS ({len(search_results)} items):
 {results_summary}"""
         
         return context
@@ -281,5 +292,27 @@ def retrieve_context(
         response = llm.generate(prompt)
         ```
     """
-    retriever = ContextRetriever()
-    return retriever.retrieve_context(user_id, search_results, max_results)
+    return get_context_retriever().retrieve_context(user_id, search_results, max_results)
+
+
+# Global context retriever instance
+_context_retriever: Optional[ContextRetriever] = None
+
+
+def get_context_retriever() -> ContextRetriever:
+    """
+    Get or create the global context retriever.
+    
+    Building a retriever loads the preference analyzer and user service
+    modules, so retrieve_context reuses one instance across calls.
+    """
+    global _context_retriever
+    if _context_retriever is None:
+        _context_retriever = ContextRetriever()
+    return _context_retriever
+
+
+def reset_context_retriever():
+    """Reset the global context retriever (useful for testing)."""
+    global _context_retriever
+    _context_retriever = None
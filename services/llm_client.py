@@ -8,28 +8,47 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from config.settings import settings
+from config.settings import get_snapshot
+
+
+# Canned recommendations returned by the mock provider
+MOCK_RESPONSE = (
+    '{"recommendations": ['
+    '{"title": "Blue Casual Shirt", "why": "Matches your preference for casual blue apparel", "is_wildcard": false},'
+    '{"title": "Black Formal Blazer", "why": "Complements your style with professional pieces", "is_wildcard": false},'
+    '{"title": "Navy Chinos", "why": "Versatile neutral piece that works with multiple styles", "is_wildcard": false},'
+    '{"title": "Vintage Denim Jacket", "why": "A wildcard piece that adds character to your wardrobe", "is_wildcard": true}'
+    "]}"
+)
 
 
 class LLMClient:
     """Simple LLM client interface."""
     
-    def __init__(self, provider: str = "openai", model: str = "gpt-3.5-turbo"):
+    def __init__(self,
+                 provider: str = "openai",
+                 model: str = "gpt-3.5-turbo",
+                 api_key: Optional[str] = None,
+                 dev_mode: Optional[bool] = None):
         """
         Initialize LLM client.
         
         Args:
             provider: LLM provider ("openai", "mock", etc.)
             model: Model name for the provider
+            api_key: Provider API key (defaults to OPENAI_API_KEY env var)
+            dev_mode: Force mock responses (defaults to the current DEV_MODE setting)
         """
         self.provider = provider
         self.model = model
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        self.dev_mode = dev_mode if dev_mode is not None else get_snapshot().DEV_MODE
         self._initialize_client()
     
     def _initialize_client(self):
         """Initialize the underlying LLM client based on provider."""
         # Check if dev mode is enabled
-        if settings.DEV_MODE:
+        if self.dev_mode:
             print("Dev mode enabled: Using mock LLM responses (no external API calls)")
             self.provider = "mock"
             self.client = None
@@ -38,13 +57,12 @@ class LLMClient:
         if self.provider == "openai":
             try:
                 import openai
-                api_key = os.getenv("OPENAI_API_KEY")
-                if not api_key:
+                if not self.api_key:
                     print("Warning: OPENAI_API_KEY not set. Using mock client.")
                     self.provider = "mock"
                     self.client = None
                 else:
-                    self.client = openai.OpenAI(api_key=api_key)
+                    self.client = openai.OpenAI(api_key=self.api_key)
             except ImportError:
                 print("Warning: openai package not installed. Using mock client.")
                 self.provider = "mock"
@@ -62,6 +80,9 @@ class LLMClient:
         Returns:
             The LLM's response text
         """
+        if self.provider == "mock":
+            return MOCK_RESPONSE
+        
         if self.provider == "openai" and self.client:
             try:
                 response = self.client.chat.completions.create(
@@ -79,14 +100,7 @@ class LLMClient:
     
     def _mock_response(self, prompt: str) -> str:
         """Generate a mock response for testing/demo."""
-        return (
-            '{"recommendations": ['
-            '{"title": "Blue Casual Shirt", "why": "Matches your preference for casual blue apparel", "is_wildcard": false},'
-            '{"title": "Black Formal Blazer", "why": "Complements your style with professional pieces", "is_wildcard": false},'
-            '{"title": "Navy Chinos", "why": "Versatile neutral piece that works with multiple styles", "is_wildcard": false},'
-            '{"title": "Vintage Denim Jacket", "why": "A wildcard piece that adds character to your wardrobe", "is_wildcard": true}'
-            "]}"
-        )
+        return MOCK_RESPONSE
 
 
 # Global LLM client instance
@@ -7,11 +7,23 @@ Workflow:
 - Call LLM with structured prompt
 - Return structured recommendations payload
 """
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
-from services.context_retrieval import ContextRetriever, retrieve_context
+import orjson
+
+from services.context_retrieval import ContextRetriever, get_context_retriever, retrieve_context
 from db.user_service import UserProfileService
 
+# Placeholder substituted into custom prompt templates
+CONTEXT_PLACEHOLDER = "{{context}}"
+
+
+@lru_cache(maxsize=32)
+def _template_parts(template: str) -> Tuple[str, ...]:
+    """Split a prompt template around its context placeholders, once per template."""
+    return tuple(template.split(CONTEXT_PLACEHOLDER))
+
 
 class PersonalShopperAgent:
     """Orchestrates personalization flow and calls an LLM for recommendations."""
@@ -31,7 +43,7 @@ class PersonalShopperAgent:
             user_service: Optional user profile service (must be connected externally).
             search_service: Optional search service with a `.search(query, user_id=None, top_k=10)` method
                             or any callable that returns a list of search results dicts.
-            context_retriever: Optional context retriever instance (defaults to ContextRetriever()).
+            context_retriever: Optional context retriever instance (defaults to the shared one).
         """
         if not llm_client:
             raise ValueError("llm_client is required and must expose generate(prompt: str) -> str")
@@ -39,12 +51,12 @@ class PersonalShopperAgent:
         self.llm_client = llm_client
         self.user_service = user_service
         self.search_service = search_service
-        self.context_retriever = context_retriever or ContextRetriever()
+        self.context_retriever = context_retriever or get_context_retriever()
 
     def build_prompt(self, context: str, template: Optional[str] = None) -> str:
         """Build the LLM prompt with a default structured format."""
         if template:
-            return template.replace("{{context}}", context)
+            return context.join(_template_parts(template))
 
         return (
             "You are a fashion/product stylist. Use the user context to craft personalized picks.\n\n"
@@ -65,6 +77,119 @@ class PersonalShopperAgent:
             "}\n"
         )
 
+    def _resolve_results(
+        self,
+        user_id: str,
+        query: Optional[str],
+        search_results: Optional[List[Dict[str, Any]]],
+        max_results: int,
+    ) -> List[Dict[str, Any]]:
+        """Use the provided search results, or run the search service for the query."""
+        if search_results is not None:
+            return search_results
+        if self.search_service and query is not None:
+            if callable(getattr(self.search_service, "search", None)):
+                return self.search_service.search(query=query, user_id=user_id, top_k=max_results)
+            if callable(self.search_service):
+                return self.search_service(query, user_id=user_id, top_k=max_results)
+            raise ValueError("search_service must have a .search(...) method or be callable")
+        raise ValueError("search_results or (search_service and query) must be provided")
+
+    def build_batch_prompt(self, contexts: List[str]) -> str:
+        """Build one prompt that asks for recommendations for several labeled contexts."""
+        sections = "\n".join(
+            f"[Q{i}] USER CONTEXT:\n{context}\n" for i, context in enumerate(contexts)
+        )
+        return (
+            "You are a fashion/product stylist. Use each user context to craft personalized picks.\n\n"
+            f"{sections}\n"
+            "TASKS (for each labeled context independently):\n"
+            "1) Recommend exactly 3 products from that context's search results.\n"
+            "2) For each, explain why it matches the user's taste (cite colors, styles, categories, price fit).\n"
+            "3) Add 1 wildcard item outside their norm but still plausible; explain the novelty.\n\n"
+            "OUTPUT JSON ONLY (no extra text), one entry per label, in order:\n"
+            "{\n"
+            '  "responses": [\n'
+            '    {"id": "Q0", "recommendations": [\n'
+            '      {"title": str, "why": str, "is_wildcard": false},\n'
+            '      {"title": str, "why": str, "is_wildcard": false},\n'
+            '      {"title": str, "why": str, "is_wildcard": false},\n'
+            '      {"title": str, "why": str, "is_wildcard": true}\n'
+            "    ]}\n"
+            "  ]\n"
+            "}\n"
+        )
+
+    @staticmethod
+    def _split_batch_response(llm_response: str, count: int) -> List[str]:
+        """
+        Split a batched LLM response into per-request recommendation JSON.
+
+        Entries that are missing or malformed come back as empty strings, which
+        callers treat like any other unparseable LLM response.
+        """
+        try:
+            payload = orjson.loads(llm_response)
+            entries = payload["responses"]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            return [""] * count
+
+        by_id = {
+            entry.get("id"): entry
+            for entry in entries
+            if isinstance(entry, dict) and isinstance(entry.get("recommendations"), list)
+        }
+        return [
+            orjson.dumps({"recommendations": by_id[f"Q{i}"]["recommendations"]}).decode()
+            if f"Q{i}" in by_id else ""
+            for i in range(count)
+        ]
+
+    def recommend_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Generate recommendations for several requests with a single LLM call.
+
+        The shared instructions are sent once for the whole batch, and the
+        labeled answers are split back into one payload per request.
+
+        Args:
+            requests: Keyword arguments for recommend() per request
+                      (user_id, and query or search_results, optional max_results).
+                      prompt_template is not supported in a batch.
+
+        Returns:
+            List of payloads shaped like recommend()'s, in request order.
+        """
+        if len(requests) <= 1:
+            # Nothing to amortize; keep the single-request prompt format
+            return [self.recommend(**request) for request in requests]
+
+        prepared = []
+        for request in requests:
+            user_id = request["user_id"]
+            max_results = request.get("max_results", 5)
+            user_profile = self.user_service.get_user_profile(user_id) if self.user_service else None
+            results = self._resolve_results(
+                user_id, request.get("query"), request.get("search_results"), max_results
+            )
+            context_text = retrieve_context(user_id=user_id, search_results=results, max_results=max_results)
+            prepared.append((user_id, user_profile, results[:max_results], context_text))
+
+        prompt = self.build_batch_prompt([context for *_, context in prepared])
+        llm_responses = self._split_batch_response(self.llm_client.generate(prompt), len(prepared))
+
+        return [
+            {
+                "user_id": user_id,
+                "prompt": prompt,
+                "context": context_text,
+                "llm_response": llm_response,
+                "search_results": results,
+                "user_profile": user_profile,
+            }
+            for (user_id, user_profile, results, context_text), llm_response in zip(prepared, llm_responses)
+        ]
+
     def recommend(
         self,
         user_id: str,
@@ -92,18 +217,7 @@ class PersonalShopperAgent:
             user_profile = self.user_service.get_user_profile(user_id)
 
         # 2) Retrieve search results
-        results: List[Dict[str, Any]]
-        if search_results is not None:
-            results = search_results
-        elif self.search_service and query is not None:
-            if callable(getattr(self.search_service, "search", None)):
-                results = self.search_service.search(query=query, user_id=user_id, top_k=max_results)
-            elif callable(self.search_service):
-                results = self.search_service(query, user_id=user_id, top_k=max_results)
-            else:
-                raise ValueError("search_service must have a .search(...) method or be callable")
-        else:
-            raise ValueError("search_results or (search_service and query) must be provided")
+        results = self._resolve_results(user_id, query, search_results, max_results)
 
         # 3) Build RAG context
         context_text = retrieve_context(user_id=user_id, search_results=results, max_results=max_results)
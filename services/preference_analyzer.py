@@ -2,10 +2,18 @@
 Preference analyzer for inferring user style from past purchases.
 Extracts dominant colors, frequent categories, and style keywords.
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from collections import Counter
+from itertools import islice
 import re
 
+# Optional Aho-Corasick matcher; falls back to regex alternation without it
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 
 # Common color names for matching in text
 COMMON_COLORS = {
@@ -40,6 +48,50 @@ PRODUCT_TYPES = {
 }
 
 
+def _is_word_char(char: str) -> bool:
+    """Whether a character is a regex word character (\\w)."""
+    return char.isalnum() or char == '_'
+
+
+def _vocabulary_matcher(words) -> Callable[[str], Set[str]]:
+    """
+    Build a function returning the vocabulary words found in a lowercase text.
+    
+    Words only match on word boundaries, so "blue" does not match "blueberry".
+    """
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+        
+        def match(text: str) -> Set[str]:
+            found = set()
+            last = len(text) - 1
+            # One pass over the text reports every vocabulary hit
+            for end, word in automaton.iter(text):
+                start = end - len(word) + 1
+                if (start == 0 or not _is_word_char(text[start - 1])) and \
+                        (end == last or not _is_word_char(text[end + 1])):
+                    found.add(word)
+            return found
+        
+        return match
+    
+    # Longest first so a word is never shadowed by one of its prefixes
+    alternation = "|".join(
+        re.escape(word) for word in sorted(words, key=len, reverse=True)
+    )
+    pattern = re.compile(r'\b(?:' + alternation + r')\b')
+    return lambda text: set(pattern.findall(text))
+
+
+# Vocabulary matchers, built once instead of one search per word per title
+COLOR_MATCHER = _vocabulary_matcher(COMMON_COLORS)
+STYLE_KEYWORD_MATCHER = _vocabulary_matcher(STYLE_KEYWORDS)
+PRODUCT_TYPE_MATCHER = _vocabulary_matcher(PRODUCT_TYPES)
+
+
 class PreferenceAnalyzer:
     """Analyzes user purchase history to infer style preferences."""
     
@@ -54,6 +106,59 @@ class PreferenceAnalyzer:
         self.min_frequency = min_frequency
         self.top_n = top_n
     
+    @staticmethod
+    def _lower_titles(titles: List[str]) -> List[str]:
+        """Lowercase non-empty titles once for every vocabulary matcher."""
+        return [title.lower() for title in titles if title]
+    
+    @staticmethod
+    def _count_title_matches(
+        matcher: Callable[[str], Set[str]],
+        lowered_titles: List[str]
+    ) -> Counter:
+        """
+        Count, per vocabulary word, the titles that mention it.
+        
+        Titles must already be lowercased; each word counts once per title.
+        """
+        freq: Counter = Counter()
+        for title in lowered_titles:
+            freq.update(matcher(title))
+        return freq
+    
+    @staticmethod
+    def _count_categories(categories: List[str]) -> Counter:
+        """
+        Count categories after normalizing them to lowercase.
+        
+        Raw values are tallied first so each distinct spelling is
+        normalized once, however often it repeats.
+        """
+        freq: Counter = Counter()
+        for cat, count in Counter(categories).items():
+            if cat:
+                freq[cat.lower().strip()] += count
+        return freq
+    
+    def _rank_frequencies(
+        self,
+        freq: Counter,
+        limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Drop entries below min_frequency and order the rest by frequency.
+        
+        Args:
+            freq: Item frequencies
+            limit: Keep only this many of the most frequent items
+            
+        Returns:
+            Dictionary mapping item to frequency, most frequent first
+        """
+        if self.min_frequency > 1:
+            freq = Counter({k: v for k, v in freq.items() if v >= self.min_frequency})
+        return dict(freq.most_common(limit))
+    
     def extract_colors(self, titles: List[str]) -> Dict[str, int]:
         """
         Extract dominant colors from product titles.
@@ -64,32 +169,10 @@ class PreferenceAnalyzer:
         Returns:
             Dictionary mapping color to frequency, sorted by frequency
         """
-        color_freq: Dict[str, int] = {}
-        
-        for title in titles:
-            if not title:
-                continue
-            
-            # Convert to lowercase for matching
-            title_lower = title.lower()
-            
-            # Extract color keywords
-            for color in COMMON_COLORS:
-                # Use word boundaries to avoid partial matches
-                if re.search(r'\b' + re.escape(color) + r'\b', title_lower):
-                    color_freq[color] = color_freq.get(color, 0) + 1
+        color_freq = self._count_title_matches(COLOR_MATCHER, self._lower_titles(titles))
         
         # Filter by minimum frequency and sort
-        filtered_colors = {
-            k: v for k, v in sorted(
-                color_freq.items(), 
-                key=lambda x: x[1], 
-                reverse=True
-            )
-            if v >= self.min_frequency
-        }
-        
-        return filtered_colors
+        return self._rank_frequencies(color_freq)
     
     def extract_categories(self, categories: List[str]) -> Dict[str, int]:
         """
@@ -104,23 +187,11 @@ class PreferenceAnalyzer:
         if not categories:
             return {}
         
-        # Normalize categories (lowercase)
-        normalized = [cat.lower().strip() for cat in categories if cat]
-        
-        # Count frequencies
-        category_freq = dict(Counter(normalized))
+        # Count normalized (lowercase) categories
+        category_freq = self._count_categories(categories)
         
         # Filter by minimum frequency and sort
-        filtered_categories = {
-            k: v for k, v in sorted(
-                category_freq.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )
-            if v >= self.min_frequency
-        }
-        
-        return filtered_categories
+        return self._rank_frequencies(category_freq)
     
     def extract_style_keywords(self, titles: List[str]) -> Dict[str, int]:
         """
@@ -132,30 +203,10 @@ class PreferenceAnalyzer:
         Returns:
             Dictionary mapping keyword to frequency, sorted by frequency
         """
-        keyword_freq: Dict[str, int] = {}
-        
-        for title in titles:
-            if not title:
-                continue
-            
-            title_lower = title.lower()
-            
-            # Extract style keywords
-            for keyword in STYLE_KEYWORDS:
-                if re.search(r'\b' + re.escape(keyword) + r'\b', title_lower):
-                    keyword_freq[keyword] = keyword_freq.get(keyword, 0) + 1
+        keyword_freq = self._count_title_matches(STYLE_KEYWORD_MATCHER, self._lower_titles(titles))
         
         # Filter by minimum frequency and sort
-        filtered_keywords = {
-            k: v for k, v in sorted(
-                keyword_freq.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )
-            if v >= self.min_frequency
-        }
-        
-        return filtered_keywords
+        return self._rank_frequencies(keyword_freq)
     
     def extract_product_types(self, titles: List[str]) -> Dict[str, int]:
         """
@@ -167,30 +218,10 @@ class PreferenceAnalyzer:
         Returns:
             Dictionary mapping product type to frequency
         """
-        type_freq: Dict[str, int] = {}
-        
-        for title in titles:
-            if not title:
-                continue
-            
-            title_lower = title.lower()
-            
-            # Extract product types
-            for ptype in PRODUCT_TYPES:
-                if re.search(r'\b' + re.escape(ptype) + r'\b', title_lower):
-                    type_freq[ptype] = type_freq.get(ptype, 0) + 1
+        type_freq = self._count_title_matches(PRODUCT_TYPE_MATCHER, self._lower_titles(titles))
         
         # Filter by minimum frequency and sort
-        filtered_types = {
-            k: v for k, v in sorted(
-                type_freq.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )
-            if v >= self.min_frequency
-        }
-        
-        return filtered_types
+        return self._rank_frequencies(type_freq)
     
     def analyze_preferences(
         self,
@@ -229,8 +260,13 @@ class PreferenceAnalyzer:
                 "unique_keywords": 0
             }
         
+        # Lowercase titles once for all vocabulary passes
+        lowered = self._lower_titles(past_purchases)
+        
         # Extract colors from titles
-        colors = self.extract_colors(past_purchases)
+        colors = self._rank_frequencies(
+            self._count_title_matches(COLOR_MATCHER, lowered)
+        )
         
         # Extract categories (use provided or try to extract from titles)
         if categories and len(categories) == len(past_purchases):
@@ -239,16 +275,20 @@ class PreferenceAnalyzer:
             category_dict = {}
         
         # Extract style keywords
-        keywords = self.extract_style_keywords(past_purchases)
+        keywords = self._rank_frequencies(
+            self._count_title_matches(STYLE_KEYWORD_MATCHER, lowered)
+        )
         
         # Extract product types
-        product_types = self.extract_product_types(past_purchases)
+        product_types = self._rank_frequencies(
+            self._count_title_matches(PRODUCT_TYPE_MATCHER, lowered)
+        )
         
         # Limit top N results
-        top_colors = dict(list(colors.items())[:self.top_n])
-        top_categories = dict(list(category_dict.items())[:self.top_n])
-        top_keywords = dict(list(keywords.items())[:self.top_n])
-        top_types = dict(list(product_types.items())[:self.top_n])
+        top_colors = dict(islice(colors.items(), self.top_n))
+        top_categories = dict(islice(category_dict.items(), self.top_n))
+        top_keywords = dict(islice(keywords.items(), self.top_n))
+        top_types = dict(islice(product_types.items(), self.top_n))
         
         return {
             "dominant_colors": top_colors,
@@ -272,8 +312,8 @@ class PreferenceAnalyzer:
         Returns:
             List of top N colors
         """
-        colors = self.extract_colors(past_purchases)
-        return list(colors.keys())[:n]
+        colors = self._count_title_matches(COLOR_MATCHER, self._lower_titles(past_purchases))
+        return list(self._rank_frequencies(colors, n))
     
     def get_top_categories(
         self,
@@ -290,8 +330,9 @@ class PreferenceAnalyzer:
         Returns:
             List of top N categories
         """
-        cat_dict = self.extract_categories(categories)
-        return list(cat_dict.keys())[:n]
+        if not categories:
+            return []
+        return list(self._rank_frequencies(self._count_categories(categories), n))
     
     def get_top_style_keywords(self, past_purchases: List[str], n: int = 5) -> List[str]:
         """
@@ -304,8 +345,8 @@ class PreferenceAnalyzer:
         Returns:
             List of top N keywords
         """
-        keywords = self.extract_style_keywords(past_purchases)
-        return list(keywords.keys())[:n]
+        keywords = self._count_title_matches(STYLE_KEYWORD_MATCHER, self._lower_titles(past_purchases))
+        return list(self._rank_frequencies(keywords, n))
     
     def infer_style_profile(
         self,
@@ -325,15 +366,12 @@ class PreferenceAnalyzer:
         if not past_purchases:
             return "Unknown"
         
-        analysis = self.analyze_preferences(past_purchases, categories)
-        keywords = analysis.get("style_keywords", {})
+        # Only the top style keywords feed the profile, so skip the full analysis
+        top_keywords = self.get_top_style_keywords(past_purchases, n=min(self.top_n, 3))
         
-        if not keywords:
+        if not top_keywords:
             return "Undefined"
         
-        # Get top keywords for profile description
-        top_keywords = list(keywords.keys())[:3]
-        
         # Map keywords to style profiles
         profile_keywords = ", ".join(top_keywords)
         return profile_keywords.title()
@@ -15,7 +15,9 @@ similarity for the text similarity component.
 """
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple, Union
+from functools import partial
+from operator import itemgetter
 import re
 import math
 import numpy as np
@@ -37,99 +39,135 @@ def _bow(text: str) -> Dict[str, int]:
     return freq
 
 
-def _cosine_sim(freq_a: Dict[str, int], freq_b: Dict[str, int]) -> float:
-    """Cosine similarity between two frequency dicts (0..1)."""
+def _norm(freq: Dict[str, int]) -> float:
+    """Euclidean norm of a frequency dict."""
+    return math.sqrt(sum(v * v for v in freq.values()))
+
+
+def _cosine_sim(
+    freq_a: Dict[str, int],
+    freq_b: Dict[str, int],
+    norm_a: Optional[float] = None
+) -> float:
+    """
+    Cosine similarity between two frequency dicts (0..1).
+    
+    Pass norm_a when freq_a is reused across many comparisons.
+    """
     if not freq_a or not freq_b:
         return 0.0
-    # Dot product
-    dot = 0
-    for k, va in freq_a.items():
-        vb = freq_b.get(k)
-        if vb:
-            dot += va * vb
+    # Dot product over shared tokens only (key views intersect in C)
+    dot = sum(freq_a[k] * freq_b[k] for k in freq_a.keys() & freq_b.keys())
+    if not dot:
+        return 0.0
     # Norms
-    na = math.sqrt(sum(v * v for v in freq_a.values()))
-    nb = math.sqrt(sum(v * v for v in freq_b.values()))
+    na = _norm(freq_a) if norm_a is None else norm_a
+    nb = _norm(freq_b)
     if na == 0 or nb == 0:
         return 0.0
     return float(dot / (na * nb))
 
 
-def text_similarity(query_text: Optional[str], title: Optional[str]) -> float:
-    """
-    Compute text similarity (0..1) between query text and product title.
-    Uses bag-of-words cosine similarity and keyword boosting for relevant terms.
-    Also detects category mentions in queries.
-    """
-    if not query_text or not title:
-        return 0.0
-    
-    base_sim = _cosine_sim(_bow(query_text), _bow(title))
+# Category names a query may mention, with title keywords that satisfy them
+_CATEGORY_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "electronics": ("phone", "laptop", "computer", "watch", "tablet", "headset", "earbuds", "speaker", "monitor", "keyboard"),
+    "apparel": ("shirt", "dress", "jacket", "pants", "blouse", "coat", "sweater", "hoodie", "shorts", "trousers"),
+    "footwear": ("shoe", "boot", "sneaker", "heel", "loafer", "sandal", "slipper", "flat"),
+    "furniture": ("desk", "chair", "table", "bed", "shelf", "sofa", "couch", "bookcase"),
+    "accessories": ("bag", "belt", "scarf", "hat", "purse", "cap", "backpack"),
+    "sports": ("dumbbells", "yoga", "bike", "ball", "racket", "skateboard", "weights", "mat"),
+    "kitchen": ("coffee", "blender", "toaster", "microwave", "pan", "pot", "kettle", "mixer"),
+    "jewelry": ("watch", "bracelet", "necklace", "ring", "earring"),
+}
+
+# Keyword boosting for general queries: query keyword -> related title keywords
+_KEYWORD_BOOSTS: Dict[str, Tuple[str, ...]] = {
+    "workout": ("dumbbells", "yoga", "gym", "fitness", "exercise", "sports", "training", "weights"),
+    "equipment": ("dumbbells", "racket", "mat", "bike", "skateboard", "weights", "stand"),
+    "exercise": ("dumbbells", "yoga", "bike", "skateboard", "mat", "tennis"),
+    "sports": ("basketball", "soccer", "ball", "racket", "bike", "skateboard"),
+    "professional": ("watch", "laptop", "laptop", "chair", "desk"),
+    "comfortable": ("shoe", "mat", "chair", "bed", "clothing"),
+    "luxury": ("watch", "bracelet", "necklace", "ring", "leather"),
+}
+
+# Title words that earn a small descriptor boost
+_DESCRIPTOR_WORDS = ("equipment", "tool", "gear", "device", "set")
+
+
+class _PreparedQuery(NamedTuple):
+    """Query-side inputs to text similarity, computed once per query."""
+    bow: Dict[str, int]
+    norm: float
+    category_keywords: Optional[Tuple[str, ...]]
+    boost_keywords: Tuple[Tuple[str, ...], ...]
+
+
+def _prepare_query(query_text: Optional[str]) -> Optional[_PreparedQuery]:
+    """Tokenize a query and resolve its category and keyword boosts."""
+    if not query_text:
+        return None
     
     query_lower = query_text.lower()
-    title_lower = title.lower()
     
-    # Category keywords mapping
-    category_keywords = {
-        "electronics": ["phone", "laptop", "computer", "watch", "tablet", "headset", "earbuds", "speaker", "monitor", "keyboard"],
-        "apparel": ["shirt", "dress", "jacket", "pants", "blouse", "coat", "sweater", "hoodie", "shorts", "trousers"],
-        "footwear": ["shoe", "boot", "sneaker", "heel", "loafer", "sandal", "slipper", "flat"],
-        "furniture": ["desk", "chair", "table", "bed", "shelf", "sofa", "couch", "bookcase"],
-        "accessories": ["bag", "belt", "scarf", "hat", "purse", "cap", "backpack"],
-        "sports": ["dumbbells", "yoga", "bike", "ball", "racket", "skateboard", "weights", "mat"],
-        "kitchen": ["coffee", "blender", "toaster", "microwave", "pan", "pot", "kettle", "mixer"],
-        "jewelry": ["watch", "bracelet", "necklace", "ring", "earring"],
-    }
+    # First category the query mentions, if any
+    category_keywords = next(
+        (keywords for category, keywords in _CATEGORY_KEYWORDS.items() if category in query_lower),
+        None
+    )
+    boost_keywords = tuple(
+        related for query_keyword, related in _KEYWORD_BOOSTS.items()
+        if query_keyword in query_lower
+    )
+    bow = _bow(query_text)
+    return _PreparedQuery(bow, _norm(bow), category_keywords, boost_keywords)
+
+
+def _text_similarity_prepared(query: Optional[_PreparedQuery], title: Optional[str]) -> float:
+    """Text similarity between a prepared query and a product title."""
+    if query is None or not title:
+        return 0.0
     
-    # Check if query mentions a specific category
-    detected_category = None
-    for category, keywords in category_keywords.items():
-        if category in query_lower:
-            detected_category = category
-            break
+    title_lower = title.lower()
     
-    # If a category is mentioned, check if title matches that category
-    if detected_category:
-        category_matched = False
-        for keyword in category_keywords[detected_category]:
-            if keyword in title_lower:
-                category_matched = True
-                break
-        
-        # If category is explicitly mentioned but not matched in title, penalize
-        if not category_matched:
-            return 0.1  # Very low score for wrong category
+    # If category is explicitly mentioned but not matched in title, penalize
+    if query.category_keywords is not None and not any(
+        keyword in title_lower for keyword in query.category_keywords
+    ):
+        return 0.1  # Very low score for wrong category
     
-    # Define keyword boosting for general queries
-    keyword_boosts = {
-        "workout": ["dumbbells", "yoga", "gym", "fitness", "exercise", "sports", "training", "weights"],
-        "equipment": ["dumbbells", "racket", "mat", "bike", "skateboard", "weights", "stand"],
-        "exercise": ["dumbbells", "yoga", "bike", "skateboard", "mat", "tennis"],
-        "sports": ["basketball", "soccer", "ball", "racket", "bike", "skateboard"],
-        "professional": ["watch", "laptop", "laptop", "chair", "desk"],
-        "comfortable": ["shoe", "mat", "chair", "bed", "clothing"],
-        "luxury": ["watch", "bracelet", "necklace", "ring", "leather"],
-    }
+    base_sim = _cosine_sim(query.bow, _bow(title), query.norm)
     
     # Check if any query keywords match relevant title keywords
     boost = 0.0
-    for query_keyword, related_keywords in keyword_boosts.items():
-        if query_keyword in query_lower:
-            for title_keyword in related_keywords:
-                if title_keyword in title_lower:
-                    boost = max(boost, 0.4)
-                    break
+    if any(
+        title_keyword in title_lower
+        for related in query.boost_keywords
+        for title_keyword in related
+    ):
+        boost = 0.4
     
     # Combine base similarity with keyword boost
     combined = max(base_sim, boost)
     
     # Slight additional boost if title contains product descriptors
-    if any(word in title_lower for word in ["equipment", "tool", "gear", "device", "set"]):
+    if any(word in title_lower for word in _DESCRIPTOR_WORDS):
         combined = min(1.0, combined + 0.1)
     
     return min(1.0, combined)
 
 
+def text_similarity(query_text: Optional[str], title: Optional[str]) -> float:
+    """
+    Compute text similarity (0..1) between query text and product title.
+    Uses bag-of-words cosine similarity and keyword boosting for relevant terms.
+    Also detects category mentions in queries.
+    """
+    if not query_text or not title:
+        return 0.0
+    return _text_similarity_prepared(_prepare_query(query_text), title)
+
+
 def exact_match_boost(a: Optional[str], b: Optional[str]) -> float:
     """Return 1.0 if a and b match exactly (case-insensitive), else 0.0."""
     if not a or not b:
@@ -137,6 +175,39 @@ def exact_match_boost(a: Optional[str], b: Optional[str]) -> float:
     return 1.0 if str(a).strip().lower() == str(b).strip().lower() else 0.0
 
 
+# Default scoring weights; text is weighted higher for semantic queries
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "vector": 0.4,
+    "color": 0.15,
+    "category": 0.15,
+    "text": 0.3,
+}
+
+
+def _resolve_weights(weights: Optional[Dict[str, float]]) -> Tuple[float, float, float, float]:
+    """Merge weight overrides into the defaults as (vector, color, category, text)."""
+    w = {**DEFAULT_WEIGHTS, **weights} if weights else DEFAULT_WEIGHTS
+    return w["vector"], w["color"], w["category"], w["text"]
+
+
+def _weighted_score(
+    w: Tuple[float, float, float, float],
+    vector_sim: float,
+    color_match: float,
+    category_match: float,
+    text_sim: float,
+) -> float:
+    """Weighted sum of the score components, clamped to [0,1]."""
+    w_vector, w_color, w_category, w_text = w
+    score = (
+        w_vector * vector_sim
+        + w_color * color_match
+        + w_category * category_match
+        + w_text * text_sim
+    )
+    return max(0.0, min(1.0, score))
+
+
 def compute_final_score(
     vector_sim: Optional[float] = None,
     color_match: float = 0.0,
@@ -150,25 +221,15 @@ def compute_final_score(
     Defaults: 0.4*vector + 0.15*color + 0.15*category + 0.3*text
     Text similarity is weighted higher to catch semantic queries like "workout equipment"
     """
-    w = {
-        "vector": 0.4,
-        "color": 0.15,
-        "category": 0.15,
-        "text": 0.3,
-    }
-    if weights:
-        w.update(weights)
-
     v = float(vector_sim) if vector_sim is not None else 0.0
 
-    score = (
-        w["vector"] * v
-        + w["color"] * float(color_match)
-        + w["category"] * float(category_match)
-        + w["text"] * float(text_sim)
+    return _weighted_score(
+        _resolve_weights(weights),
+        v,
+        float(color_match),
+        float(category_match),
+        float(text_sim),
     )
-    # Clamp to [0,1] for safety
-    return max(0.0, min(1.0, score))
 
 
 def _result_to_dict(result: Union[Dict[str, Any], Any]) -> Dict[str, Any]:
@@ -200,7 +261,8 @@ def rerank_results(
     weights: Optional[Dict[str, float]] = None,
     add_score_field: bool = True,
     add_debug_scores: bool = False,
-) -> List[Dict[str, Any]]:
+    in_place: bool = False,
+) -> List[Union[Dict[str, Any], Any]]:
     """
     Re-rank results using the weighted scoring formula.
 
@@ -212,45 +274,56 @@ def rerank_results(
         weights: Optional override for default weights
         add_score_field: If True, add 'final_score' to each result dict
         add_debug_scores: If True, add individual score components (vector_score, color_score, etc.)
+        in_place: If True, score the given results themselves (setting attributes on
+                  objects) and return them reordered, instead of converting objects to dicts
 
     Returns:
-        List of result dicts sorted by 'final_score' desc (or by computed score if not added).
+        List of result dicts (or the original results if in_place) sorted by
+        'final_score' desc (or by computed score if not added).
     """
-    scored: List[Tuple[float, Dict[str, Any]]] = []
+    scored: List[Tuple[float, Union[Dict[str, Any], Any]]] = []
+
+    # Weights and the query are the same for every result, so prepare them once
+    w = _resolve_weights(weights)
+    query = _prepare_query(query_text)
 
     for res in results:
-        rd = _result_to_dict(res)
+        item = res if in_place else _result_to_dict(res)
+        is_dict = isinstance(item, dict)
+        get = item.get if is_dict else partial(getattr, item)
 
-        vector_sim = rd.get("similarity")
-        color_match = exact_match_boost(query_color, rd.get("color"))
-        category_match = exact_match_boost(query_category, rd.get("category"))
-        text_sim = text_similarity(query_text, rd.get("title"))
+        vector_sim = get("similarity", None)
+        vector_score = float(vector_sim) if vector_sim is not None else 0.0
+        color_match = exact_match_boost(query_color, get("color", None))
+        category_match = exact_match_boost(query_category, get("category", None))
+        text_sim = _text_similarity_prepared(query, get("title", None))
 
-        score = compute_final_score(
-            vector_sim=vector_sim,
-            color_match=color_match,
-            category_match=category_match,
-            text_sim=text_sim,
-            weights=weights,
-        )
+        score = _weighted_score(w, vector_score, color_match, category_match, text_sim)
 
+        fields: Dict[str, Any] = {}
         if add_score_field:
-            rd["final_score"] = score
+            fields["final_score"] = score
         
         if add_debug_scores:
-            rd["debug_scores"] = {
-                "vector_score": float(vector_sim) if vector_sim is not None else 0.0,
+            fields["debug_scores"] = {
+                "vector_score": vector_score,
                 "color_score": float(color_match),
                 "category_score": float(category_match),
                 "text_score": float(text_sim),
                 "final_score": float(score)
             }
 
-        scored.append((score, rd))
+        if is_dict:
+            item.update(fields)
+        else:
+            for name, value in fields.items():
+                setattr(item, name, value)
+
+        scored.append((score, item))
 
     # Sort by score desc, stable
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [rd for _, rd in scored]
+    scored.sort(key=itemgetter(0), reverse=True)
+    return [item for _, item in scored]
 
 
 def cosine_similarity_embeddings(
@@ -198,30 +198,7 @@ class ProductSearchService:
             return initial_results[:top_k]
         
         # Re-rank using additional factors
-        result_dicts = [r.to_dict() for r in initial_results]
-        reranked_dicts = rerank_results(
-            results=result_dicts,
-            query_text=query_text,
-            query_color=color_filter,
-            query_category=category_filter,
-            add_score_field=True,
-            add_debug_scores=enable_debug
-        )
-        
-        # Convert back to SearchResult objects, update similarity with final_score
-        reranked_results = []
-        for rd in reranked_dicts[:top_k]:
-            result = SearchResult(
-                product_data=rd,
-                similarity=rd.get("final_score", rd.get("similarity", 0.0)),
-                distance=rd.get("distance", 0.0)
-            )
-            # Preserve debug scores if present
-            if "debug_scores" in rd:
-                result.debug_scores = rd["debug_scores"]
-            reranked_results.append(result)
-        
-        return reranked_results
+        return self._rerank(initial_results, top_k, query_text, color_filter, category_filter, enable_debug)
     
     def search_by_image(self,
                        image_path: str,
@@ -262,29 +239,7 @@ class ProductSearchService:
             return initial_results[:top_k]
         
         # Re-rank (no query_text for image-only search)
-        result_dicts = [r.to_dict() for r in initial_results]
-        reranked_dicts = rerank_results(
-            results=result_dicts,
-            query_text=None,
-            query_color=color_filter,
-            query_category=category_filter,
-            add_score_field=True,
-            add_debug_scores=enable_debug
-        )
-        
-        # Convert back to SearchResult objects
-        reranked_results = []
-        for rd in reranked_dicts[:top_k]:
-            result = SearchResult(
-                product_data=rd,
-                similarity=rd.get("final_score", rd.get("similarity", 0.0)),
-                distance=rd.get("distance", 0.0)
-            )
-            if "debug_scores" in rd:
-                result.debug_scores = rd["debug_scores"]
-            reranked_results.append(result)
-        
-        return reranked_results
+        return self._rerank(initial_results, top_k, None, color_filter, category_filter, enable_debug)
     
     def search_multimodal(self,
                          text_query: Optional[str] = None,
@@ -352,29 +307,35 @@ class ProductSearchService:
             return initial_results[:top_k]
         
         # Re-rank using text query if available
-        result_dicts = [r.to_dict() for r in initial_results]
-        reranked_dicts = rerank_results(
-            results=result_dicts,
-            query_text=text_query,
+        return self._rerank(initial_results, top_k, text_query, color_filter, category_filter, enable_debug)
+    
+    def _rerank(self,
+                results: List[SearchResult],
+                top_k: int,
+                query_text: Optional[str],
+                color_filter: Optional[str],
+                category_filter: Optional[str],
+                enable_debug: bool) -> List[SearchResult]:
+        """
+        Re-rank search results in place and keep the top_k.
+        
+        The results are scored without copying them to dicts; each kept result's
+        similarity is replaced with its final_score.
+        """
+        reranked = rerank_results(
+            results=results,
+            query_text=query_text,
             query_color=color_filter,
             query_category=category_filter,
             add_score_field=True,
-            add_debug_scores=enable_debug
-        )
+            add_debug_scores=enable_debug,
+            in_place=True
+        )[:top_k]
         
-        # Convert back to SearchResult objects
-        reranked_results = []
-        for rd in reranked_dicts[:top_k]:
-            result = SearchResult(
-                product_data=rd,
-                similarity=rd.get("final_score", rd.get("similarity", 0.0)),
-                distance=rd.get("distance", 0.0)
-            )
-            if "debug_scores" in rd:
-                result.debug_scores = rd["debug_scores"]
-            reranked_results.append(result)
+        for result in reranked:
+            result.similarity = result.final_score
         
-        return reranked_results
+        return reranked
     
     def format_results(self, results: List[SearchResult]) -> List[Dict[str, Any]]:
         """
@@ -16,7 +16,7 @@ from typing import List, Optional, Dict, Any
 import tempfile
 import os
 import time
-from models.search import ProductResult
+from models.search import ProductResult, to_product_results
 from services import get_search_service
 from services.ranking import rerank_results
 
@@ -50,7 +50,7 @@ class SearchVariantV1:
         Returns:
             Tuple of (ProductResult list, search_time_ms)
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             search_service = get_search_service()
@@ -66,22 +66,9 @@ class SearchVariantV1:
             )
             
             # Convert to ProductResult format
-            product_results = [
-                ProductResult(
-                    product_id=r.product_id,
-                    title=r.title,
-                    description=r.description,
-                    color=r.color,
-                    category=r.category,
-                    image_path=r.image_path,
-                    similarity=r.similarity,
-                    distance=r.distance,
-                    debug_scores=r.debug_scores
-                )
-                for r in results
-            ]
+            product_results = to_product_results(results)
             
-            elapsed_ms = (time.time() - start_time) * 1000
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
             return product_results, elapsed_ms
             
         except Exception as e:
@@ -108,7 +95,7 @@ class SearchVariantV1:
         Returns:
             Tuple of (ProductResult list, search_time_ms)
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             search_service = get_search_service()
@@ -124,22 +111,9 @@ class SearchVariantV1:
             )
             
             # Convert to ProductResult format
-            product_results = [
-                ProductResult(
-                    product_id=r.product_id,
-                    title=r.title,
-                    description=r.description,
-                    color=r.color,
-                    category=r.category,
-                    image_path=r.image_path,
-                    similarity=r.similarity,
-                    distance=r.distance,
-                    debug_scores=r.debug_scores
-                )
-                for r in results
-            ]
+            product_results = to_product_results(results)
             
-            elapsed_ms = (time.time() - start_time) * 1000
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
             return product_results, elapsed_ms
             
         except Exception as e:
@@ -176,7 +150,7 @@ class SearchVariantV2:
         Returns:
             Tuple of (ProductResult list, search_time_ms)
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             search_service = get_search_service()
@@ -192,22 +166,10 @@ class SearchVariantV2:
             )
             
             # Convert to ProductResult format
-            product_results = [
-                ProductResult(
-                    product_id=r.product_id,
-                    title=r.title,
-                    description=r.description,
-                    color=r.color,
-                    category=r.category,
-                    image_path=r.image_path,
-                    similarity=r.similarity,  # This is final_score from re-ranking
-                    distance=r.distance,
-                    debug_scores=r.debug_scores
-                )
-                for r in results
-            ]
+            # similarity holds final_score from re-ranking
+            product_results = to_product_results(results)
             
-            elapsed_ms = (time.time() - start_time) * 1000
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
             return product_results, elapsed_ms
             
         except Exception as e:
@@ -234,7 +196,7 @@ class SearchVariantV2:
         Returns:
             Tuple of (ProductResult list, search_time_ms)
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             search_service = get_search_service()
@@ -250,22 +212,10 @@ class SearchVariantV2:
             )
             
             # Convert to ProductResult format
-            product_results = [
-                ProductResult(
-                    product_id=r.product_id,
-                    title=r.title,
-                    description=r.description,
-                    color=r.color,
-                    category=r.category,
-                    image_path=r.image_path,
-                    similarity=r.similarity,  # This is final_score from re-ranking
-                    distance=r.distance,
-                    debug_scores=r.debug_scores
-                )
-                for r in results
-            ]
+            # similarity holds final_score from re-ranking
+            product_results = to_product_results(results)
             
-            elapsed_ms = (time.time() - start_time) * 1000
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
             return product_results, elapsed_ms
             
         except Exception as e:
@@ -292,6 +242,8 @@ def get_search_variant(variant_name: str):
     Raises:
         ValueError: If variant_name is not recognized
     """
-    if variant_name not in SEARCH_VARIANTS:
-        raise ValueError(f"Unknown search variant: {variant_name}. Available: {list(SEARCH_VARIANTS.keys())}")
-    return SEARCH_VARIANTS[variant_name]
+    # Single lookup on the common (known variant) path
+    try:
+        return SEARCH_VARIANTS[variant_name]
+    except KeyError:
+        raise ValueError(f"Unknown search variant: {variant_name}. Available: {list(SEARCH_VARIANTS.keys())}") from None
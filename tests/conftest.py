@@ -1,8 +1,12 @@
 """
 Pytest configuration file for mocking external dependencies.
 """
+import os
 import sys
-from unittest.mock import MagicMock
+import tempfile
+from unittest.mock import MagicMock, Mock
+
+import pytest
 
 # Mock external dependencies before anything else imports them
 sys.modules['pymongo'] = MagicMock()
@@ -20,3 +24,53 @@ sys.modules['weaviate'] = MagicMock()
 sys.modules['weaviate.classes'] = MagicMock()
 sys.modules['weaviate.classes.config'] = MagicMock()
 sys.modules['weaviate.classes.query'] = MagicMock()
+
+# Append A/B events to a per-worker file outside the working tree, so xdist
+# workers never interleave writes into a shared ab_events.jsonl
+os.environ["AB_LOG_FILE"] = os.path.join(
+    tempfile.gettempdir(),
+    f"omnisearch_ab_events_{os.environ.get('PYTEST_XDIST_WORKER', 'main')}.jsonl"
+)
+
+
+def pytest_sessionstart(session):
+    """Start each test session (and each xdist worker) with an empty A/B event log."""
+    open(os.environ["AB_LOG_FILE"], "wb").close()
+
+
+@pytest.fixture
+def patched_search_service(monkeypatch):
+    """Search service mock returned by services.search_variants.get_search_service."""
+    service = Mock()
+    monkeypatch.setattr("services.search_variants.get_search_service", lambda: service)
+    return service
+
+
+@pytest.fixture(scope="session")
+def app():
+    """FastAPI application, imported once per test session."""
+    from main import app as fastapi_app
+    return fastapi_app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    """Shared test client; tests reset service state via their own fixtures."""
+    from fastapi.testclient import TestClient
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """Run async tests on asyncio only."""
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def aclient(app, anyio_backend):
+    """Shared async client over the ASGI app, kept open for the whole session."""
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+        yield async_client
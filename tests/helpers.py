@@ -0,0 +1,37 @@
+"""
+Plain helpers shared by test modules; fixtures and hooks live in conftest.py.
+"""
+from types import SimpleNamespace
+
+import orjson
+
+
+def json_body(response):
+    """Decode a response body with orjson rather than the client's stdlib json."""
+    return orjson.loads(response.content)
+
+
+# Default fields of a search service result (the attributes of SearchResult)
+_SEARCH_RESULT_DEFAULTS = {
+    "product_id": "prod_001",
+    "title": "Blue Running Shoes",
+    "description": "Comfortable running shoes",
+    "color": "blue",
+    "category": "footwear",
+    "image_path": "/images/shoes.jpg",
+    "similarity": 0.95,
+    "distance": 0.05,
+    "debug_scores": None,
+}
+
+
+def make_search_result(**overrides):
+    """
+    Build a search service result as a plain namespace, overriding any defaults.
+    
+    Like a spec_set mock, unknown field names are rejected so typos fail loudly.
+    """
+    unknown = overrides.keys() - _SEARCH_RESULT_DEFAULTS.keys()
+    if unknown:
+        raise TypeError(f"Unknown search result fields: {sorted(unknown)}")
+    return SimpleNamespace(**{**_SEARCH_RESULT_DEFAULTS, **overrides})
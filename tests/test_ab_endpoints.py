@@ -3,23 +3,21 @@ Integration tests for A/B testing API endpoints.
 """
 
 import pytest
-from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 import json
 
-from main import app
+from tests.helpers import json_body
 from services.ab_testing import (
     get_experiment_manager,
-    reset_experiment_manager,
     ExperimentVariant
 )
 
 
-@pytest.fixture
-def client():
-    """Create test client."""
-    reset_experiment_manager()
-    return TestClient(app)
+@pytest.fixture(autouse=True)
+def cleanup_ab():
+    """Clear A/B testing state before each test; the client is session-scoped."""
+    get_experiment_manager().reset()
+    yield
 
 
 @pytest.fixture
@@ -39,7 +37,7 @@ class TestABAssignmentEndpoint:
         response = client.post("/ab/assign?user_id=user123")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["user_id"] == "user123"
         assert data["variant"] in ["search_v1", "search_v2"]
         assert "assigned_at" in data
@@ -49,8 +47,8 @@ class TestABAssignmentEndpoint:
         response1 = client.post("/ab/assign?user_id=user456")
         response2 = client.post("/ab/assign?user_id=user456")
         
-        data1 = response1.json()
-        data2 = response2.json()
+        data1 = json_body(response1)
+        data2 = json_body(response2)
         
         assert data1["variant"] == data2["variant"]
         assert data1["assigned_at"] == data2["assigned_at"]
@@ -60,7 +58,7 @@ class TestABAssignmentEndpoint:
         response = client.post("/ab/assign", headers=user_headers)
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["user_id"] == "test_user_123"
 
 
@@ -82,7 +80,7 @@ class TestABLogSearchEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["event_type"] == "search"
         assert data["user_id"] == "test_user_123"
         assert data["variant"] in ["search_v1", "search_v2"]
@@ -110,7 +108,7 @@ class TestABLogSearchEndpoint:
         response = client.post("/ab/log-search", json=payload)
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "user_id" in data
         assert len(data["user_id"]) > 0
 
@@ -134,7 +132,7 @@ class TestABLogClickEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["event_type"] == "click"
         assert data["user_id"] == "test_user_123"
     
@@ -149,7 +147,7 @@ class TestABLogClickEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["event_type"] == "click"
     
     def test_log_click_missing_product_id(self, client, user_headers):
@@ -173,7 +171,7 @@ class TestABMetricsEndpoint:
         response = client.get("/ab/metrics")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["total_events"] == 0
         assert data["search_events"] == 0
         assert data["click_events"] == 0
@@ -195,7 +193,7 @@ class TestABMetricsEndpoint:
         response = client.get("/ab/metrics")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["search_events"] == 1
         assert data["click_events"] == 1
         assert data["total_events"] == 2
@@ -215,7 +213,7 @@ class TestABMetricsEndpoint:
         )
         
         response = client.get("/ab/metrics")
-        data = response.json()
+        data = json_body(response)
         
         # Should have calculated CTR for one variant
         assert "search_v1" in data
@@ -236,7 +234,7 @@ class TestABAssignmentEndpoint:
         response = client.get("/ab/assignment?user_id=user_xyz")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["user_id"] == "user_xyz"
         assert data["variant"] in ["search_v1", "search_v2"]
     
@@ -245,7 +243,7 @@ class TestABAssignmentEndpoint:
         response = client.get("/ab/assignment?user_id=nonexistent_user")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "error" in data
 
 
@@ -265,7 +263,7 @@ class TestABEventsEndpoint:
         response = client.get("/ab/events")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["count"] == 3
         assert len(data["events"]) == 3
     
@@ -286,7 +284,7 @@ class TestABEventsEndpoint:
         response = client.get("/ab/events?user_id=user1")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["count"] == 1
         assert data["events"][0]["user_id"] == "user1"
     
@@ -307,7 +305,7 @@ class TestABEventsEndpoint:
         response = client.get("/ab/events?event_type=search")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["count"] == 1
         assert data["events"][0]["event_type"] == "search"
     
@@ -324,7 +322,7 @@ class TestABEventsEndpoint:
         response = client.get("/ab/events?limit=5")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["count"] == 5
 
 
@@ -343,16 +341,16 @@ class TestABResetEndpoint:
         
         # Verify data exists
         response = client.get("/ab/metrics")
-        assert response.json()["total_events"] > 0
+        assert json_body(response)["total_events"] > 0
         
         # Reset
         reset_response = client.delete("/ab/reset")
         assert reset_response.status_code == 200
-        assert reset_response.json()["success"] is True
+        assert json_body(reset_response)["success"] is True
         
         # Verify data cleared
         response = client.get("/ab/metrics")
-        assert response.json()["total_events"] == 0
+        assert json_body(response)["total_events"] == 0
 
 
 class TestMiddlewareIntegration:
@@ -11,39 +11,37 @@ import pytest
 from unittest.mock import Mock, patch, MagicMock
 import json
 
-from services.ab_testing import get_experiment_manager, reset_experiment_manager, ExperimentVariant, SearchEvent
+from tests.helpers import json_body, make_search_result
+from services.ab_testing import get_experiment_manager, ExperimentVariant, SearchEvent
 from services.search_variants import SearchVariantV1, SearchVariantV2, get_search_variant
-from models.search import ProductResult
+from models.search import ProductResult, to_product_results
 
 
 @pytest.fixture
 def cleanup_ab():
-    """Cleanup A/B testing data before and after tests."""
-    reset_experiment_manager()
+    """Clear A/B testing data in place before and after tests."""
+    manager = get_experiment_manager()
+    manager.reset()
     yield
-    reset_experiment_manager()
+    manager.reset()
 
 
 class TestSearchVariantsDirectly:
     """Direct tests for search variants without endpoint dependencies."""
     
-    @patch('services.search_variants.get_search_service')
-    def test_v1_returns_results(self, mock_get_service, cleanup_ab):
+    def test_v1_returns_results(self, patched_search_service, cleanup_ab):
         """Test that V1 search returns results."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_001"
-        mock_result.title = "Blue Shoes"
-        mock_result.description = "Running shoes"
-        mock_result.color = "blue"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/img.jpg"
-        mock_result.similarity = 0.95
-        mock_result.distance = 0.05
-        mock_result.debug_scores = None
-        
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
+        mock_result = make_search_result(
+            product_id="prod_001",
+            title="Blue Shoes",
+            description="Running shoes",
+            color="blue",
+            image_path="/img.jpg",
+            similarity=0.95,
+            distance=0.05
+        )
+        
+        patched_search_service.search_by_text.return_value = [mock_result]
         
         results, elapsed = SearchVariantV1.search_by_text("test")
         
@@ -51,102 +49,90 @@ class TestSearchVariantsDirectly:
         assert isinstance(results[0], ProductResult)
         assert results[0].product_id == "prod_001"
     
-    @patch('services.search_variants.get_search_service')
-    def test_v2_returns_results(self, mock_get_service, cleanup_ab):
+    def test_v2_returns_results(self, patched_search_service, cleanup_ab):
         """Test that V2 search returns results."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_002"
-        mock_result.title = "Red Shoes"
-        mock_result.description = "Casual shoes"
-        mock_result.color = "red"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/img2.jpg"
-        mock_result.similarity = 0.88
-        mock_result.distance = 0.12
-        mock_result.debug_scores = None
-        
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
+        mock_result = make_search_result(
+            product_id="prod_002",
+            title="Red Shoes",
+            description="Casual shoes",
+            color="red",
+            image_path="/img2.jpg",
+            similarity=0.88,
+            distance=0.12
+        )
+        
+        patched_search_service.search_by_text.return_value = [mock_result]
         
         results, elapsed = SearchVariantV2.search_by_text("test")
         
         assert len(results) == 1
         assert results[0].product_id == "prod_002"
     
-    @patch('services.search_variants.get_search_service')
-    def test_v1_disables_reranking(self, mock_get_service, cleanup_ab):
+    def test_v1_disables_reranking(self, patched_search_service, cleanup_ab):
         """Test that V1 disables re-ranking."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = []
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = []
         
         SearchVariantV1.search_by_text("test")
         
         # Check that enable_reranking=False was passed
-        call_kwargs = mock_service.search_by_text.call_args[1]
+        call_kwargs = patched_search_service.search_by_text.call_args[1]
         assert call_kwargs['enable_reranking'] is False
     
-    @patch('services.search_variants.get_search_service')
-    def test_v2_enables_reranking(self, mock_get_service, cleanup_ab):
+    def test_v2_enables_reranking(self, patched_search_service, cleanup_ab):
         """Test that V2 enables re-ranking."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = []
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = []
         
         SearchVariantV2.search_by_text("test")
         
         # Check that enable_reranking=True was passed
-        call_kwargs = mock_service.search_by_text.call_args[1]
+        call_kwargs = patched_search_service.search_by_text.call_args[1]
         assert call_kwargs['enable_reranking'] is True
+
+
+@pytest.mark.anyio
+class TestABSearchTextEndpoint:
     """Tests for /search-ab/text endpoint."""
     
     @patch('api.ab_search.get_search_variant')
-    def test_text_search_success(self, mock_get_variant, client, cleanup_ab):
+    async def test_text_search_success(self, mock_get_variant, aclient, cleanup_ab):
         """Test successful text search with A/B variant."""
         # Mock search variant
         mock_variant = Mock()
         mock_variant.search_by_text.return_value = (
-            [
-                Mock(
-                    product_id="prod_001",
+            to_product_results([
+                make_search_result(
                     title="Blue Shoes",
                     description="Running shoes",
-                    color="blue",
-                    category="footwear",
-                    image_path="/img.jpg",
-                    similarity=0.95,
-                    distance=0.05,
-                    debug_scores=None
+                    image_path="/img.jpg"
                 )
-            ],
+            ]),
             45.2  # elapsed_ms
         )
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=blue%20shoes&top_k=5",
             headers={"X-User-ID": "user123"}
         )
         
         # Assert
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["query"] == "blue shoes"
         assert len(data["results"]) == 1
         assert data["results"][0]["product_id"] == "prod_001"
         assert data["total_results"] == 1
     
     @patch('api.ab_search.get_search_variant')
-    def test_text_search_event_logged(self, mock_get_variant, client, cleanup_ab):
+    async def test_text_search_event_logged(self, mock_get_variant, aclient, cleanup_ab):
         """Test that search event is logged to A/B framework."""
         mock_variant = Mock()
         mock_variant.search_by_text.return_value = ([], 10.0)
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=test&top_k=10",
             headers={"X-User-ID": "user123"}
         )
@@ -158,19 +144,19 @@ class TestSearchVariantsDirectly:
         manager = get_experiment_manager()
         events = manager.get_events(user_id="user123")
         assert len(events) == 1
-        assert events[0]["event_type"] == "search"
-        assert "test" in events[0]["query"]
-        assert events[0]["results_count"] == 0
+        assert events[0].event_type == "search"
+        assert "test" in events[0].query
+        assert events[0].results_count == 0
     
     @patch('api.ab_search.get_search_variant')
-    def test_text_search_with_filters(self, mock_get_variant, client, cleanup_ab):
+    async def test_text_search_with_filters(self, mock_get_variant, aclient, cleanup_ab):
         """Test text search with category and color filters."""
         mock_variant = Mock()
         mock_variant.search_by_text.return_value = ([], 10.0)
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=shoes&category=footwear&color=blue&top_k=5",
             headers={"X-User-ID": "user123"}
         )
@@ -184,10 +170,10 @@ class TestSearchVariantsDirectly:
         assert call_kwargs['color_filter'] == "blue"
     
     @patch('api.ab_search.get_search_variant')
-    def test_text_search_missing_query(self, mock_get_variant, client, cleanup_ab):
+    async def test_text_search_missing_query(self, mock_get_variant, aclient, cleanup_ab):
         """Test text search without required query parameter."""
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text",
             headers={"X-User-ID": "user123"}
         )
@@ -196,20 +182,20 @@ class TestSearchVariantsDirectly:
         assert response.status_code == 422  # Unprocessable Entity
     
     @patch('api.ab_search.get_search_variant')
-    def test_text_search_variant_assignment(self, mock_get_variant, client, cleanup_ab):
+    async def test_text_search_variant_assignment(self, mock_get_variant, aclient, cleanup_ab):
         """Test that variant is correctly assigned to user."""
         mock_variant = Mock()
         mock_variant.search_by_text.return_value = ([], 10.0)
         mock_get_variant.return_value = mock_variant
         
         # Execute first search (triggers assignment)
-        response1 = client.post(
+        response1 = await aclient.post(
             "/search-ab/text?query=test1",
             headers={"X-User-ID": "user123"}
         )
         
         # Execute second search (should get same variant)
-        response2 = client.post(
+        response2 = await aclient.post(
             "/search-ab/text?query=test2",
             headers={"X-User-ID": "user123"}
         )
@@ -225,34 +211,29 @@ class TestSearchVariantsDirectly:
         assert assignment.variant in [ExperimentVariant.SEARCH_V1, ExperimentVariant.SEARCH_V2]
 
 
+@pytest.mark.anyio
 class TestABSearchImageEndpoint:
     """Tests for /search-ab/image endpoint."""
     
     @patch('api.ab_search.get_search_variant')
-    def test_image_search_success(self, mock_get_variant, client, cleanup_ab):
+    async def test_image_search_success(self, mock_get_variant, aclient, cleanup_ab):
         """Test successful image search with A/B variant."""
         # Mock search variant
         mock_variant = Mock()
         mock_variant.search_by_image.return_value = (
-            [
-                Mock(
-                    product_id="prod_001",
+            to_product_results([
+                make_search_result(
                     title="Blue Shoes",
                     description="Running shoes",
-                    color="blue",
-                    category="footwear",
-                    image_path="/img.jpg",
-                    similarity=0.95,
-                    distance=0.05,
-                    debug_scores=None
+                    image_path="/img.jpg"
                 )
-            ],
+            ]),
             52.1  # elapsed_ms
         )
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/image?top_k=5",
             files={"file": ("test.jpg", b"fake_image_data", "image/jpeg")},
             headers={"X-User-ID": "user456"}
@@ -260,20 +241,20 @@ class TestABSearchImageEndpoint:
         
         # Assert
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["filename"] == "test.jpg"
         assert len(data["results"]) == 1
         assert data["total_results"] == 1
     
     @patch('api.ab_search.get_search_variant')
-    def test_image_search_event_logged(self, mock_get_variant, client, cleanup_ab):
+    async def test_image_search_event_logged(self, mock_get_variant, aclient, cleanup_ab):
         """Test that image search event is logged."""
         mock_variant = Mock()
         mock_variant.search_by_image.return_value = ([], 20.0)
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/image?top_k=5",
             files={"file": ("test.jpg", b"fake_image_data", "image/jpeg")},
             headers={"X-User-ID": "user456"}
@@ -286,15 +267,15 @@ class TestABSearchImageEndpoint:
         manager = get_experiment_manager()
         events = manager.get_events(user_id="user456")
         assert len(events) == 1
-        assert events[0]["event_type"] == "search"
-        assert "[image:" in events[0]["query"]
-        assert "test.jpg" in events[0]["query"]
+        assert events[0].event_type == "search"
+        assert "[image:" in events[0].query
+        assert "test.jpg" in events[0].query
     
     @patch('api.ab_search.get_search_variant')
-    def test_image_search_invalid_file(self, mock_get_variant, client, cleanup_ab):
+    async def test_image_search_invalid_file(self, mock_get_variant, aclient, cleanup_ab):
         """Test image search with invalid file type."""
         # Execute with non-image file
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/image?top_k=5",
             files={"file": ("test.txt", b"not_an_image", "text/plain")},
             headers={"X-User-ID": "user456"}
@@ -302,13 +283,28 @@ class TestABSearchImageEndpoint:
         
         # Assert
         assert response.status_code == 400
-        assert "image" in response.json()["detail"].lower()
+        assert "image" in json_body(response)["detail"].lower()
+    
+    @patch('api.ab_search.settings.MAX_IMAGE_UPLOAD_BYTES', 4)
+    @patch('api.ab_search.get_search_variant')
+    async def test_image_search_too_large(self, mock_get_variant, aclient, cleanup_ab):
+        """Test image search rejects uploads over the size limit."""
+        # Execute with a file larger than the patched limit
+        response = await aclient.post(
+            "/search-ab/image?top_k=5",
+            files={"file": ("test.jpg", b"fake_image_data", "image/jpeg")},
+            headers={"X-User-ID": "user456"}
+        )
+        
+        # Assert
+        assert response.status_code == 413
+        mock_get_variant.assert_not_called()
     
     @patch('api.ab_search.get_search_variant')
-    def test_image_search_missing_file(self, mock_get_variant, client, cleanup_ab):
+    async def test_image_search_missing_file(self, mock_get_variant, aclient, cleanup_ab):
         """Test image search without file."""
         # Execute without file
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/image?top_k=5",
             headers={"X-User-ID": "user456"}
         )
@@ -317,17 +313,18 @@ class TestABSearchImageEndpoint:
         assert response.status_code == 422  # Validation error
 
 
+@pytest.mark.anyio
 class TestABSearchVariantsEndpoint:
     """Tests for /search-ab/variants endpoint."""
     
-    def test_get_available_variants(self, client):
+    async def test_get_available_variants(self, aclient):
         """Test getting list of available variants."""
         # Execute
-        response = client.get("/search-ab/variants")
+        response = await aclient.get("/search-ab/variants")
         
         # Assert
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "variants" in data
         assert len(data["variants"]) == 2
         
@@ -335,86 +332,89 @@ class TestABSearchVariantsEndpoint:
         assert "search_v1" in variant_names
         assert "search_v2" in variant_names
     
-    def test_variants_have_descriptions(self, client):
+    async def test_variants_have_descriptions(self, aclient):
         """Test that variants have descriptions."""
         # Execute
-        response = client.get("/search-ab/variants")
+        response = await aclient.get("/search-ab/variants")
         
         # Assert
-        data = response.json()
+        data = json_body(response)
         for variant in data["variants"]:
             assert "name" in variant
             assert "description" in variant
             assert variant["description"]  # Not empty
 
 
+@pytest.mark.anyio
 class TestABSearchVariantInfoEndpoint:
     """Tests for /search-ab/variant-info/{variant_name} endpoint."""
     
-    def test_variant_info_v1(self, client):
+    async def test_variant_info_v1(self, aclient):
         """Test getting info for search_v1."""
         # Execute
-        response = client.get("/search-ab/variant-info/search_v1")
+        response = await aclient.get("/search-ab/variant-info/search_v1")
         
         # Assert
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["name"] == "search_v1"
         assert data["type"] == "baseline"
         assert "vector_similarity" in data["scoring_factors"]
         assert data["reranking_enabled"] is False
     
-    def test_variant_info_v2(self, client):
+    async def test_variant_info_v2(self, aclient):
         """Test getting info for search_v2."""
         # Execute
-        response = client.get("/search-ab/variant-info/search_v2")
+        response = await aclient.get("/search-ab/variant-info/search_v2")
         
         # Assert
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["name"] == "search_v2"
         assert data["type"] == "enhanced"
-        assert "vector_similarity" in data["scoring_factors"]
-        assert "color_match" in data["scoring_factors"]
-        assert "category_match" in data["scoring_factors"]
-        assert "text_similarity" in data["scoring_factors"]
+        # V2 factors carry their ranking weight, e.g. "color_match (0.2)"
+        factor_names = {factor.split(" ")[0] for factor in data["scoring_factors"]}
+        assert factor_names == {
+            "vector_similarity", "color_match", "category_match", "text_similarity"
+        }
         assert data["reranking_enabled"] is True
     
-    def test_variant_info_invalid(self, client):
+    async def test_variant_info_invalid(self, aclient):
         """Test getting info for invalid variant."""
         # Execute
-        response = client.get("/search-ab/variant-info/search_v3")
+        response = await aclient.get("/search-ab/variant-info/search_v3")
         
         # Assert
         assert response.status_code == 404
-        assert "Unknown variant" in response.json()["detail"]
+        assert "Unknown variant" in json_body(response)["detail"]
 
 
+@pytest.mark.anyio
 class TestABSearchErrorHandling:
     """Tests for error handling in A/B search endpoints."""
     
     @patch('api.ab_search.get_search_variant')
-    def test_search_service_error(self, mock_get_variant, client, cleanup_ab):
+    async def test_search_service_error(self, mock_get_variant, aclient, cleanup_ab):
         """Test handling of search service errors."""
         mock_variant = Mock()
         mock_variant.search_by_text.side_effect = RuntimeError("Service error")
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=test",
             headers={"X-User-ID": "user123"}
         )
         
         # Assert
         assert response.status_code == 500
-        assert "failed" in response.json()["detail"].lower()
+        assert "failed" in json_body(response)["detail"].lower()
     
     @patch('api.ab_search.get_search_variant')
-    def test_invalid_top_k(self, mock_get_variant, client, cleanup_ab):
+    async def test_invalid_top_k(self, mock_get_variant, aclient, cleanup_ab):
         """Test validation of top_k parameter."""
         # Execute with top_k > 100
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=test&top_k=150",
             headers={"X-User-ID": "user123"}
         )
@@ -423,10 +423,10 @@ class TestABSearchErrorHandling:
         assert response.status_code == 422  # Validation error
     
     @patch('api.ab_search.get_search_variant')
-    def test_zero_top_k(self, mock_get_variant, client, cleanup_ab):
+    async def test_zero_top_k(self, mock_get_variant, aclient, cleanup_ab):
         """Test validation that top_k must be >= 1."""
         # Execute with top_k = 0
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=test&top_k=0",
             headers={"X-User-ID": "user123"}
         )
@@ -435,18 +435,19 @@ class TestABSearchErrorHandling:
         assert response.status_code == 422  # Validation error
 
 
+@pytest.mark.anyio
 class TestABSearchMetrics:
     """Tests for metrics related to A/B search."""
     
     @patch('api.ab_search.get_search_variant')
-    def test_search_timing_captured(self, mock_get_variant, client, cleanup_ab):
+    async def test_search_timing_captured(self, mock_get_variant, aclient, cleanup_ab):
         """Test that search timing is captured in events."""
         mock_variant = Mock()
         mock_variant.search_by_text.return_value = ([], 42.5)  # 42.5ms
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=test",
             headers={"X-User-ID": "user123"}
         )
@@ -458,18 +459,20 @@ class TestABSearchMetrics:
         manager = get_experiment_manager()
         events = manager.get_events(user_id="user123")
         assert len(events) == 1
-        assert events[0]["search_time_ms"] is not None
+        assert events[0].search_time_ms is not None
     
     @patch('api.ab_search.get_search_variant')
-    def test_results_count_captured(self, mock_get_variant, client, cleanup_ab):
+    async def test_results_count_captured(self, mock_get_variant, aclient, cleanup_ab):
         """Test that result count is captured in events."""
         mock_variant = Mock()
-        results = [Mock() for _ in range(5)]
+        results = to_product_results(
+            make_search_result(product_id=f"prod_{i:03d}") for i in range(5)
+        )
         mock_variant.search_by_text.return_value = (results, 10.0)
         mock_get_variant.return_value = mock_variant
         
         # Execute
-        response = client.post(
+        response = await aclient.post(
             "/search-ab/text?query=test&top_k=5",
             headers={"X-User-ID": "user123"}
         )
@@ -480,4 +483,4 @@ class TestABSearchMetrics:
         # Verify result count in event
         manager = get_experiment_manager()
         events = manager.get_events(user_id="user123")
-        assert events[0]["results_count"] == 5
+        assert events[0].results_count == 5
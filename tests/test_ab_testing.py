@@ -2,6 +2,7 @@
 Tests for A/B testing module.
 """
 
+import contextvars
 import pytest
 from datetime import datetime
 from unittest.mock import Mock, patch
@@ -13,6 +14,7 @@ from services.ab_testing import (
     SearchEvent,
     ClickEvent,
     get_experiment_manager,
+    set_experiment_manager,
     reset_experiment_manager
 )
 
@@ -85,6 +87,17 @@ class TestExperimentAssignment:
         
         # Allow 10% deviation from expected 70%
         assert 0.6 < v1_ratio < 0.8
+    
+    def test_assign_variants_bulk(self, manager, user_id):
+        """Test bulk assignment keeps existing users and assigns new ones."""
+        existing = manager.assign_variant(user_id)
+        
+        assignments = manager.assign_variants_bulk([user_id, "bulk_1", "bulk_2"])
+        
+        assert assignments[user_id] is existing
+        assert set(assignments) == {user_id, "bulk_1", "bulk_2"}
+        assert manager.get_assignment("bulk_1") is assignments["bulk_1"]
+        assert assignments["bulk_2"].variant in [ExperimentVariant.SEARCH_V1, ExperimentVariant.SEARCH_V2]
 
 
 class TestSearchEvent:
@@ -313,6 +326,44 @@ class TestEventFiltering:
         
         events = manager.get_events(variant=ExperimentVariant.SEARCH_V1)
         assert len(events) >= 1
+    
+    def test_event_log_bounded(self, manager):
+        """Test every read path keeps the same most recent events."""
+        manager.event_retention = 3
+        
+        for i in range(5):
+            manager.log_search("user1", f"query{i}", 5)
+        manager.log_click("user2", "prod1")
+        
+        recent = ["query3", "query4"]
+        assert [e.query for e in manager.get_events(user_id="user1")] == recent
+        assert [e.query for e in manager.get_events(event_type="search")] == recent
+        assert len(manager.get_events()) == 3
+        assert manager.get_metrics()["total_events"] == 3
+        
+        variant = manager.get_assignment("user1").variant
+        assert "query1" not in [e.query for e in manager.get_events(variant=variant)]
+    
+    def test_event_log_eviction_drops_empty_index_keys(self, manager):
+        """Test evicted users no longer hold index entries."""
+        manager.event_retention = 2
+        
+        for i in range(4):
+            manager.log_search(f"user{i}", "query", 5)
+        
+        assert set(manager._events_by_user) == {"user2", "user3"}
+        assert manager.get_events(user_id="user0") == []
+    
+    def test_get_events_by_user_limit(self, manager):
+        """Test per-user reads return the newest events up to the limit."""
+        for i in range(5):
+            manager.log_search("user1", f"query{i}", 5)
+        manager.log_click("user1", "prod1")
+        
+        events = manager.get_events(user_id="user1", limit=3)
+        assert [getattr(e, "query", None) for e in events] == ["query3", "query4", None]
+        assert len(manager.get_events(user_id="user1", event_type="search", limit=10)) == 5
+        assert manager.get_events(user_id="nobody") == []
 
 
 class TestReset:
@@ -357,3 +408,16 @@ class TestGlobalInstance:
         manager2 = get_experiment_manager()
         
         assert manager1 is not manager2
+    
+    def test_set_experiment_manager_is_context_local(self):
+        """Test that an override only applies to the current context."""
+        reset_experiment_manager()
+        shared = get_experiment_manager()
+        override = ExperimentManager(storage_backend="memory")
+        
+        def in_other_context():
+            set_experiment_manager(override)
+            return get_experiment_manager()
+        
+        assert contextvars.copy_context().run(in_other_context) is override
+        assert get_experiment_manager() is shared
@@ -3,13 +3,16 @@ Tests for PersonalShopperAgent API endpoint.
 """
 import pytest
 import json
-from unittest.mock import MagicMock, patch, AsyncMock
-from fastapi.testclient import TestClient
+from types import SimpleNamespace
+from urllib.parse import urlencode
+from unittest.mock import MagicMock, patch, create_autospec
 
-from main import app
+from services.search_service import ProductSearchService
+from tests.helpers import json_body
 
 
-client = TestClient(app)
+# Endpoint tests run on the shared async client
+pytestmark = pytest.mark.anyio
 
 
 def dummy_search_results():
@@ -48,66 +51,84 @@ def dummy_search_results():
     ]
 
 
-def dummy_llm_response():
-    """Generate a mock LLM response."""
-    return json.dumps({
-        "recommendations": [
-            {
-                "title": "Blue Casual Shirt",
-                "why": "Matches your preference for casual blue apparel and comfortable materials",
-                "is_wildcard": False
-            },
-            {
-                "title": "Black Formal Blazer",
-                "why": "Complements your style with a professional piece",
-                "is_wildcard": False
-            },
-            {
-                "title": "Navy Chinos",
-                "why": "Versatile neutral piece that works with multiple outfits",
-                "is_wildcard": False
-            },
-            {
-                "title": "Vintage Denim Jacket",
-                "why": "A wildcard piece that adds character and edge",
-                "is_wildcard": True
-            }
-        ]
-    })
+# Search results only need attribute access, so plain namespaces built once suffice
+_DUMMY_RESULTS = [SimpleNamespace(**result) for result in dummy_search_results()]
+
+# Static LLM payload as a JSON literal, checked once at import
+_DUMMY_LLM_RESPONSE = (
+    '{"recommendations":['
+    '{"title":"Blue Casual Shirt",'
+    '"why":"Matches your preference for casual blue apparel and comfortable materials",'
+    '"is_wildcard":false},'
+    '{"title":"Black Formal Blazer",'
+    '"why":"Complements your style with a professional piece",'
+    '"is_wildcard":false},'
+    '{"title":"Navy Chinos",'
+    '"why":"Versatile neutral piece that works with multiple outfits",'
+    '"is_wildcard":false},'
+    '{"title":"Vintage Denim Jacket",'
+    '"why":"A wildcard piece that adds character and edge",'
+    '"is_wildcard":true}'
+    ']}'
+)
+assert len(json.loads(_DUMMY_LLM_RESPONSE)["recommendations"]) == 4
+
+
+# Form bodies, urlencoded once and posted as raw content
+_FORM_HEADERS = {"content-type": "application/x-www-form-urlencoded"}
+_TEXT_QUERY_BODY = urlencode({"user_id": "user123", "query": "blue casual shirt", "top_k": "3"}).encode()
+_BLUE_SHIRT_BODY = urlencode({"user_id": "user123", "query": "blue shirt"}).encode()
+_USER_ONLY_BODY = urlencode({"user_id": "user123"}).encode()
+
+# Search service and LLM mocks, built once and reset after each test
+_SEARCH_MOCK_TEMPLATE = create_autospec(ProductSearchService, instance=True)
+_LLM_MOCK_TEMPLATE = MagicMock()
 
 
-@patch("services.personal_shopper_agent.retrieve_context")
-@patch("api.agent.get_llm_client")
-@patch("api.agent.get_search_service")
-def test_recommend_with_text_query(mock_search, mock_llm, mock_context):
+def dummy_llm_response():
+    """Return the static mock LLM response."""
+    return _DUMMY_LLM_RESPONSE
+
+
+@pytest.fixture
+def agent_mocks():
+    """Patch search service, LLM client and context retrieval with pre-wired mocks."""
+    with patch("services.personal_shopper_agent.retrieve_context") as mock_context, \
+            patch("api.agent.get_llm_client") as mock_llm, \
+            patch("api.agent.get_search_service") as mock_search:
+        mock_search_instance = _SEARCH_MOCK_TEMPLATE
+        mock_search_instance.search_multimodal.return_value = _DUMMY_RESULTS
+        mock_search.return_value = mock_search_instance
+        
+        mock_context.return_value = "Mocked context"
+        
+        mock_llm_instance = _LLM_MOCK_TEMPLATE
+        mock_llm_instance.generate.return_value = _DUMMY_LLM_RESPONSE
+        mock_llm.return_value = mock_llm_instance
+        
+        yield SimpleNamespace(
+            search=mock_search,
+            llm=mock_llm,
+            context=mock_context,
+            search_instance=mock_search_instance,
+            llm_instance=mock_llm_instance,
+        )
+    
+    _SEARCH_MOCK_TEMPLATE.reset_mock()
+    _LLM_MOCK_TEMPLATE.reset_mock()
+
+
+async def test_recommend_with_text_query(agent_mocks, aclient):
     """Test recommendations with text query."""
-    # Mock search service
-    mock_search_instance = MagicMock()
-    mock_search_instance.search_multimodal.return_value = [
-        MagicMock(**result) for result in dummy_search_results()
-    ]
-    mock_search.return_value = mock_search_instance
-    
-    # Mock context retriever
-    mock_context.return_value = "Mocked user preferences and search results"
-    
-    # Mock LLM client
-    mock_llm_instance = MagicMock()
-    mock_llm_instance.generate.return_value = dummy_llm_response()
-    mock_llm.return_value = mock_llm_instance
-    
     # Send request
-    response = client.post(
+    response = await aclient.post(
         "/agent/recommend",
-        data={
-            "user_id": "user123",
-            "query": "blue casual shirt",
-            "top_k": 3,
-        }
+        content=_TEXT_QUERY_BODY,
+        headers=_FORM_HEADERS
     )
     
     assert response.status_code == 200
-    data = response.json()
+    data = json_body(response)
     
     assert data["user_id"] == "user123"
     assert data["query"] == "blue casual shirt"
@@ -126,171 +147,99 @@ def test_recommend_with_text_query(mock_search, mock_llm, mock_context):
     assert wildcard["is_wildcard"] is True
 
 
-@patch("api.agent.get_llm_client")
-@patch("api.agent.get_search_service")
-def test_recommend_missing_inputs(mock_search, mock_llm):
+async def test_recommend_missing_inputs(aclient):
     """Test that endpoint rejects missing query and image."""
-    response = client.post(
+    response = await aclient.post(
         "/agent/recommend",
-        data={
-            "user_id": "user123",
-        }
+        content=_USER_ONLY_BODY,
+        headers=_FORM_HEADERS
     )
     
     assert response.status_code == 400
-    assert "at least one of" in response.json()["detail"].lower()
+    assert b"at least one of" in response.content.lower()
 
 
-@patch("api.agent.get_llm_client")
+@patch("api.agent.get_llm_client", return_value=None)
 @patch("api.agent.get_search_service")
-def test_recommend_without_llm_client(mock_search, mock_llm):
+async def test_recommend_without_llm_client(mock_search, mock_llm, aclient):
     """Test error handling when LLM client is not configured."""
-    # Mock search service
-    mock_search_instance = MagicMock()
-    mock_search_instance.search_multimodal.return_value = [
-        MagicMock(**result) for result in dummy_search_results()
-    ]
-    mock_search.return_value = mock_search_instance
+    # Search runs before the LLM client lookup, so it still needs a mock
+    mock_search.return_value.search_multimodal.return_value = _DUMMY_RESULTS
     
-    # Mock LLM client as None
-    mock_llm.return_value = None
-    
-    response = client.post(
+    response = await aclient.post(
         "/agent/recommend",
-        data={
-            "user_id": "user123",
-            "query": "blue shirt",
-        }
+        content=_BLUE_SHIRT_BODY,
+        headers=_FORM_HEADERS
     )
     
     assert response.status_code == 500
-    assert "LLM client" in response.json()["detail"]
+    assert b"LLM client" in response.content
 
 
-@patch("services.personal_shopper_agent.retrieve_context")
-@patch("api.agent.get_llm_client")
-@patch("api.agent.get_search_service")
-def test_recommend_with_custom_weights(mock_search, mock_llm, mock_context):
+async def test_recommend_with_custom_weights(agent_mocks, aclient):
     """Test multimodal search with custom weights."""
-    # Mock search service
-    mock_search_instance = MagicMock()
-    mock_search_instance.search_multimodal.return_value = [
-        MagicMock(**result) for result in dummy_search_results()
-    ]
-    mock_search.return_value = mock_search_instance
-    
-    # Mock context retriever
-    mock_context.return_value = "Mocked context"
-    
-    # Mock LLM client
-    mock_llm_instance = MagicMock()
-    mock_llm_instance.generate.return_value = dummy_llm_response()
-    mock_llm.return_value = mock_llm_instance
-    
     # Send request with custom weights
-    response = client.post(
+    response = await aclient.post(
         "/agent/recommend?top_k=3&image_weight=0.7&text_weight=0.3",
-        data={
-            "user_id": "user123",
-            "query": "blue shirt",
-        }
+        content=_BLUE_SHIRT_BODY,
+        headers=_FORM_HEADERS
     )
     
     assert response.status_code == 200
     
     # Verify search was called with custom weights
-    mock_search_instance.search_multimodal.assert_called_once()
-    call_kwargs = mock_search_instance.search_multimodal.call_args[1]
+    agent_mocks.search_instance.search_multimodal.assert_called_once()
+    call_kwargs = agent_mocks.search_instance.search_multimodal.call_args[1]
     assert call_kwargs["image_weight"] == 0.7
     assert call_kwargs["text_weight"] == 0.3
 
 
-@patch("services.personal_shopper_agent.retrieve_context")
-@patch("api.agent.get_llm_client")
-@patch("api.agent.get_search_service")
-def test_recommend_response_structure(mock_search, mock_llm, mock_context):
-    """Test the response structure matches RecommendResponse model."""
-    # Mock search service
-    mock_search_instance = MagicMock()
-    mock_search_instance.search_multimodal.return_value = [
-        MagicMock(**result) for result in dummy_search_results()[:2]
-    ]
-    mock_search.return_value = mock_search_instance
-    
-    # Mock context retriever
-    mock_context.return_value = "Mocked context"
-    
-    # Mock LLM client
-    mock_llm_instance = MagicMock()
-    mock_llm_instance.generate.return_value = dummy_llm_response()
-    mock_llm.return_value = mock_llm_instance
-    
-    response = client.post(
-        "/agent/recommend",
-        data={
-            "user_id": "user123",
-            "query": "blue shirt",
-        }
-    )
-    
-    assert response.status_code == 200
-    data = response.json()
+def test_recommend_response_schema(app):
+    """Test the RecommendResponse contract published in the OpenAPI schema."""
+    schemas = app.openapi()["components"]["schemas"]
     
     # Check all required fields are present
-    assert "user_id" in data
-    assert "query" in data
-    assert "image_filename" in data
-    assert "recommendations" in data
-    assert "search_results_count" in data
-    assert "llm_prompt_summary" in data
+    assert {
+        "user_id",
+        "query",
+        "image_filename",
+        "recommendations",
+        "search_results_count",
+        "llm_prompt_summary",
+    } <= schemas["RecommendResponse"]["properties"].keys()
     
     # Check recommendation structure
-    for rec in data["recommendations"]:
-        assert "rank" in rec
-        assert "title" in rec
-        assert "description" in rec
-        assert "is_wildcard" in rec
-        assert "product_link" in rec
+    assert {
+        "rank",
+        "title",
+        "description",
+        "is_wildcard",
+        "product_link",
+    } <= schemas["Recommendation"]["properties"].keys()
 
 
-@patch("services.personal_shopper_agent.retrieve_context")
-@patch("api.agent.get_llm_client")
-@patch("api.agent.get_search_service")
-def test_recommend_with_invalid_llm_response(mock_search, mock_llm, mock_context):
+async def test_recommend_with_invalid_llm_response(agent_mocks, aclient):
     """Test fallback when LLM returns invalid JSON."""
-    # Mock search service
-    mock_search_instance = MagicMock()
-    results = [MagicMock(**result) for result in dummy_search_results()]
-    mock_search_instance.search_multimodal.return_value = results
-    mock_search.return_value = mock_search_instance
-    
-    # Mock context retriever
-    mock_context.return_value = "Mocked context"
-    
-    # Mock LLM client with invalid response
-    mock_llm_instance = MagicMock()
-    mock_llm_instance.generate.return_value = "This is not JSON"
-    mock_llm.return_value = mock_llm_instance
+    # LLM client with invalid response
+    agent_mocks.llm_instance.generate.return_value = "This is not JSON"
     
-    response = client.post(
+    response = await aclient.post(
         "/agent/recommend",
-        data={
-            "user_id": "user123",
-            "query": "blue shirt",
-        }
+        content=_BLUE_SHIRT_BODY,
+        headers=_FORM_HEADERS
     )
     
     # Should still succeed with fallback recommendations
     assert response.status_code == 200
-    data = response.json()
+    data = json_body(response)
     assert len(data["recommendations"]) > 0
 
 
-def test_root_endpoint_includes_recommend():
+async def test_root_endpoint_includes_recommend(aclient):
     """Test that root endpoint includes /agent/recommend."""
-    response = client.get("/")
+    response = await aclient.get("/")
     assert response.status_code == 200
-    data = response.json()
+    data = json_body(response)
     assert "recommend" in data["endpoints"]
     assert data["endpoints"]["recommend"] == "/agent/recommend"
 
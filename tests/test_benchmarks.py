@@ -0,0 +1,97 @@
+"""
+Microbenchmarks for the ranking and preference extraction hot paths.
+
+Skipped by the default run (see --benchmark-skip in pytest.ini); the CI
+benchmark job runs them with --benchmark-only and compares against the
+previous saved run.
+"""
+import pytest
+import sys
+import importlib.util
+from pathlib import Path
+
+parent_dir = Path(__file__).parent.parent
+
+
+def _load_module(name: str, filename: str):
+    """Load a services module directly, executing it only once per process."""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            name, parent_dir / "services" / filename
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+rerank_results = _load_module("ranking_module", "ranking.py").rerank_results
+PreferenceAnalyzer = _load_module(
+    "preference_analyzer", "preference_analyzer.py"
+).PreferenceAnalyzer
+
+
+_COLORS = ("blue", "red", "black", "white", "navy", "green", "beige", "gray")
+_CATEGORIES = ("apparel", "footwear", "accessories", "bags")
+_PRODUCTS = ("Shirt", "Dress", "Jeans", "Sneakers", "Jacket", "Backpack", "Watch")
+_STYLES = ("Casual", "Formal", "Vintage", "Slim", "Premium", "Classic")
+
+
+def _title(i: int) -> str:
+    """Deterministic, realistic-looking product title."""
+    return (
+        f"{_STYLES[i % len(_STYLES)]} {_COLORS[i % len(_COLORS)].title()} "
+        f"Cotton {_PRODUCTS[i % len(_PRODUCTS)]} #{i}"
+    )
+
+
+@pytest.fixture(scope="module")
+def search_results():
+    """1,000 search results as rerank_results receives them."""
+    return [
+        {
+            "product_id": f"prod{i}",
+            "title": _title(i),
+            "description": f"Description for {_title(i)}",
+            "category": _CATEGORIES[i % len(_CATEGORIES)],
+            "color": _COLORS[i % len(_COLORS)],
+            "similarity": (i % 997) / 997,
+        }
+        for i in range(1000)
+    ]
+
+
+@pytest.fixture(scope="module")
+def purchase_titles():
+    """10,000 past purchase titles."""
+    return [_title(i) for i in range(10_000)]
+
+
+@pytest.mark.benchmark(group="ranking", min_rounds=50, disable_gc=True)
+def test_rerank_results_benchmark(benchmark, search_results):
+    """Re-rank 1,000 results with text, color and category signals."""
+    reranked = benchmark(
+        rerank_results, search_results, "blue shirt", "blue", "apparel"
+    )
+
+    assert len(reranked) == len(search_results)
+
+
+@pytest.mark.benchmark(group="preferences", min_rounds=50, disable_gc=True)
+def test_extract_colors_benchmark(benchmark, purchase_titles):
+    """Extract dominant colors from 10,000 titles."""
+    colors = benchmark(PreferenceAnalyzer().extract_colors, purchase_titles)
+
+    assert next(iter(colors)) in _COLORS
+
+
+@pytest.mark.benchmark(group="preferences", min_rounds=50, disable_gc=True)
+def test_analyze_preferences_benchmark(benchmark, purchase_titles):
+    """Run the full preference analysis over 10,000 purchases."""
+    categories = [_CATEGORIES[i % len(_CATEGORIES)] for i in range(len(purchase_titles))]
+
+    analysis = benchmark(
+        PreferenceAnalyzer().analyze_preferences, purchase_titles, categories
+    )
+
+    assert analysis["purchase_count"] == len(purchase_titles)
@@ -11,76 +11,149 @@ Tests cover:
 - Variant comparison
 - Analytics reset
 """
+import orjson
 import pytest
-from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
-from main import app
-from services.click_tracking import reset_click_tracker
-from api.ab_middleware import get_user_id, get_session_id
+from services.click_tracking import (
+    ClickTrackingService,
+    ClickEvent,
+    SearchImpression,
+    get_click_tracker,
+    reset_click_tracker
+)
+from tests.helpers import json_body
 
 
-@pytest.fixture
-def client():
-    """Create FastAPI test client."""
-    return TestClient(app)
+# Async tests drive the app through the shared aclient fixture
+pytestmark = pytest.mark.anyio
+
+
+# Canonical request bodies, encoded once and sent as raw content
+_JSON_HEADERS = {"content-type": "application/json"}
+_USER123_JSON_HEADERS = {**_JSON_HEADERS, "X-User-ID": "user123"}
+
+_CLICK_PAYLOAD_BYTES = orjson.dumps({
+    "product_id": "prod_123",
+    "rank": 2,
+    "search_query": "blue shoes",
+    "variant": "search_v1",
+    "response_time_ms": 45.2,
+    "source": "SEARCH_RESULTS"
+})
+
+_IMPRESSION_PAYLOAD_BYTES = orjson.dumps({
+    "query": "blue shoes",
+    "variant": "search_v1",
+    "results_count": 42,
+    "response_time_ms": 45.2
+})
+
+_TEST_CLICK_PAYLOAD_BYTES = orjson.dumps({
+    "product_id": "prod_123",
+    "rank": 0,
+    "search_query": "test",
+    "variant": "search_v1",
+    "response_time_ms": 50.0,
+    "source": "SEARCH_RESULTS"
+})
+
+
+# Set whenever a test writes to the tracker; read-only tests skip the reset
+_tracker_dirty = True
+
+
+def _mark_dirty(method):
+    """Wrap a tracker write method so calls flag the tracker for reset."""
+    def wrapper(self, *args, **kwargs):
+        global _tracker_dirty
+        _tracker_dirty = True
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+@pytest.fixture(scope="module", autouse=True)
+def track_tracker_writes():
+    """Flag the tracker dirty on every click or impression logged in this module."""
+    with patch.object(ClickTrackingService, "log_click", _mark_dirty(ClickTrackingService.log_click)), \
+            patch.object(ClickTrackingService, "log_impression", _mark_dirty(ClickTrackingService.log_impression)):
+        yield
+    reset_click_tracker()
 
 
 @pytest.fixture(autouse=True)
 def reset_tracker():
-    """Reset tracker before each test."""
-    reset_click_tracker()
+    """Reset tracker before a test if the previous one logged data."""
+    global _tracker_dirty
+    if _tracker_dirty:
+        reset_click_tracker()
+        _tracker_dirty = False
     yield
+
+
+@pytest.fixture(scope="class")
+def seeded_tracker():
+    """Tracker seeded once per class with impressions and clicks for both variants."""
+    global _tracker_dirty
+    reset_click_tracker()
+    tracker = get_click_tracker()
+    for i in range(5):
+        variant = "search_v1" if i % 2 == 0 else "search_v2"
+        tracker.log_impression(SearchImpression(
+            user_id="user123",
+            query="test",
+            variant=variant,
+            results_count=10,
+            response_time_ms=50.0
+        ))
+        tracker.log_click(ClickEvent(
+            user_id="user123",
+            product_id=f"prod_{i:03d}",
+            rank=i,
+            search_query="test",
+            variant=variant,
+            response_time_ms=45.0
+        ))
+    # Seeded state is shared by the class, so the per-test reset must not discard it
+    _tracker_dirty = False
+    yield tracker
     reset_click_tracker()
 
 
 class TestClickLoggingEndpoint:
     """Tests for POST /analytics/log-click endpoint."""
     
-    def test_log_click_success(self, client):
+    async def test_log_click_success(self, aclient):
         """Test successful click logging."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-click",
-            json={
-                "product_id": "prod_123",
-                "rank": 2,
-                "search_query": "blue shoes",
-                "variant": "search_v1",
-                "response_time_ms": 45.2,
-                "source": "SEARCH_RESULTS"
-            },
-            headers={"X-User-ID": "user123"}
+            content=_CLICK_PAYLOAD_BYTES,
+            headers=_USER123_JSON_HEADERS
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
         assert data["user_id"] == "user123"
         assert data["product_id"] == "prod_123"
         assert data["rank"] == 2
     
-    def test_log_click_without_user_header(self, client):
+    async def test_log_click_without_user_header(self, aclient):
         """Test click logging without X-User-ID header."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-click",
-            json={
-                "product_id": "prod_123",
-                "rank": 2,
-                "search_query": "blue shoes",
-                "variant": "search_v1",
-                "response_time_ms": 45.2,
-                "source": "SEARCH_RESULTS"
-            }
+            content=_CLICK_PAYLOAD_BYTES,
+            headers=_JSON_HEADERS
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
         # User ID should be auto-generated
         assert "user_id" in data
     
-    def test_log_click_missing_required_field(self, client):
+    async def test_log_click_missing_required_field(self, aclient):
         """Test click logging with missing required field."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-click",
             json={
                 "rank": 2,
@@ -94,9 +167,9 @@ class TestClickLoggingEndpoint:
         
         assert response.status_code == 422  # Validation error
     
-    def test_log_click_with_recommendations_source(self, client):
+    async def test_log_click_with_recommendations_source(self, aclient):
         """Test click logging with RECOMMENDATIONS source."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-click",
             json={
                 "product_id": "prod_123",
@@ -110,12 +183,12 @@ class TestClickLoggingEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
     
-    def test_log_click_response_time_format(self, client):
+    async def test_log_click_response_time_format(self, aclient):
         """Test that response time is preserved in click logging."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-click",
             json={
                 "product_id": "prod_123",
@@ -129,35 +202,30 @@ class TestClickLoggingEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "timestamp" in data
 
 
 class TestImpressionLoggingEndpoint:
     """Tests for POST /analytics/log-impression endpoint."""
     
-    def test_log_impression_success(self, client):
+    async def test_log_impression_success(self, aclient):
         """Test successful impression logging."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-impression",
-            json={
-                "query": "blue shoes",
-                "variant": "search_v1",
-                "results_count": 42,
-                "response_time_ms": 45.2
-            },
-            headers={"X-User-ID": "user123"}
+            content=_IMPRESSION_PAYLOAD_BYTES,
+            headers=_USER123_JSON_HEADERS
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
         assert data["user_id"] == "user123"
         assert data["query"] == "blue shoes"
     
-    def test_log_impression_without_user_header(self, client):
+    async def test_log_impression_without_user_header(self, aclient):
         """Test impression logging without X-User-ID header."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-impression",
             json={
                 "query": "test",
@@ -168,13 +236,13 @@ class TestImpressionLoggingEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
         assert "user_id" in data
     
-    def test_log_impression_zero_results(self, client):
+    async def test_log_impression_zero_results(self, aclient):
         """Test impression logging with zero results."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-impression",
             json={
                 "query": "xyz123",
@@ -186,12 +254,12 @@ class TestImpressionLoggingEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
     
-    def test_log_impression_many_results(self, client):
+    async def test_log_impression_many_results(self, aclient):
         """Test impression logging with many results."""
-        response = client.post(
+        response = await aclient.post(
             "/analytics/log-impression",
             json={
                 "query": "common query",
@@ -203,194 +271,132 @@ class TestImpressionLoggingEndpoint:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
 
 
 class TestCTRMetricsEndpoint:
     """Tests for GET /analytics/ctr endpoint."""
     
-    def test_get_ctr_without_data(self, client):
+    async def test_get_ctr_without_data(self, aclient):
         """Test CTR endpoint when no data logged."""
-        response = client.get("/analytics/ctr")
+        response = await aclient.get("/analytics/ctr")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "ctr" in data
         assert data["ctr"] == 0.0
     
-    def test_get_ctr_with_user_filter(self, client):
-        """Test CTR endpoint with user filter."""
-        # Log some data first
-        client.post(
-            "/analytics/log-impression",
-            json={
-                "query": "test",
-                "variant": "search_v1",
-                "results_count": 10,
-                "response_time_ms": 50.0
-            },
-            headers={"X-User-ID": "user123"}
-        )
-        
-        response = client.get("/analytics/ctr?user_id=user123")
-        assert response.status_code == 200
-        data = response.json()
-        assert "ctr" in data
-    
-    def test_get_ctr_with_variant_filter(self, client):
-        """Test CTR endpoint with variant filter."""
-        response = client.get("/analytics/ctr?variant=search_v1")
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "ctr" in data
-    
-    def test_get_ctr_with_days_filter(self, client):
-        """Test CTR endpoint with days parameter."""
-        response = client.get("/analytics/ctr?days=30")
+    @pytest.mark.parametrize("query_string,expected_keys", [
+        ("?user_id=user123", {"ctr"}),
+        ("?variant=search_v1", {"ctr"}),
+        ("?days=30", {"ctr"}),
+        ("?user_id=user123&variant=search_v2&days=14", {"ctr", "clicks", "impressions"}),
+    ])
+    @pytest.mark.usefixtures("seeded_tracker")
+    async def test_get_ctr_with_filters(self, aclient, query_string, expected_keys):
+        """Test CTR endpoint with user, variant and days filters."""
+        response = await aclient.get(f"/analytics/ctr{query_string}")
         
         assert response.status_code == 200
-        data = response.json()
-        assert "ctr" in data
-    
-    def test_get_ctr_all_filters(self, client):
-        """Test CTR endpoint with all filters."""
-        response = client.get(
-            "/analytics/ctr?user_id=user123&variant=search_v2&days=14"
-        )
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "ctr" in data
-        assert "clicks" in data
-        assert "impressions" in data
+        assert expected_keys <= json_body(response).keys()
 
 
 class TestRankMetricsEndpoint:
     """Tests for GET /analytics/rank-metrics endpoint."""
     
-    def test_get_rank_metrics_empty(self, client):
-        """Test rank metrics endpoint with no data."""
-        response = client.get("/analytics/rank-metrics")
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "avg_rank" in data
-        assert "total_clicks" in data
-    
-    def test_get_rank_metrics_with_user_filter(self, client):
-        """Test rank metrics with user filter."""
-        response = client.get("/analytics/rank-metrics?user_id=user123")
+    @pytest.mark.parametrize("query_string,expected_keys", [
+        ("", {"avg_rank", "total_clicks"}),
+        ("?user_id=user123", {"avg_rank"}),
+        ("?variant=search_v1", {"avg_rank"}),
+        ("?days=7", {"avg_rank"}),
+    ])
+    async def test_get_rank_metrics(self, aclient, query_string, expected_keys):
+        """Test rank metrics endpoint with and without filters."""
+        response = await aclient.get(f"/analytics/rank-metrics{query_string}")
         
         assert response.status_code == 200
-        data = response.json()
-        assert "avg_rank" in data
-    
-    def test_get_rank_metrics_with_variant_filter(self, client):
-        """Test rank metrics with variant filter."""
-        response = client.get("/analytics/rank-metrics?variant=search_v1")
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "avg_rank" in data
-    
-    def test_get_rank_metrics_with_days(self, client):
-        """Test rank metrics with days parameter."""
-        response = client.get("/analytics/rank-metrics?days=7")
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "avg_rank" in data
+        assert expected_keys <= json_body(response).keys()
 
 
 class TestResponseTimeMetricsEndpoint:
     """Tests for GET /analytics/response-time endpoint."""
     
-    def test_get_response_time_empty(self, client):
-        """Test response time metrics with no data."""
-        response = client.get("/analytics/response-time")
+    @pytest.mark.parametrize("query_string,expected_keys", [
+        ("", {"avg_response_time_ms", "min_response_time_ms", "max_response_time_ms"}),
+        ("?user_id=user123", {"avg_response_time_ms"}),
+        ("?variant=search_v2", {"avg_response_time_ms"}),
+        ("?days=30", {"avg_response_time_ms"}),
+    ])
+    async def test_get_response_time(self, aclient, query_string, expected_keys):
+        """Test response time metrics with and without filters."""
+        response = await aclient.get(f"/analytics/response-time{query_string}")
         
         assert response.status_code == 200
-        data = response.json()
-        assert "avg_response_time_ms" in data
-        assert "min_response_time_ms" in data
-        assert "max_response_time_ms" in data
-    
-    def test_get_response_time_with_user_filter(self, client):
-        """Test response time metrics with user filter."""
-        response = client.get("/analytics/response-time?user_id=user123")
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "avg_response_time_ms" in data
-    
-    def test_get_response_time_with_variant_filter(self, client):
-        """Test response time metrics with variant filter."""
-        response = client.get(
-            "/analytics/response-time?variant=search_v2"
-        )
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert "avg_response_time_ms" in data
+        assert expected_keys <= json_body(response).keys()
+
+
+class TestAllMetricsEndpoint:
+    """Tests for GET /analytics/metrics endpoint."""
     
-    def test_get_response_time_with_days(self, client):
-        """Test response time metrics with days parameter."""
-        response = client.get("/analytics/response-time?days=30")
+    @pytest.mark.parametrize("query_string", ["", "?variant=search_v2&days=30"])
+    async def test_get_all_metrics(self, aclient, query_string):
+        """Test combined metrics with and without filters."""
+        response = await aclient.get(f"/analytics/metrics{query_string}")
         
         assert response.status_code == 200
-        data = response.json()
-        assert "avg_response_time_ms" in data
+        data = json_body(response)
+        # Should have either every metric section or an error field
+        assert {"ctr", "rank", "response_time", "variants"} <= data.keys() or "error" in data
 
 
 class TestUserAnalyticsEndpoint:
     """Tests for GET /analytics/user/{user_id} endpoint."""
     
-    def test_get_user_analytics(self, client):
+    async def test_get_user_analytics(self, aclient):
         """Test getting analytics for specific user."""
-        response = client.get("/analytics/user/user123")
+        response = await aclient.get("/analytics/user/user123")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "user_id" in data
         assert data["user_id"] == "user123"
     
-    def test_get_user_analytics_with_days(self, client):
+    async def test_get_user_analytics_with_days(self, aclient):
         """Test getting user analytics with days parameter."""
-        response = client.get("/analytics/user/user123?days=14")
+        response = await aclient.get("/analytics/user/user123?days=14")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert "user_id" in data
     
-    def test_get_user_analytics_different_user(self, client):
+    async def test_get_user_analytics_different_user(self, aclient):
         """Test getting analytics for different user."""
-        response = client.get("/analytics/user/user456")
+        response = await aclient.get("/analytics/user/user456")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["user_id"] == "user456"
 
 
 class TestVariantComparisonEndpoint:
     """Tests for GET /analytics/variants-comparison endpoint."""
     
-    def test_get_variant_comparison(self, client):
+    async def test_get_variant_comparison(self, aclient):
         """Test getting variant comparison."""
-        response = client.get("/analytics/variants-comparison")
+        response = await aclient.get("/analytics/variants-comparison")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         # Should have either period_days or error field
         assert "period_days" in data or "error" in data
     
-    def test_get_variant_comparison_with_days(self, client):
+    async def test_get_variant_comparison_with_days(self, aclient):
         """Test variant comparison with custom days."""
-        response = client.get("/analytics/variants-comparison?days=30")
+        response = await aclient.get("/analytics/variants-comparison?days=30")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         # Should have either period_days or error field
         assert "period_days" in data or "error" in data
 
@@ -398,120 +404,91 @@ class TestVariantComparisonEndpoint:
 class TestResetEndpoint:
     """Tests for DELETE /analytics/reset endpoint."""
     
-    def test_reset_analytics(self, client):
+    async def test_reset_analytics(self, aclient):
         """Test resetting all analytics data."""
         # Log some data
-        client.post(
+        await aclient.post(
             "/analytics/log-click",
-            json={
-                "product_id": "prod_123",
-                "rank": 0,
-                "search_query": "test",
-                "variant": "search_v1",
-                "response_time_ms": 50.0,
-                "source": "SEARCH_RESULTS"
-            },
-            headers={"X-User-ID": "user123"}
+            content=_TEST_CLICK_PAYLOAD_BYTES,
+            headers=_USER123_JSON_HEADERS
         )
         
         # Reset
-        response = client.delete("/analytics/reset")
+        response = await aclient.delete("/analytics/reset")
         
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["status"] == "success"
 
 
 class TestEndpointIntegration:
     """Integration tests across multiple endpoints."""
     
-    def test_log_and_retrieve_metrics(self, client):
+    async def test_log_and_retrieve_metrics(self, aclient):
         """Test logging data and then retrieving metrics."""
-        # Log impression
-        client.post(
-            "/analytics/log-impression",
-            json={
-                "query": "test query",
-                "variant": "search_v1",
-                "results_count": 10,
-                "response_time_ms": 50.0
-            },
-            headers={"X-User-ID": "user123"}
-        )
-        
-        # Log click
-        client.post(
-            "/analytics/log-click",
-            json={
-                "product_id": "prod_001",
-                "rank": 2,
-                "search_query": "test query",
-                "variant": "search_v1",
-                "response_time_ms": 45.0,
-                "source": "SEARCH_RESULTS"
-            },
-            headers={"X-User-ID": "user123"}
-        )
+        # Seed impression and click directly; the logging endpoints are covered above
+        tracker = get_click_tracker()
+        tracker.log_impression(SearchImpression(
+            user_id="user123",
+            query="test query",
+            variant="search_v1",
+            results_count=10,
+            response_time_ms=50.0
+        ))
+        tracker.log_click(ClickEvent(
+            user_id="user123",
+            product_id="prod_001",
+            rank=2,
+            search_query="test query",
+            variant="search_v1",
+            response_time_ms=45.0
+        ))
         
         # Get CTR
-        response = client.get("/analytics/ctr?user_id=user123")
+        response = await aclient.get("/analytics/ctr?user_id=user123")
         assert response.status_code == 200
-        data = response.json()
+        data = json_body(response)
         assert data["clicks"] >= 0
         assert data["impressions"] >= 0
     
-    def test_multiple_variants_comparison(self, client):
+    async def test_multiple_variants_comparison(self, aclient):
         """Test logging data for multiple variants."""
-        # Log v1 impression and click
-        client.post(
-            "/analytics/log-impression",
-            json={
-                "query": "test",
-                "variant": "search_v1",
-                "results_count": 10,
-                "response_time_ms": 50.0
-            },
-            headers={"X-User-ID": "user123"}
-        )
-        
-        client.post(
-            "/analytics/log-click",
-            json={
-                "product_id": "prod_001",
-                "rank": 1,
-                "search_query": "test",
-                "variant": "search_v1",
-                "response_time_ms": 45.0,
-                "source": "SEARCH_RESULTS"
-            },
-            headers={"X-User-ID": "user123"}
-        )
-        
-        # Log v2 impression and click
-        client.post(
-            "/analytics/log-impression",
-            json={
-                "query": "test",
-                "variant": "search_v2",
-                "results_count": 15,
-                "response_time_ms": 60.0
-            },
-            headers={"X-User-ID": "user456"}
-        )
-        
-        client.post(
-            "/analytics/log-click",
-            json={
-                "product_id": "prod_002",
-                "rank": 0,
-                "search_query": "test",
-                "variant": "search_v2",
-                "response_time_ms": 55.0,
-                "source": "SEARCH_RESULTS"
-            },
-            headers={"X-User-ID": "user456"}
-        )
+        tracker = get_click_tracker()
+        
+        # Seed v1 impression and click
+        tracker.log_impression(SearchImpression(
+            user_id="user123",
+            query="test",
+            variant="search_v1",
+            results_count=10,
+            response_time_ms=50.0
+        ))
+        tracker.log_click(ClickEvent(
+            user_id="user123",
+            product_id="prod_001",
+            rank=1,
+            search_query="test",
+            variant="search_v1",
+            response_time_ms=45.0
+        ))
+        
+        # Seed v2 impression and click
+        tracker.log_impression(SearchImpression(
+            user_id="user456",
+            query="test",
+            variant="search_v2",
+            results_count=15,
+            response_time_ms=60.0
+        ))
+        tracker.log_click(ClickEvent(
+            user_id="user456",
+            product_id="prod_002",
+            rank=0,
+            search_query="test",
+            variant="search_v2",
+            response_time_ms=55.0
+        ))
         
         # Get variant comparison
-        response = client.get("/analytics/variants-comparison")
+        response = await aclient.get("/analytics/variants-comparison")
         assert response.status_code == 200
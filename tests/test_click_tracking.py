@@ -10,7 +10,7 @@ Tests cover:
 - Variant comparison
 """
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 from datetime import datetime, timedelta
 from services.click_tracking import (
     ClickTrackingService,
@@ -18,13 +18,15 @@ from services.click_tracking import (
     SearchImpression,
     get_click_tracker,
     reset_click_tracker,
-    ClickSource
+    ClickSource,
+    CLICKS_VARIANT_INDEX,
+    VARIANTS
 )
 
 
-@pytest.fixture
-def click_tracker():
-    """Create click tracker without MongoDB."""
+@pytest.fixture(scope="module")
+def shared_click_tracker():
+    """Create one click tracker without MongoDB for the whole module."""
     reset_click_tracker()
     # Create tracker with memory-only operation (no MongoDB)
     tracker = ClickTrackingService(mongodb_uri="mongodb://invalid:invalid")
@@ -32,6 +34,53 @@ def click_tracker():
     reset_click_tracker()
 
 
+@pytest.fixture
+def click_tracker(shared_click_tracker):
+    """Shared click tracker, with per-test attribute changes rolled back."""
+    saved = dict(vars(shared_click_tracker))
+    yield shared_click_tracker
+    if shared_click_tracker._flush_timer is not None:
+        shared_click_tracker._flush_timer.cancel()
+    shared_click_tracker._click_buf.clear()
+    shared_click_tracker._imp_buf.clear()
+    vars(shared_click_tracker).clear()
+    vars(shared_click_tracker).update(saved)
+
+
+# Baseline event fields; tests override only what they check
+_CLICK_DEFAULTS = {
+    "user_id": "user123",
+    "product_id": "prod_001",
+    "rank": 0,
+    "search_query": "test",
+    "variant": "search_v1",
+    "response_time_ms": 50.0,
+}
+_IMPRESSION_DEFAULTS = {
+    "user_id": "user123",
+    "query": "test",
+    "variant": "search_v1",
+    "results_count": 10,
+    "response_time_ms": 50.0,
+}
+
+
+@pytest.fixture
+def make_click():
+    """Build a ClickEvent from default fields plus overrides."""
+    def _make(**overrides):
+        return ClickEvent(**{**_CLICK_DEFAULTS, **overrides})
+    return _make
+
+
+@pytest.fixture
+def make_impression():
+    """Build a SearchImpression from default fields plus overrides."""
+    def _make(**overrides):
+        return SearchImpression(**{**_IMPRESSION_DEFAULTS, **overrides})
+    return _make
+
+
 class TestClickEvent:
     """Tests for ClickEvent data class."""
     
@@ -73,17 +122,22 @@ class TestClickEvent:
         assert d["variant"] == "search_v1"
         assert d["response_time_ms"] == 50.0
     
-    def test_click_event_with_custom_source(self):
+    def test_click_event_to_dict_returns_copy(self, make_click):
+        """Test that storing a document cannot mutate the frozen event."""
+        event = make_click(rank=1)
+        
+        doc = event.to_dict()
+        doc["_id"] = "assigned_by_insert"
+        
+        assert event.to_dict() is not doc
+        assert "_id" not in event.to_dict()
+        assert event.to_dict()["timestamp"] == event.timestamp
+        with pytest.raises(AttributeError):
+            event.rank = 2
+    
+    def test_click_event_with_custom_source(self, make_click):
         """Test click event with custom source."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=2,
-            search_query="test",
-            variant="search_v2",
-            response_time_ms=50.0,
-            source=ClickSource.RECOMMENDATIONS.value
-        )
+        event = make_click(rank=2, variant="search_v2", source=ClickSource.RECOMMENDATIONS.value)
         
         assert event.source == ClickSource.RECOMMENDATIONS.value
 
@@ -139,37 +193,134 @@ class TestClickTrackingService:
         # Should handle gracefully
         assert tracker.db is None
     
-    def test_click_logging_without_db(self, click_tracker):
+    def test_connection_is_lazy(self):
+        """Test that MongoDB is only contacted when db is first read."""
+        with patch('services.click_tracking.MongoClient') as mock_client:
+            tracker = ClickTrackingService(mongodb_uri="mongodb://invalid:invalid")
+            mock_client.assert_not_called()
+            
+            tracker.db
+            tracker.db
+            mock_client.assert_called_once()
+    
+    def test_injected_db(self):
+        """Test that an injected database is used without connecting."""
+        db = MagicMock()
+        with patch('services.click_tracking.MongoClient') as mock_client:
+            tracker = ClickTrackingService(db=db)
+            
+            assert tracker.db is db
+            assert tracker.clicks_collection is db['clicks']
+            mock_client.assert_not_called()
+    
+    def test_click_logging_without_db(self, click_tracker, make_click):
         """Test that click logging returns False without DB."""
         click_tracker.db = None
         
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=50.0
-        )
-        
-        result = click_tracker.log_click(event)
+        result = click_tracker.log_click(make_click())
         assert result is False
     
-    def test_impression_logging_without_db(self, click_tracker):
+    def test_impression_logging_without_db(self, click_tracker, make_impression):
         """Test that impression logging returns False without DB."""
         click_tracker.db = None
         
-        impression = SearchImpression(
-            user_id="user123",
-            query="test",
-            variant="search_v1",
-            results_count=10,
-            response_time_ms=50.0
-        )
-        
-        result = click_tracker.log_impression(impression)
+        result = click_tracker.log_impression(make_impression())
         assert result is False
     
+    def test_click_logging_is_buffered(self, click_tracker, make_click):
+        """Test that clicks are buffered until flushed in one bulk write."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.flush_interval_s = 60.0
+        
+        for rank in range(3):
+            assert click_tracker.log_click(make_click(rank=rank)) is True
+        
+        click_tracker.clicks_collection.bulk_write.assert_not_called()
+        
+        assert click_tracker.flush() is True
+        click_tracker.clicks_collection.bulk_write.assert_called_once()
+        requests = click_tracker.clicks_collection.bulk_write.call_args[0][0]
+        assert len(requests) == 3
+    
+    def test_impression_logging_flushes_at_size(self, click_tracker, make_impression):
+        """Test that a full impression buffer is written immediately."""
+        click_tracker.db = Mock()
+        click_tracker.impressions_collection = Mock()
+        click_tracker.flush_size = 2
+        click_tracker.flush_interval_s = 60.0
+        
+        for _ in range(2):
+            click_tracker.log_impression(make_impression())
+        
+        click_tracker.impressions_collection.bulk_write.assert_called_once()
+        assert click_tracker.impressions_collection.bulk_write.call_args[1]["ordered"] is False
+    
+    def test_failed_flush_requeues_batch(self, click_tracker, make_click):
+        """Test that a batch whose write fails stays buffered for the next flush."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.clicks_collection.bulk_write.side_effect = RuntimeError("down")
+        click_tracker.flush_interval_s = 60.0
+        
+        click_tracker.log_click(make_click())
+        
+        assert click_tracker.flush() is False
+        assert len(click_tracker._click_buf) == 1
+        
+        click_tracker.clicks_collection.bulk_write.side_effect = None
+        assert click_tracker.flush() is True
+        assert click_tracker._click_buf == []
+    
+    def test_persistent_failure_keeps_buffer_at_cap(self, click_tracker, make_click):
+        """Test that a failing bulk_write never grows the buffer past max_buffered."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.clicks_collection.bulk_write.side_effect = RuntimeError("down")
+        click_tracker.flush_size = 2
+        click_tracker.flush_interval_s = 60.0
+        click_tracker.max_buffered = 5
+        
+        for rank in range(20):
+            click_tracker.log_click(make_click(rank=rank))
+            click_tracker.flush()
+            assert len(click_tracker._click_buf) <= 5
+        
+        assert [doc["rank"] for doc in click_tracker._click_buf] == [15, 16, 17, 18, 19]
+        assert click_tracker.dropped_events == 15
+    
+    def test_failed_flush_backs_off_writes(self, click_tracker, make_click):
+        """Test that writes after a failed flush do not retry until the backoff ends."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.clicks_collection.bulk_write.side_effect = RuntimeError("down")
+        click_tracker.flush_size = 1
+        click_tracker.flush_interval_s = 60.0
+        
+        assert click_tracker.log_click(make_click()) is False
+        for _ in range(3):
+            assert click_tracker.log_click(make_click()) is True
+        
+        click_tracker.clicks_collection.bulk_write.assert_called_once()
+        assert len(click_tracker._click_buf) == 4
+        
+        click_tracker._retry_at = 0.0
+        click_tracker.clicks_collection.bulk_write.side_effect = None
+        assert click_tracker.log_click(make_click()) is True
+        assert click_tracker._click_buf == []
+    
+    def test_partial_bulk_failure_requeues_unwritten_docs(self, click_tracker):
+        """Test that only failed, non-duplicate documents are retried."""
+        batch = [{"rank": 0}, {"rank": 1}, {"rank": 2}]
+        error = RuntimeError("bulk write error")
+        error.details = {"writeErrors": [
+            {"index": 1, "code": 11000},
+            {"index": 2, "code": 121},
+        ]}
+        
+        assert click_tracker._unwritten(batch, error) == [{"rank": 2}]
+        assert click_tracker._unwritten(batch, RuntimeError("down")) == batch
+    
     def test_ctr_calculation_no_db(self, click_tracker):
         """Test CTR calculation without database."""
         click_tracker.db = None
@@ -187,6 +338,24 @@ class TestClickTrackingService:
         assert metrics["avg_rank"] == 0
         assert metrics["clicks_by_rank"] == {}
     
+    def test_rank_metrics_projects_rank_column(self, click_tracker):
+        """Test rank statistics computed from the projected rank column."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.clicks_collection.find.return_value = [
+            {"rank": 3}, {"rank": 0}, {"rank": 1}, {"rank": 0}
+        ]
+        
+        metrics = click_tracker.get_rank_metrics()
+        
+        assert click_tracker.clicks_collection.find.call_args[0][1] == {"rank": 1, "_id": 0}
+        assert metrics["avg_rank"] == 1.0
+        assert metrics["min_rank"] == 0
+        assert metrics["max_rank"] == 3
+        assert metrics["clicks_by_rank"] == {0: 2, 1: 1, 3: 1}
+        assert list(metrics["clicks_by_rank"]) == [0, 1, 3]
+        assert metrics["total_clicks"] == 4
+    
     def test_response_time_metrics_no_db(self, click_tracker):
         """Test response time metrics without database."""
         click_tracker.db = None
@@ -210,6 +379,108 @@ class TestClickTrackingService:
         comparison = click_tracker.get_variant_comparison()
         assert "error" in comparison
     
+    def test_variant_comparison_single_scan(self, click_tracker):
+        """Test variant comparison aggregates each collection in one find."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.impressions_collection = Mock()
+        click_tracker.clicks_collection.find.return_value = [
+            {"variant": "search_v1", "rank": 0},
+            {"variant": "search_v1", "rank": 2},
+            {"variant": "search_v2", "rank": 1},
+        ]
+        click_tracker.impressions_collection.find.return_value = [
+            {"variant": "search_v1", "response_time_ms": 40.0},
+            {"variant": "search_v1", "response_time_ms": 60.0},
+            {"variant": "search_v2", "response_time_ms": 30.0},
+            {"variant": "search_v2", "response_time_ms": 50.0},
+        ]
+        
+        click_tracker._covering_indexes = True
+        
+        comparison = click_tracker.get_variant_comparison()
+        
+        click_tracker.clicks_collection.find.assert_called_once()
+        click_tracker.impressions_collection.find.assert_called_once()
+        assert click_tracker.clicks_collection.find.call_args[1]["hint"] == CLICKS_VARIANT_INDEX
+        v1 = comparison["variants"]["search_v1"]
+        assert v1["clicks"] == 2
+        assert v1["impressions"] == 2
+        assert v1["ctr"] == 1.0
+        assert v1["avg_rank_clicked"] == 1.0
+        assert v1["avg_response_time_ms"] == 50.0
+        assert comparison["variants"]["search_v2"]["ctr"] == 0.5
+        assert comparison["winner_by_ctr"] == "search_v1"
+    
+    def test_variant_comparison_without_covering_index(self, click_tracker):
+        """Test that no index hint is sent when the covering index was not created."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.impressions_collection = Mock()
+        click_tracker.clicks_collection.find.return_value = []
+        click_tracker.impressions_collection.find.return_value = []
+        click_tracker._covering_indexes = False
+        
+        comparison = click_tracker.get_variant_comparison()
+        
+        assert "error" not in comparison
+        assert click_tracker.clicks_collection.find.call_args[1]["hint"] is None
+        assert click_tracker.impressions_collection.find.call_args[1]["hint"] is None
+    
+    def test_all_metrics_no_db(self, click_tracker):
+        """Test combined metrics without database."""
+        click_tracker.db = None
+        
+        metrics = click_tracker.get_all_metrics()
+        assert "error" in metrics
+    
+    def test_all_metrics_single_aggregate(self, click_tracker):
+        """Test combined metrics come from one faceted aggregation."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.impressions_collection = Mock()
+        click_tracker.impressions_collection.name = "impressions"
+        click_tracker.clicks_collection.aggregate.return_value = iter([{
+            "counts": [
+                {"_id": {"kind": "click", "variant": "search_v1"}, "n": 3, "rank_sum": 3, "time_sum": 0},
+                {"_id": {"kind": "impression", "variant": "search_v1"}, "n": 4, "rank_sum": 0, "time_sum": 200.0},
+                {"_id": {"kind": "impression", "variant": "search_v2"}, "n": 2, "rank_sum": 0, "time_sum": 60.0},
+            ],
+            "ranks": [{"_id": 0, "n": 1}, {"_id": 1, "n": 1}, {"_id": 2, "n": 1}],
+            "times": [{"_id": None, "count": 6, "avg": 43.3333, "min": 20.0, "max": 60.0, "p95": [60.0]}],
+        }])
+        
+        metrics = click_tracker.get_all_metrics()
+        
+        click_tracker.clicks_collection.aggregate.assert_called_once()
+        assert metrics["ctr"]["clicks"] == 3
+        assert metrics["ctr"]["impressions"] == 6
+        assert metrics["ctr"]["ctr"] == 0.5
+        assert metrics["rank"]["avg_rank"] == 1.0
+        assert metrics["rank"]["median_rank"] == 1
+        assert metrics["rank"]["max_rank"] == 2
+        assert metrics["response_time"]["min_response_time_ms"] == 20.0
+        assert metrics["response_time"]["avg_response_time_ms"] == 43.33
+        assert metrics["response_time"]["p95_response_time_ms"] == 60.0
+        assert metrics["response_time"]["count"] == 6
+        assert metrics["variants"]["variants"]["search_v1"]["ctr"] == 0.75
+        assert metrics["variants"]["winner_by_ctr"] == "search_v1"
+    
+    def test_all_metrics_reduces_on_server(self, click_tracker):
+        """Test that no facet pushes per-event values and unranked clicks are skipped."""
+        click_tracker.db = Mock()
+        click_tracker.clicks_collection = Mock()
+        click_tracker.impressions_collection = Mock()
+        click_tracker.impressions_collection.name = "impressions"
+        click_tracker.clicks_collection.aggregate.return_value = iter([{}])
+        
+        click_tracker.get_all_metrics()
+        
+        pipeline = click_tracker.clicks_collection.aggregate.call_args[0][0]
+        facets = pipeline[-1]["$facet"]
+        assert "$push" not in repr(facets)
+        assert facets["ranks"][0]["$match"]["rank"] == {"$type": "number"}
+    
     def test_reset_no_db(self, click_tracker):
         """Test reset without database."""
         click_tracker.db = None
@@ -240,202 +511,84 @@ class TestGlobalTracker:
         
         # Should be different instances after reset
         assert tracker1 is not tracker2
+    
+    def test_reset_click_tracker_flushes(self):
+        """Test that resetting the global tracker flushes its buffers first."""
+        reset_click_tracker()
+        get_click_tracker()
+        
+        with patch.object(ClickTrackingService, "flush") as mock_flush:
+            reset_click_tracker()
+        
+        mock_flush.assert_called_once()
 
 
 class TestClickEventData:
     """Tests for click event data handling."""
     
-    def test_click_event_with_session(self):
+    def test_click_event_with_session(self, make_click):
         """Test click event with session ID."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=50.0,
-            session_id="session_abc123"
-        )
+        event = make_click(session_id="session_abc123")
         
         assert event.session_id == "session_abc123"
         data = event.to_dict()
         assert data["session_id"] == "session_abc123"
     
-    def test_click_event_timestamp(self):
+    def test_click_event_timestamp(self, make_click):
         """Test that click event has timestamp."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=50.0
-        )
+        event = make_click()
         
         assert event.timestamp is not None
         assert isinstance(event.timestamp, datetime)
     
-    def test_impression_timestamp(self):
+    def test_impression_timestamp(self, make_impression):
         """Test that impression has timestamp."""
-        impression = SearchImpression(
-            user_id="user123",
-            query="test",
-            variant="search_v1",
-            results_count=10,
-            response_time_ms=50.0
-        )
+        impression = make_impression()
         
         assert impression.timestamp is not None
         assert isinstance(impression.timestamp, datetime)
+    
+    def test_timestamp_derived_from_ns(self, make_click):
+        """Test that timestamp is computed from timestamp_ns as naive UTC."""
+        event = make_click(timestamp_ns=1_700_000_000_123_456_789)
+        
+        assert event.timestamp == datetime(2023, 11, 14, 22, 13, 20, 123456)
+        assert event.to_dict()["timestamp"] == event.timestamp
 
 
 class TestClickEventValidation:
     """Tests for click event validation."""
     
-    def test_click_with_zero_rank(self):
-        """Test click event with rank 0 (first result)."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=50.0
-        )
-        
-        assert event.rank == 0
-    
-    def test_click_with_high_rank(self):
-        """Test click event with high rank."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=99,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=50.0
-        )
-        
-        assert event.rank == 99
+    @pytest.mark.parametrize("rank", [0, 99])
+    def test_click_rank(self, make_click, rank):
+        """Test click events from the first to a deep result position."""
+        assert make_click(rank=rank).rank == rank
     
-    def test_impression_with_zero_results(self):
+    def test_impression_with_zero_results(self, make_impression):
         """Test impression with zero results."""
-        impression = SearchImpression(
-            user_id="user123",
-            query="test",
-            variant="search_v1",
-            results_count=0,
-            response_time_ms=50.0
-        )
-        
-        assert impression.results_count == 0
-    
-    def test_response_time_zero(self):
-        """Test with zero response time."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=0.0
-        )
-        
-        assert event.response_time_ms == 0.0
+        assert make_impression(results_count=0).results_count == 0
 
 
 class TestVariantHandling:
     """Tests for variant-specific functionality."""
     
-    def test_click_with_v1_variant(self):
-        """Test click event with search_v1."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=50.0
-        )
-        
-        assert event.variant == "search_v1"
-    
-    def test_click_with_v2_variant(self):
-        """Test click event with search_v2."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v2",
-            response_time_ms=50.0
-        )
-        
-        assert event.variant == "search_v2"
-    
-    def test_impression_with_v1_variant(self):
-        """Test impression with search_v1."""
-        impression = SearchImpression(
-            user_id="user123",
-            query="test",
-            variant="search_v1",
-            results_count=10,
-            response_time_ms=50.0
-        )
-        
-        assert impression.variant == "search_v1"
+    @pytest.mark.parametrize("variant", VARIANTS)
+    def test_click_variant(self, make_click, variant):
+        """Test click event with each search variant."""
+        assert make_click(variant=variant).variant == variant
     
-    def test_impression_with_v2_variant(self):
-        """Test impression with search_v2."""
-        impression = SearchImpression(
-            user_id="user123",
-            query="test",
-            variant="search_v2",
-            results_count=10,
-            response_time_ms=50.0
-        )
-        
-        assert impression.variant == "search_v2"
+    @pytest.mark.parametrize("variant", VARIANTS)
+    def test_impression_variant(self, make_impression, variant):
+        """Test impression with each search variant."""
+        assert make_impression(variant=variant).variant == variant
 
 
 class TestResponseTimeHandling:
     """Tests for response time tracking."""
     
-    def test_fast_response_time(self):
-        """Test event with fast response time."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=10.5
-        )
-        
-        assert event.response_time_ms == 10.5
-    
-    def test_slow_response_time(self):
-        """Test event with slow response time."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=500.0
-        )
-        
-        assert event.response_time_ms == 500.0
-    
-    def test_fractional_response_time(self):
-        """Test event with fractional milliseconds."""
-        event = ClickEvent(
-            user_id="user123",
-            product_id="prod_001",
-            rank=0,
-            search_query="test",
-            variant="search_v1",
-            response_time_ms=42.123
-        )
+    @pytest.mark.parametrize("response_time_ms", [0.0, 10.5, 500.0, 42.123])
+    def test_response_time(self, make_click, response_time_ms):
+        """Test zero, fast, slow and fractional response times."""
+        event = make_click(response_time_ms=response_time_ms)
         
-        assert event.response_time_ms == 42.123
+        assert event.response_time_ms == response_time_ms
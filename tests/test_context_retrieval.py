@@ -4,6 +4,15 @@ Tests user preferences summary, search result formatting, and LLM input generati
 Tests formatting logic in isolation without requiring full service initialization.
 """
 import pytest
+from unittest.mock import Mock, patch
+
+from services.context_retrieval import (
+    ContextRetriever,
+    format_preferences,
+    get_context_retriever,
+    reset_context_retriever,
+    retrieve_context,
+)
 
 
 class TestSearchResultsFormatting:
@@ -31,9 +40,9 @@ class TestSearchResultsFormatting:
         if result.get("color"):
             lines.append(f"Color: {result['color']}")
         if result.get("price"):
-            lines.append(f"Price: ${result['price']}")
+            lines.append("Price: $%s" % result['price'])
         if result.get("score") is not None:
-            lines.append(f"Relevance Score: {result['score']:.2f}")
+            lines.append("Relevance Score: %.2f" % result['score'])
         if result.get("size"):
             lines.append(f"Size: {result['size']}")
         if result.get("brand"):
@@ -62,7 +71,7 @@ class TestSearchResultsFormatting:
         for i, result in enumerate(search_results, 1):
             result_text = f"\nResult {i}: {result.get('title', 'Untitled')}"
             if result.get("score") is not None:
-                result_text += f"\nRelevance Score: {result['score']:.2f}"
+                result_text += "\nRelevance Score: %.2f" % result['score']
             formatted_results.append(result_text)
         
         formatted = "\n".join(formatted_results)
@@ -91,6 +100,34 @@ class TestSearchResultsFormatting:
         assert "Result 3:" in formatted
         assert "Result 4:" not in formatted
     
+    def test_format_results_with_retriever(self):
+        """ContextRetriever emits fields in order and keeps a zero score."""
+        formatted = ContextRetriever._format_search_results([
+            {"title": "Blue Casual Shirt", "color": "blue", "price": 49.99, "score": 0.0},
+            {"description": "No title"},
+        ])
+        
+        assert formatted == (
+            "\nResult 1: Blue Casual Shirt\nColor: blue\nPrice: $49.99\nRelevance Score: 0.00"
+            "\n\nResult 2: Untitled\nDescription: No title"
+        )
+    
+    def test_retrieve_context_truncates_before_formatting(self):
+        """retrieve_context caps results once and reports the capped count."""
+        retriever = ContextRetriever.__new__(ContextRetriever)
+        retriever.user_service = Mock()
+        retriever.user_service.get_user_profile.return_value = None
+        
+        context = retriever.retrieve_context(
+            "user123",
+            [{"title": f"Item {i}", "score": 0.9} for i in range(1, 11)],
+            max_results=3
+        )
+        
+        assert "SEARCH RESULTS (3 items):" in context
+        assert "Result 3: Item 3" in context
+        assert "Result 4:" not in context
+    
     def test_format_results_with_minimal_fields(self):
         """Format results with only title."""
         search_result = {"title": "Simple Shirt"}
@@ -101,96 +138,88 @@ class TestSearchResultsFormatting:
         assert "Untitled" not in result_text
 
 
+class TestSharedRetriever:
+    """Test the shared retriever behind retrieve_context."""
+    
+    @patch("services.context_retrieval.ContextRetriever")
+    def test_retrieve_context_reuses_one_retriever(self, mock_retriever_cls):
+        """The convenience function builds the retriever once."""
+        reset_context_retriever()
+        mock_retriever_cls.return_value.retrieve_context.return_value = "context"
+        
+        try:
+            assert retrieve_context("user123", []) == "context"
+            assert retrieve_context("user456", [], max_results=3) == "context"
+            
+            mock_retriever_cls.assert_called_once()
+            assert get_context_retriever() is mock_retriever_cls.return_value
+        finally:
+            reset_context_retriever()
+
+
 class TestPreferencesFormatting:
     """Test user preferences summary formatting."""
     
-    def test_format_preferences_with_colors(self):
-        """Format preferences with color data."""
-        preferences_analysis = {
-            "dominant_colors": {"blue": 3, "black": 2, "white": 1},
-            "most_frequent_categories": {},
-            "style_keywords": {},
-            "product_types": {},
-            "purchase_count": 6
-        }
-        
-        lines = []
-        colors = preferences_analysis.get("dominant_colors", {})
-        if colors:
-            color_str = ", ".join(
-                f"{color} ({freq})"
-                for color, freq in list(colors.items())[:5]
-            )
-            lines.append(f"- Preferred Colors: {color_str}")
-        
-        summary = "\n".join(lines) if lines else "- No preference data available"
-        
-        assert "blue" in summary
-        assert "Preferred Colors" in summary
-        assert "(3)" in summary
-    
-    def test_format_preferences_with_categories(self):
-        """Format preferences with category data."""
-        preferences_analysis = {
-            "dominant_colors": {},
-            "most_frequent_categories": {"apparel": 8, "footwear": 2},
-            "style_keywords": {},
-            "product_types": {},
-            "purchase_count": 10
-        }
-        
-        lines = []
-        categories = preferences_analysis.get("most_frequent_categories", {})
-        if categories:
-            cat_str = ", ".join(
-                f"{cat} ({freq})"
-                for cat, freq in list(categories.items())[:5]
-            )
-            lines.append(f"- Favorite Categories: {cat_str}")
-        
-        summary = "\n".join(lines) if lines else "- No preference data available"
-        
-        assert "apparel" in summary
-        assert "Favorite Categories" in summary
-    
-    def test_format_preferences_with_style_keywords(self):
-        """Format preferences with style keyword data."""
-        preferences_analysis = {
-            "dominant_colors": {},
-            "most_frequent_categories": {},
-            "style_keywords": {"casual": 4, "elegant": 3, "classic": 2},
-            "product_types": {},
-            "purchase_count": 9
-        }
-        
-        lines = []
-        keywords = preferences_analysis.get("style_keywords", {})
-        if keywords:
-            keyword_str = ", ".join(
-                f"{kw}"
-                for kw in list(keywords.keys())[:5]
-            )
-            lines.append(f"- Popular Styles: {keyword_str}")
-        
-        summary = "\n".join(lines) if lines else "- No preference data available"
-        
-        assert "Popular Styles" in summary
-        assert "casual" in summary
+    @pytest.mark.parametrize("prefs,expected", [
+        # Colors
+        (
+            {"dominant_colors": {"blue": 3, "black": 2, "white": 1}, "purchase_count": 6},
+            ["blue", "Preferred Colors", "(3)"],
+        ),
+        # Categories
+        (
+            {"most_frequent_categories": {"apparel": 8, "footwear": 2}, "purchase_count": 10},
+            ["apparel", "Favorite Categories"],
+        ),
+        # Style keywords
+        (
+            {"style_keywords": {"casual": 4, "elegant": 3, "classic": 2}, "purchase_count": 9},
+            ["Popular Styles", "casual"],
+        ),
+        # No data
+        (
+            {
+                "dominant_colors": {},
+                "most_frequent_categories": {},
+                "style_keywords": {},
+                "product_types": {},
+                "purchase_count": 0,
+            },
+            ["No preference data available"],
+        ),
+        # Fashion enthusiast
+        (
+            {
+                "dominant_colors": {"blue": 3, "black": 2},
+                "most_frequent_categories": {"apparel": 8, "footwear": 3},
+                "style_keywords": {"elegant": 4, "casual": 3, "classic": 2},
+                "product_types": {"shirt": 5, "dress": 3, "shoes": 2},
+                "purchase_count": 13,
+            },
+            ["blue", "black", "apparel", "footwear", "elegant", "Total Purchases Analyzed: 13"],
+        ),
+    ])
+    def test_format_preferences(self, prefs, expected):
+        """Format preferences into summary lines."""
+        summary = format_preferences(prefs)
+        
+        for substring in expected:
+            assert substring in summary
     
-    def test_format_preferences_empty(self):
-        """Format preferences with no data."""
-        preferences_analysis = {
-            "dominant_colors": {},
-            "most_frequent_categories": {},
-            "style_keywords": {},
-            "product_types": {},
-            "purchase_count": 0
-        }
-        
-        lines = []
-        summary = "\n".join(lines) if lines else "- No preference data available"
-        
-        assert "No preference data available" in summary
+    def test_format_preferences_with_profile(self):
+        """Style profile and explicit profile preferences are included."""
+        summary = format_preferences(
+            {"purchase_count": 2},
+            {"preferences": {"price_range": "$50-$100", "size_preference": "M"}},
+            "Casual"
+        )
+        
+        assert summary.splitlines() == [
+            "- Style Profile: Casual",
+            "- Total Purchases Analyzed: 2",
+            "- Price Range: $50-$100",
+            "- Size Preference: M",
+        ]
 
 
 class TestContextStructuring:
@@ -224,14 +253,14 @@ class TestContextStructuring:
     def test_currency_formatting(self):
         """Prices should include $ symbol."""
         price = 49.99
-        formatted_price = f"${price}"
+        formatted_price = "$%s" % price
         
         assert "$49.99" in formatted_price
     
     def test_relevance_score_formatting(self):
         """Relevance scores should be formatted to 2 decimal places."""
         score = 0.9234
-        formatted_score = f"{score:.2f}"
+        formatted_score = "%.2f" % score
         
         assert formatted_score == "0.92"
         assert "0.9234" not in formatted_score
@@ -240,41 +269,6 @@ class TestContextStructuring:
 class TestRealWorldScenarios:
     """Test with realistic formatting scenarios."""
     
-    def test_fashion_enthusiast_preferences_string(self):
-        """Generate preference string for fashion enthusiast."""
-        preferences = {
-            "dominant_colors": {"blue": 3, "black": 2},
-            "most_frequent_categories": {"apparel": 8, "footwear": 3},
-            "style_keywords": {"elegant": 4, "casual": 3, "classic": 2},
-            "product_types": {"shirt": 5, "dress": 3, "shoes": 2},
-            "purchase_count": 13
-        }
-        
-        pref_lines = []
-        
-        colors = preferences.get("dominant_colors", {})
-        if colors:
-            color_str = ", ".join(f"{c} ({f})" for c, f in list(colors.items())[:5])
-            pref_lines.append(f"- Preferred Colors: {color_str}")
-        
-        categories = preferences.get("most_frequent_categories", {})
-        if categories:
-            cat_str = ", ".join(f"{c} ({f})" for c, f in list(categories.items())[:5])
-            pref_lines.append(f"- Favorite Categories: {cat_str}")
-        
-        keywords = preferences.get("style_keywords", {})
-        if keywords:
-            kw_str = ", ".join(list(keywords.keys())[:5])
-            pref_lines.append(f"- Popular Styles: {kw_str}")
-        
-        pref_summary = "\n".join(pref_lines)
-        
-        assert "blue" in pref_summary
-        assert "black" in pref_summary
-        assert "apparel" in pref_summary
-        assert "footwear" in pref_summary
-        assert "elegant" in pref_summary
-    
     def test_search_results_with_rankings(self):
         """Format search results with relevance rankings."""
         search_results = [
@@ -313,9 +307,9 @@ class TestRealWorldScenarios:
             if result.get("color"):
                 lines.append(f"Color: {result['color']}")
             if result.get("price"):
-                lines.append(f"Price: ${result['price']}")
+                lines.append("Price: $%s" % result['price'])
             if result.get("score"):
-                lines.append(f"Relevance Score: {result['score']:.2f}")
+                lines.append("Relevance Score: %.2f" % result['score'])
             formatted.append("\n".join(lines))
         
         full_results = "\n\n".join(formatted)
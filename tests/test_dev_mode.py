@@ -9,15 +9,14 @@ import pytest
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 
-def test_dev_mode_enabled():
+def test_dev_mode_enabled(monkeypatch):
     """Test that dev mode uses mock provider."""
-    os.environ["DEV_MODE"] = "true"
+    monkeypatch.setenv("DEV_MODE", "true")
     
-    # Import after setting env var
-    from config.settings import settings
+    from config.settings import get_snapshot
     from services.llm_client import LLMClient
     
-    assert settings.DEV_MODE is True
+    assert get_snapshot().DEV_MODE is True
     
     client = LLMClient()
     assert client.provider == "mock"
@@ -29,16 +28,10 @@ def test_dev_mode_enabled():
     assert "recommendations" in response
 
 
-def test_dev_mode_disabled_without_api_key():
+def test_dev_mode_disabled_without_api_key(monkeypatch):
     """Test that without API key and dev mode off, it falls back to mock."""
-    os.environ["DEV_MODE"] = "false"
-    if "OPENAI_API_KEY" in os.environ:
-        del os.environ["OPENAI_API_KEY"]
-    
-    # Reload settings
-    import importlib
-    from config import settings as settings_module
-    importlib.reload(settings_module)
+    monkeypatch.setenv("DEV_MODE", "false")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
     
     from services.llm_client import LLMClient
     
@@ -49,7 +42,7 @@ def test_dev_mode_disabled_without_api_key():
 
 def test_mock_response_format():
     """Test that mock response is valid JSON."""
-    import json
+    import orjson
     
     from services.llm_client import LLMClient
     
@@ -57,7 +50,7 @@ def test_mock_response_format():
     response = client.generate("test")
     
     # Should be valid JSON
-    data = json.loads(response)
+    data = orjson.loads(response)
     
     # Should have recommendations
     assert "recommendations" in data
@@ -70,26 +63,30 @@ def test_mock_response_format():
         assert "is_wildcard" in rec
 
 
+def test_mock_response_is_shared_constant():
+    """Test that the mock provider returns the module-level canned response."""
+    from services.llm_client import LLMClient, MOCK_RESPONSE
+    
+    client = LLMClient(provider="mock")
+    assert client.generate("first") is MOCK_RESPONSE
+    assert client.generate("second") is MOCK_RESPONSE
+
+
 def test_dev_mode_message():
     """Test that dev mode prints a message."""
     import io
     from contextlib import redirect_stdout
     
-    os.environ["DEV_MODE"] = "true"
-    
-    # Import and reset
-    from services import llm_client
-    import importlib
-    importlib.reload(llm_client)
+    from services.llm_client import LLMClient
     
     # Capture stdout
     f = io.StringIO()
     with redirect_stdout(f):
-        from services.llm_client import LLMClient
-        client = LLMClient()
+        client = LLMClient(dev_mode=True)
     
     output = f.getvalue()
-    assert "Dev mode enabled" in output or client.provider == "mock"
+    assert "Dev mode enabled" in output
+    assert client.provider == "mock"
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
 """
 Tests for PersonalShopperAgent.
 """
+import orjson
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
 from services.personal_shopper_agent import PersonalShopperAgent
 
@@ -28,12 +29,49 @@ def dummy_search_results():
     ]
 
 
-def test_recommend_with_provided_results():
-    llm_client = MagicMock()
-    llm_client.generate.return_value = "{\"recommendations\": []}"
+class _LLMStub:
+    """LLM client stub returning a fixed response and recording prompts."""
+    
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+    
+    def generate(self, prompt):
+        self.prompts.append(prompt)
+        return self.response
+
+
+class _SearchStub:
+    """Search service stub returning fixed results and counting calls."""
+    
+    def __init__(self, results):
+        self.results = results
+        self.calls = 0
+    
+    def search(self, query, user_id=None, top_k=10):
+        self.calls += 1
+        return self.results
+
+
+@pytest.fixture
+def llm_client():
+    """LLM client stub returning an empty recommendation list."""
+    return _LLMStub("{\"recommendations\": []}")
 
-    agent = PersonalShopperAgent(llm_client=llm_client)
 
+@pytest.fixture
+def search_service():
+    """Search service stub returning the dummy results."""
+    return _SearchStub(dummy_search_results())
+
+
+@pytest.fixture
+def agent(llm_client):
+    """Agent wired to the LLM client stub."""
+    return PersonalShopperAgent(llm_client=llm_client)
+
+
+def test_recommend_with_provided_results(agent, llm_client):
     with patch("services.personal_shopper_agent.retrieve_context") as mock_retrieve:
         mock_retrieve.return_value = "Mocked context text"
         
@@ -44,17 +82,11 @@ def test_recommend_with_provided_results():
         )
 
         assert response["context"] == "Mocked context text"
-        llm_client.generate.assert_called_once()
+        assert len(llm_client.prompts) == 1
         assert response["search_results"]
 
 
-def test_recommend_via_search_service():
-    llm_client = MagicMock()
-    llm_client.generate.return_value = "{\"recommendations\": []}"
-
-    search_service = MagicMock()
-    search_service.search.return_value = dummy_search_results()
-
+def test_recommend_via_search_service(llm_client, search_service):
     agent = PersonalShopperAgent(llm_client=llm_client, search_service=search_service)
 
     with patch("services.personal_shopper_agent.retrieve_context") as mock_retrieve:
@@ -66,25 +98,19 @@ def test_recommend_via_search_service():
             max_results=2,
         )
 
-        search_service.search.assert_called_once()
+        assert search_service.calls == 1
         assert response["search_results"][0]["title"] == "Blue Casual Shirt"
 
 
-def test_missing_inputs_raise_error():
-    llm_client = MagicMock()
-    llm_client.generate.return_value = "{}"
-
-    agent = PersonalShopperAgent(llm_client=llm_client)
+def test_missing_inputs_raise_error(agent, llm_client):
+    llm_client.response = "{}"
 
     with pytest.raises(ValueError):
         agent.recommend(user_id="user123", max_results=2)
 
 
-def test_custom_prompt_template():
-    llm_client = MagicMock()
-    llm_client.generate.return_value = "{}"
-
-    agent = PersonalShopperAgent(llm_client=llm_client)
+def test_custom_prompt_template(agent, llm_client):
+    llm_client.response = "{}"
 
     template = "PREFS:\n{{context}}\nEND"
     
@@ -99,3 +125,48 @@ def test_custom_prompt_template():
 
         assert resp["prompt"].startswith("PREFS:")
         assert resp["prompt"].endswith("END")
+
+
+def test_build_prompt_fills_every_placeholder(agent):
+    template = "A {{context}} B {{context}}"
+
+    assert agent.build_prompt("ctx", template) == "A ctx B ctx"
+    assert agent.build_prompt("other", template) == "A other B other"
+    assert agent.build_prompt("ctx", "no placeholder") == "no placeholder"
+
+
+def test_recommend_batch_single_llm_call(agent, llm_client):
+    llm_client.response = orjson.dumps({
+        "responses": [
+            {"id": f"Q{i}", "recommendations": [{"title": f"Pick {i}", "why": "fit", "is_wildcard": False}]}
+            for i in range(8)
+        ]
+    }).decode()
+    requests = [
+        {"user_id": f"user{i}", "search_results": dummy_search_results(), "max_results": 2}
+        for i in range(8)
+    ]
+
+    with patch("services.personal_shopper_agent.retrieve_context") as mock_retrieve:
+        mock_retrieve.side_effect = lambda user_id, **kwargs: f"context for {user_id}"
+        
+        responses = agent.recommend_batch(requests)
+
+    assert len(llm_client.prompts) == 1
+    prompt = llm_client.prompts[0]
+    assert "[Q0] USER CONTEXT:\ncontext for user0" in prompt
+    assert "[Q7] USER CONTEXT:\ncontext for user7" in prompt
+    assert [r["user_id"] for r in responses] == [f"user{i}" for i in range(8)]
+    assert orjson.loads(responses[3]["llm_response"])["recommendations"][0]["title"] == "Pick 3"
+
+
+def test_recommend_batch_malformed_response(agent, llm_client):
+    llm_client.response = '{"responses": [{"id": "Q1", "recommendations": []}]}'
+    requests = [{"user_id": "user123", "search_results": dummy_search_results()}] * 2
+
+    with patch("services.personal_shopper_agent.retrieve_context", return_value="ctx"):
+        responses = agent.recommend_batch(requests)
+
+    # Missing labels fall back to an unparseable response for the caller to handle
+    assert responses[0]["llm_response"] == ""
+    assert orjson.loads(responses[1]["llm_response"]) == {"recommendations": []}
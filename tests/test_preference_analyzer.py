@@ -7,97 +7,57 @@ import sys
 import importlib.util
 from pathlib import Path
 
-# Load preference_analyzer module directly to avoid torch dependency
-spec = importlib.util.spec_from_file_location(
-    "preference_analyzer",
-    Path(__file__).parent.parent / "services" / "preference_analyzer.py"
-)
-preference_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(preference_module)
+# Load preference_analyzer module directly to avoid torch dependency,
+# executing it only once per process
+if "preference_analyzer" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "preference_analyzer",
+        Path(__file__).parent.parent / "services" / "preference_analyzer.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["preference_analyzer"] = module
+    spec.loader.exec_module(module)
+preference_module = sys.modules["preference_analyzer"]
 PreferenceAnalyzer = preference_module.PreferenceAnalyzer
 
 
+@pytest.fixture(scope="module")
+def analyzer():
+    """Default-configured analyzer; it holds no per-call state, so one serves every test."""
+    return PreferenceAnalyzer()
+
+
 class TestColorExtraction:
     """Test color extraction from product titles."""
     
-    def test_single_color_extraction(self):
-        """Extract single color from title."""
-        analyzer = PreferenceAnalyzer()
-        titles = ["Blue Cotton Shirt"]
-        
-        colors = analyzer.extract_colors(titles)
-        
-        assert "blue" in colors
-        assert colors["blue"] == 1
-    
-    def test_multiple_colors_in_titles(self):
-        """Extract multiple colors from different titles."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Blue Running Shoes",
-            "Black Jeans",
-            "Blue T-Shirt",
-            "Gray Sweater"
-        ]
-        
-        colors = analyzer.extract_colors(titles)
-        
-        assert colors["blue"] == 2
-        assert colors["black"] == 1
-        assert colors["gray"] == 1
-    
-    def test_case_insensitive_color_matching(self):
-        """Colors should match regardless of case."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "BLUE Shirt",
-            "Blue Pants",
-            "blue shoes"
-        ]
-        
-        colors = analyzer.extract_colors(titles)
-        
-        assert colors["blue"] == 3
-    
-    def test_color_boundaries(self):
-        """Color matching should use word boundaries."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Blueberry Pie",  # Should not match "blue"
-            "Blue Shirt",     # Should match
-            "Reddish Dress"   # Should not match "red"
-        ]
-        
-        colors = analyzer.extract_colors(titles)
-        
-        assert colors.get("blue") == 1  # Only "Blue Shirt"
-        assert "red" not in colors
-    
-    def test_empty_title_list(self):
-        """Empty title list should return empty dict."""
-        analyzer = PreferenceAnalyzer()
-        colors = analyzer.extract_colors([])
-        
-        assert colors == {}
+    @pytest.mark.parametrize("titles,expected", [
+        # Single color
+        (["Blue Cotton Shirt"], {"blue": 1}),
+        # Multiple colors across titles
+        (
+            ["Blue Running Shoes", "Black Jeans", "Blue T-Shirt", "Gray Sweater"],
+            {"blue": 2, "black": 1, "gray": 1},
+        ),
+        # Case-insensitive matching
+        (["BLUE Shirt", "Blue Pants", "blue shoes"], {"blue": 3}),
+        # Word boundaries: no "blue" in "Blueberry", no "red" in "Reddish"
+        (["Blueberry Pie", "Blue Shirt", "Reddish Dress"], {"blue": 1}),
+        # A color repeated within one title counts once
+        (["Blue and Blue Striped Shirt", "Navy Blue Jacket"], {"blue": 2, "navy": 1}),
+        # Common colors
+        (
+            ["Red Dress", "Green Jacket", "Yellow Shirt", "Purple Shoes"],
+            {"red": 1, "green": 1, "yellow": 1, "purple": 1},
+        ),
+        # Empty title list
+        ([], {}),
+    ])
+    def test_color_counts(self, analyzer, titles, expected):
+        """Count colors mentioned in product titles."""
+        assert analyzer.extract_colors(titles) == expected
     
-    def test_common_colors(self):
-        """Test extraction of common colors."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Red Dress",
-            "Green Jacket",
-            "Yellow Shirt",
-            "Purple Shoes"
-        ]
-        
-        colors = analyzer.extract_colors(titles)
-        
-        assert len(colors) == 4
-        assert all(color in colors for color in ["red", "green", "yellow", "purple"])
-    
-    def test_sorting_by_frequency(self):
+    def test_sorting_by_frequency(self, analyzer):
         """Colors should be sorted by frequency."""
-        analyzer = PreferenceAnalyzer()
         titles = [
             "Black Shirt",
             "Black Pants",
@@ -118,9 +78,8 @@ class TestColorExtraction:
 class TestCategoryAnalysis:
     """Test category extraction and analysis."""
     
-    def test_category_counting(self):
+    def test_category_counting(self, analyzer):
         """Count category frequencies."""
-        analyzer = PreferenceAnalyzer()
         categories = ["apparel", "footwear", "apparel", "apparel", "footwear"]
         
         result = analyzer.extract_categories(categories)
@@ -128,9 +87,8 @@ class TestCategoryAnalysis:
         assert result["apparel"] == 3
         assert result["footwear"] == 2
     
-    def test_case_insensitive_categories(self):
+    def test_case_insensitive_categories(self, analyzer):
         """Categories should be normalized to lowercase."""
-        analyzer = PreferenceAnalyzer()
         categories = ["Apparel", "FOOTWEAR", "apparel"]
         
         result = analyzer.extract_categories(categories)
@@ -140,9 +98,16 @@ class TestCategoryAnalysis:
         assert "FOOTWEAR" not in result
         assert "footwear" in result
     
-    def test_sorting_categories(self):
+    def test_repeated_spellings_merge(self, analyzer):
+        """Repeated raw spellings fold into one normalized category."""
+        categories = ["Apparel", " apparel ", "Apparel", "", "APPAREL", "bags"]
+        
+        result = analyzer.extract_categories(categories)
+        
+        assert result == {"apparel": 4, "bags": 1}
+    
+    def test_sorting_categories(self, analyzer):
         """Categories should be sorted by frequency."""
-        analyzer = PreferenceAnalyzer()
         categories = [
             "shoes",
             "shoes",
@@ -159,9 +124,8 @@ class TestCategoryAnalysis:
         assert cat_list[1] == "bags"
         assert cat_list[2] == "accessories"
     
-    def test_empty_categories(self):
+    def test_empty_categories(self, analyzer):
         """Empty category list should return empty dict."""
-        analyzer = PreferenceAnalyzer()
         result = analyzer.extract_categories([])
         
         assert result == {}
@@ -170,57 +134,38 @@ class TestCategoryAnalysis:
 class TestStyleKeywordExtraction:
     """Test style keyword detection from titles."""
     
-    def test_single_keyword_extraction(self):
-        """Extract single style keyword."""
-        analyzer = PreferenceAnalyzer()
-        titles = ["Casual Cotton Shirt"]
-        
-        keywords = analyzer.extract_style_keywords(titles)
-        
-        assert "casual" in keywords
-        assert keywords["casual"] == 1
-    
-    def test_multiple_keywords(self):
-        """Extract multiple style keywords from titles."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Elegant formal dress",
-            "Casual comfortable jeans",
-            "Classic elegant blazer"
-        ]
-        
-        keywords = analyzer.extract_style_keywords(titles)
-        
-        assert keywords["elegant"] == 2
-        assert keywords["formal"] == 1
-        assert keywords["casual"] == 1
-        assert keywords["comfortable"] == 1
-        assert keywords["classic"] == 1
+    @pytest.mark.parametrize("titles,expected", [
+        # Single keyword
+        (["Casual Cotton Shirt"], {"casual": 1}),
+        # Multiple keywords across titles
+        (
+            ["Elegant formal dress", "Casual comfortable jeans", "Classic elegant blazer"],
+            {"elegant": 2, "formal": 1, "casual": 1, "comfortable": 1, "classic": 1},
+        ),
+        # Word boundaries: no "formal" in "Formality"
+        (["Formal Wear", "Formality Event"], {"formal": 1}),
+        # No style keywords
+        (["Product A", "Item B", "Thing C"], {}),
+    ])
+    def test_style_keyword_counts(self, analyzer, titles, expected):
+        """Count style keywords mentioned in product titles."""
+        assert analyzer.extract_style_keywords(titles) == expected
     
-    def test_keyword_boundaries(self):
-        """Keywords should use word boundaries."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Formal Wear",      # Should match "formal"
-            "Formality Event"   # Should not match "formal"
-        ]
-        
-        keywords = analyzer.extract_style_keywords(titles)
-        
-        assert keywords.get("formal") == 1
+    @pytest.mark.parametrize("use_automaton", [True, False])
+    def test_matcher_backends_agree(self, monkeypatch, use_automaton):
+        """Aho-Corasick and regex matchers find the same bounded words."""
+        if use_automaton and not preference_module.AHOCORASICK_AVAILABLE:
+            pytest.skip("pyahocorasick not installed")
+        monkeypatch.setattr(preference_module, "AHOCORASICK_AVAILABLE", use_automaton)
+        match = preference_module._vocabulary_matcher(preference_module.STYLE_KEYWORDS)
+        
+        assert match("formal casual wear") == {"formal", "casual"}
+        assert match("formality, casually") == set()
+        assert match("retro-vintage (boho)") == {"retro", "vintage", "boho"}
+        assert match("eco_friendly slim") == {"slim"}
     
-    def test_no_style_keywords(self):
-        """Titles without style keywords return empty dict."""
-        analyzer = PreferenceAnalyzer()
-        titles = ["Product A", "Item B", "Thing C"]
-        
-        keywords = analyzer.extract_style_keywords(titles)
-        
-        assert keywords == {}
-    
-    def test_common_style_keywords(self):
+    def test_common_style_keywords(self, analyzer):
         """Test detection of common style keywords."""
-        analyzer = PreferenceAnalyzer()
         titles = [
             "Boho chic dress",
             "Trendy minimalist look",
@@ -237,45 +182,33 @@ class TestStyleKeywordExtraction:
 class TestProductTypeExtraction:
     """Test product type detection."""
     
-    def test_product_type_identification(self):
-        """Identify product types from titles."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Blue Cotton Shirt",
-            "Black Leather Shoes",
-            "Red Summer Dress"
-        ]
-        
-        types = analyzer.extract_product_types(titles)
-        
-        assert types.get("shirt") == 1
-        assert types.get("shoes") == 1
-        assert types.get("dress") == 1
-    
-    def test_multiple_product_types(self):
-        """Count multiple product types."""
-        analyzer = PreferenceAnalyzer()
-        titles = [
-            "Casual shirt",
-            "Formal shirt",
-            "Running shoes",
-            "Athletic shoes",
-            "Evening dress"
-        ]
-        
-        types = analyzer.extract_product_types(titles)
-        
-        assert types.get("shirt") == 2
-        assert types.get("shoes") == 2
-        assert types.get("dress") == 1
+    @pytest.mark.parametrize("titles,expected", [
+        # One type per title
+        (
+            ["Blue Cotton Shirt", "Black Leather Shoes", "Red Summer Dress"],
+            {"shirt": 1, "shoes": 1, "dress": 1},
+        ),
+        # Repeated types
+        (
+            ["Casual shirt", "Formal shirt", "Running shoes", "Athletic shoes", "Evening dress"],
+            {"shirt": 2, "shoes": 2, "dress": 1},
+        ),
+        # Singular and plural forms are separate words
+        (
+            ["Leather Shoes", "Left Shoe Insert", "Hiking Boots and Boot Laces"],
+            {"shoes": 1, "shoe": 1, "boots": 1, "boot": 1},
+        ),
+    ])
+    def test_product_type_counts(self, analyzer, titles, expected):
+        """Count product types mentioned in product titles."""
+        assert analyzer.extract_product_types(titles) == expected
 
 
 class TestFullAnalysis:
     """Test complete preference analysis."""
     
-    def test_full_preference_analysis(self):
+    def test_full_preference_analysis(self, analyzer):
         """Complete analysis of user preferences."""
-        analyzer = PreferenceAnalyzer()
         purchases = [
             "Blue Casual Shirt",
             "Blue Elegant Dress",
@@ -292,9 +225,8 @@ class TestFullAnalysis:
         assert analysis["unique_colors"] > 0
         assert analysis["unique_keywords"] > 0
     
-    def test_analysis_with_no_purchases(self):
+    def test_analysis_with_no_purchases(self, analyzer):
         """Analysis of empty purchase list returns defaults."""
-        analyzer = PreferenceAnalyzer()
         
         analysis = analyzer.analyze_preferences([])
         
@@ -340,9 +272,8 @@ class TestFullAnalysis:
 class TestConvenienceMethods:
     """Test convenience methods for quick access."""
     
-    def test_get_top_colors(self):
+    def test_get_top_colors(self, analyzer):
         """Get top N colors quickly."""
-        analyzer = PreferenceAnalyzer()
         titles = [
             "Blue Shirt",
             "Blue Pants",
@@ -355,9 +286,22 @@ class TestConvenienceMethods:
         assert len(top_colors) <= 2
         assert "blue" in top_colors
     
-    def test_get_top_categories(self):
+    def test_top_n_matches_full_ranking(self):
+        """Top-N selection agrees with the full ranking, ties included."""
+        analyzer = PreferenceAnalyzer(min_frequency=2)
+        titles = [
+            "Red Casual Shirt", "Blue Casual Dress", "Black Formal Shoes",
+            "Red Formal Jacket", "Blue Vintage Shirt", "Black Vintage Shirt",
+            "Green Casual Hat",
+        ]
+        
+        for n in range(1, 5):
+            assert analyzer.get_top_colors(titles, n=n) == list(analyzer.extract_colors(titles))[:n]
+            assert analyzer.get_top_style_keywords(titles, n=n) == list(analyzer.extract_style_keywords(titles))[:n]
+        assert "green" not in analyzer.get_top_colors(titles, n=5)
+    
+    def test_get_top_categories(self, analyzer):
         """Get top N categories quickly."""
-        analyzer = PreferenceAnalyzer()
         categories = [
             "shoes", "shoes", "shoes",
             "bags", "bags",
@@ -370,9 +314,8 @@ class TestConvenienceMethods:
         assert "shoes" in top_cats
         assert "bags" in top_cats
     
-    def test_get_top_style_keywords(self):
+    def test_get_top_style_keywords(self, analyzer):
         """Get top N style keywords quickly."""
-        analyzer = PreferenceAnalyzer()
         titles = [
             "Casual comfortable shirt",
             "Casual trendy dress",
@@ -384,9 +327,8 @@ class TestConvenienceMethods:
         assert len(top_keywords) <= 3
         assert "casual" in top_keywords
     
-    def test_infer_style_profile(self):
+    def test_infer_style_profile(self, analyzer):
         """Infer overall style profile."""
-        analyzer = PreferenceAnalyzer()
         purchases = [
             "Casual comfortable shirt",
             "Casual trendy dress",
@@ -399,13 +341,26 @@ class TestConvenienceMethods:
         assert len(profile) > 0
         assert profile.isupper() or profile[0].isupper()
     
-    def test_infer_style_profile_empty(self):
+    def test_infer_style_profile_empty(self, analyzer):
         """Empty purchases should return 'Unknown'."""
-        analyzer = PreferenceAnalyzer()
         
         profile = analyzer.infer_style_profile([])
         
         assert profile == "Unknown"
+    
+    def test_infer_style_profile_matches_analysis(self, analyzer):
+        """Profile uses the same top keywords as the full analysis."""
+        purchases = [
+            "Casual comfortable shirt",
+            "Casual trendy dress",
+            "Classic elegant jacket",
+            "Trendy casual sneakers"
+        ]
+        
+        keywords = analyzer.analyze_preferences(purchases)["style_keywords"]
+        
+        assert analyzer.infer_style_profile(purchases) == ", ".join(list(keywords)[:3]).title()
+        assert analyzer.infer_style_profile(["Plain item"]) == "Undefined"
 
 
 class TestAnalyzerConfiguration:
@@ -453,9 +408,8 @@ class TestAnalyzerConfiguration:
 class TestRealWorldScenarios:
     """Test with realistic user purchase data."""
     
-    def test_fashion_enthusiast(self):
+    def test_fashion_enthusiast(self, analyzer):
         """Analyze fashion-focused user purchases."""
-        analyzer = PreferenceAnalyzer()
         purchases = [
             "Blue formal evening dress",
             "Black classic blazer",
@@ -479,9 +433,8 @@ class TestRealWorldScenarios:
         style_profile = analyzer.infer_style_profile(purchases)
         assert style_profile != "Unknown"
     
-    def test_mixed_preferences(self):
+    def test_mixed_preferences(self, analyzer):
         """Analyze user with diverse preferences."""
-        analyzer = PreferenceAnalyzer()
         purchases = [
             "Casual blue jeans",
             "Formal red dress",
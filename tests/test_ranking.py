@@ -8,7 +8,8 @@ Tests verify:
 """
 import pytest
 import numpy as np
-from typing import List, Dict, Any
+from types import SimpleNamespace
+from typing import Dict, Any
 import sys
 from pathlib import Path
 import importlib.util
@@ -17,12 +18,15 @@ import importlib.util
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
-# Import ranking module directly without triggering services/__init__.py
-ranking_path = str(parent_dir / "services" / "ranking.py")
-spec = importlib.util.spec_from_file_location("ranking_module", ranking_path)
-ranking_module = importlib.util.module_from_spec(spec)
-sys.modules['ranking_module'] = ranking_module
-spec.loader.exec_module(ranking_module)
+# Import ranking module directly without triggering services/__init__.py,
+# executing it only once per process
+if 'ranking_module' not in sys.modules:
+    ranking_path = str(parent_dir / "services" / "ranking.py")
+    spec = importlib.util.spec_from_file_location("ranking_module", ranking_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['ranking_module'] = module
+    spec.loader.exec_module(module)
+ranking_module = sys.modules['ranking_module']
 
 # Get the functions we need
 text_similarity = ranking_module.text_similarity
@@ -32,29 +36,25 @@ rerank_results = ranking_module.rerank_results
 cosine_similarity_embeddings = ranking_module.cosine_similarity_embeddings
 
 
-class MockSearchResult:
-    """Mock search result for testing."""
-    def __init__(
-        self,
-        product_id: str,
-        title: str,
-        category: str,
-        color: str,
-        similarity: float,
-        distance: float = None,
-        title_embedding: List[float] = None
-    ):
-        self.product_id = product_id
-        self.title = title
-        self.category = category
-        self.color = color
-        self.similarity = similarity
-        self.distance = distance if distance is not None else (1.0 - similarity)
-        self.title_embedding = title_embedding or [0.0] * 512
-        self.description = f"Description for {title}"
-        self.image_path = f"/images/{product_id}.jpg"
-        self.final_score = None
-        self.debug_scores = None
+def make_result(
+    product_id: str,
+    title: str,
+    category: str,
+    color: str,
+    similarity: float,
+    distance: float = None,
+) -> Dict[str, Any]:
+    """Build a search result dict as rerank_results receives it."""
+    return {
+        "product_id": product_id,
+        "title": title,
+        "category": category,
+        "color": color,
+        "similarity": similarity,
+        "distance": distance if distance is not None else (1.0 - similarity),
+        "description": f"Description for {title}",
+        "image_path": f"/images/{product_id}.jpg",
+    }
 
 
 class TestColorMatchRanking:
@@ -63,14 +63,14 @@ class TestColorMatchRanking:
     def test_color_match_beats_higher_similarity(self):
         """Product with color match should rank higher even with lower vector similarity"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Red Cotton Shirt",
                 category="shirts",
                 color="red",
                 similarity=0.85  # Higher vector similarity
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Blue Silk Shirt",
                 category="shirts",
@@ -95,14 +95,14 @@ class TestColorMatchRanking:
     def test_color_match_with_equal_similarity(self):
         """With equal similarity, color match should be tiebreaker"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Green Dress",
                 category="dresses",
                 color="green",
                 similarity=0.80
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Blue Dress",
                 category="dresses",
@@ -129,14 +129,14 @@ class TestCategoryMatchRanking:
     def test_category_match_boosts_ranking(self):
         """Product matching category filter should rank higher"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Running Shoes",
                 category="shoes",
                 color="black",
                 similarity=0.80
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Summer Dress",
                 category="dresses",
@@ -159,21 +159,21 @@ class TestCategoryMatchRanking:
     def test_category_and_color_combined(self):
         """Both category and color matches should provide maximum boost"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Red Shirt",
                 category="shirts",
                 color="red",
                 similarity=0.70  # Lower similarity
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Blue Dress",
                 category="dresses",
                 color="blue",
                 similarity=0.85  # Higher similarity but no filter matches
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod3",
                 title="Blue Shirt",
                 category="shirts",
@@ -202,14 +202,14 @@ class TestTextSimilarityScoring:
     def test_text_similarity_affects_score(self):
         """Products with matching keywords should score higher"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Generic Product",  # No matching keywords
                 category="misc",
                 color="white",
                 similarity=0.75
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Blue Running Shoes",  # Matching keywords
                 category="misc",
@@ -232,14 +232,14 @@ class TestTextSimilarityScoring:
     def test_partial_text_match(self):
         """Partial text matches should provide proportional boost"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Blue Dress",  # 1/3 match
                 category="dresses",
                 color="blue",
                 similarity=0.70
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Blue Evening Dress",  # 2/3 match
                 category="dresses",
@@ -265,14 +265,14 @@ class TestTextSimilarityScoring:
     def test_text_similarity_with_filters(self):
         """Text similarity should work alongside filter boosts"""
         results = [
-            MockSearchResult(
+            make_result(
                 product_id="prod1",
                 title="Item",  # Matches color but not text
                 category="misc",
                 color="red",
                 similarity=0.75
             ),
-            MockSearchResult(
+            make_result(
                 product_id="prod2",
                 title="Red Velvet Cake",  # Matches both color and text
                 category="misc",
@@ -293,5 +293,73 @@ class TestTextSimilarityScoring:
         assert reranked[0]["final_score"] > reranked[1]["final_score"]
 
 
+class TestScoreWeights:
+    """Test weight overrides in re-ranking."""
+    
+    def test_rerank_scores_match_compute_final_score(self):
+        """Scores from rerank_results equal compute_final_score with the same weights"""
+        weights = {"vector": 0.7, "text": 0.1}
+        results = [
+            make_result("prod1", "Red Dress", "apparel", "red", 0.6),
+            make_result("prod2", "Blue Shirt", "apparel", "blue", 0.9),
+        ]
+        
+        reranked = rerank_results(
+            results=results,
+            query_text="red dress",
+            query_color="red",
+            query_category="apparel",
+            weights=weights,
+            add_debug_scores=True
+        )
+        
+        for rd in reranked:
+            debug = rd["debug_scores"]
+            assert rd["final_score"] == compute_final_score(
+                vector_sim=debug["vector_score"],
+                color_match=debug["color_score"],
+                category_match=debug["category_score"],
+                text_sim=debug["text_score"],
+                weights=weights,
+            )
+        assert ranking_module.DEFAULT_WEIGHTS["vector"] == 0.4
+    
+    def test_rerank_accepts_result_objects(self):
+        """SearchResult-like objects are converted to dicts before scoring"""
+        result = SimpleNamespace(**make_result("prod1", "Red Dress", "apparel", "red", 0.8))
+        
+        reranked = rerank_results(results=[result], query_text="red dress", query_color="red")
+        
+        assert isinstance(reranked[0], dict)
+        assert reranked[0]["product_id"] == "prod1"
+        assert reranked[0]["final_score"] > 0
+    
+    def test_rerank_in_place_keeps_original_objects(self):
+        """In-place re-ranking reorders and annotates the given objects"""
+        red = SimpleNamespace(**make_result("prod1", "Red Dress", "apparel", "red", 0.6))
+        blue = SimpleNamespace(**make_result("prod2", "Blue Dress", "apparel", "blue", 0.6))
+        
+        reranked = rerank_results(
+            results=[blue, red],
+            query_color="red",
+            add_debug_scores=True,
+            in_place=True
+        )
+        
+        assert reranked[0] is red
+        assert reranked[1] is blue
+        assert red.final_score > blue.final_score
+        assert red.debug_scores["color_score"] == 1.0
+    
+    def test_prepared_query_matches_text_similarity(self):
+        """Preparing the query once gives the same similarity as text_similarity"""
+        query = ranking_module._prepare_query("comfortable apparel for workout")
+        
+        for title in ["Cotton Hoodie", "Yoga Mat", "Leather Shoe Set", ""]:
+            assert ranking_module._text_similarity_prepared(query, title) == text_similarity(
+                "comfortable apparel for workout", title
+            )
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -7,10 +7,9 @@ Tests verify:
 - A/B framework integration
 """
 import pytest
-from unittest.mock import Mock, patch
+from collections import Counter
 from services.ab_testing import (
     get_experiment_manager,
-    reset_experiment_manager,
     ExperimentVariant,
     SearchEvent,
 )
@@ -20,143 +19,47 @@ from services.search_variants import (
     get_search_variant,
 )
 from models.search import ProductResult
+from tests.helpers import make_search_result
+
+
+# Search service result shared by the direct variant tests
+SEARCH_RESULT = make_search_result(
+    title="Blue Shoes",
+    description="Running shoes",
+    image_path="/img.jpg"
+)
 
 
 @pytest.fixture
 def cleanup_ab():
-    """Cleanup A/B testing data before and after tests."""
-    reset_experiment_manager()
+    """Clear A/B testing data in place before and after tests."""
+    manager = get_experiment_manager()
+    manager.reset()
     yield
-    reset_experiment_manager()
+    manager.reset()
 
 
 class TestSearchVariantsDirect:
     """Direct tests for search variants."""
     
-    @patch('services.search_variants.get_search_service')
-    def test_v1_returns_results(self, mock_get_service, cleanup_ab):
-        """Test that V1 search returns results."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_001"
-        mock_result.title = "Blue Shoes"
-        mock_result.description = "Running shoes"
-        mock_result.color = "blue"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/img.jpg"
-        mock_result.similarity = 0.95
-        mock_result.distance = 0.05
-        mock_result.debug_scores = None
-        
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
-        
-        results, elapsed = SearchVariantV1.search_by_text("test")
+    @pytest.mark.parametrize("variant,method,query,expected_rerank", [
+        (SearchVariantV1, "search_by_text", "test", False),
+        (SearchVariantV2, "search_by_text", "test", True),
+        (SearchVariantV1, "search_by_image", "/path/to/img.jpg", False),
+        (SearchVariantV2, "search_by_image", "/path/to/img.jpg", True),
+    ])
+    def test_variant_behavior(self, variant, method, query, expected_rerank, patched_search_service):
+        """Each variant converts results and toggles re-ranking for both search modes."""
+        service_method = getattr(patched_search_service, method)
+        service_method.return_value = [SEARCH_RESULT]
+        
+        results, elapsed = getattr(variant, method)(query)
         
         assert len(results) == 1
         assert isinstance(results[0], ProductResult)
-        assert results[0].product_id == "prod_001"
-        assert results[0].title == "Blue Shoes"
-    
-    @patch('services.search_variants.get_search_service')
-    def test_v2_returns_results(self, mock_get_service, cleanup_ab):
-        """Test that V2 search returns results."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_002"
-        mock_result.title = "Red Shoes"
-        mock_result.description = "Casual shoes"
-        mock_result.color = "red"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/img2.jpg"
-        mock_result.similarity = 0.88
-        mock_result.distance = 0.12
-        mock_result.debug_scores = None
-        
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
-        
-        results, elapsed = SearchVariantV2.search_by_text("test")
-        
-        assert len(results) == 1
-        assert results[0].product_id == "prod_002"
-        assert results[0].title == "Red Shoes"
-    
-    @patch('services.search_variants.get_search_service')
-    def test_v1_disables_reranking(self, mock_get_service, cleanup_ab):
-        """Test that V1 disables re-ranking."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = []
-        mock_get_service.return_value = mock_service
-        
-        SearchVariantV1.search_by_text("test")
-        
-        # Check that enable_reranking=False was passed
-        call_kwargs = mock_service.search_by_text.call_args[1]
-        assert call_kwargs['enable_reranking'] is False
-    
-    @patch('services.search_variants.get_search_service')
-    def test_v2_enables_reranking(self, mock_get_service, cleanup_ab):
-        """Test that V2 enables re-ranking."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = []
-        mock_get_service.return_value = mock_service
-        
-        SearchVariantV2.search_by_text("test")
-        
-        # Check that enable_reranking=True was passed
-        call_kwargs = mock_service.search_by_text.call_args[1]
-        assert call_kwargs['enable_reranking'] is True
-    
-    @patch('services.search_variants.get_search_service')
-    def test_v1_image_search(self, mock_get_service, cleanup_ab):
-        """Test V1 image search."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_001"
-        mock_result.title = "Blue Shoes"
-        mock_result.description = "Running shoes"
-        mock_result.color = "blue"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/img.jpg"
-        mock_result.similarity = 0.95
-        mock_result.distance = 0.05
-        mock_result.debug_scores = None
-        
-        mock_service = Mock()
-        mock_service.search_by_image.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
-        
-        results, elapsed = SearchVariantV1.search_by_image("/path/to/img.jpg")
-        
-        assert len(results) == 1
-        # Check that enable_reranking=False was passed
-        call_kwargs = mock_service.search_by_image.call_args[1]
-        assert call_kwargs['enable_reranking'] is False
-    
-    @patch('services.search_variants.get_search_service')
-    def test_v2_image_search(self, mock_get_service, cleanup_ab):
-        """Test V2 image search."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_002"
-        mock_result.title = "Red Shoes"
-        mock_result.description = "Casual shoes"
-        mock_result.color = "red"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/img2.jpg"
-        mock_result.similarity = 0.88
-        mock_result.distance = 0.12
-        mock_result.debug_scores = None
-        
-        mock_service = Mock()
-        mock_service.search_by_image.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
-        
-        results, elapsed = SearchVariantV2.search_by_image("/path/to/img.jpg")
-        
-        assert len(results) == 1
-        # Check that enable_reranking=True was passed
-        call_kwargs = mock_service.search_by_image.call_args[1]
-        assert call_kwargs['enable_reranking'] is True
+        assert results[0].product_id == SEARCH_RESULT.product_id
+        assert results[0].title == SEARCH_RESULT.title
+        assert service_method.call_args[1]['enable_reranking'] is expected_rerank
 
 
 class TestABFrameworkIntegration:
@@ -236,15 +139,11 @@ class TestABFrameworkIntegration:
         """Test that variants are distributed to different users."""
         manager = get_experiment_manager()
         
-        # Assign to many users
-        v1_count = 0
-        v2_count = 0
-        for i in range(100):
-            assignment = manager.assign_variant(f"user{i}")
-            if assignment.variant == ExperimentVariant.SEARCH_V1:
-                v1_count += 1
-            else:
-                v2_count += 1
+        # Assign to many users in one pass
+        assignments = manager.assign_variants_bulk([f"user{i}" for i in range(100)])
+        counts = Counter(assignment.variant for assignment in assignments.values())
+        v1_count = counts[ExperimentVariant.SEARCH_V1]
+        v2_count = counts[ExperimentVariant.SEARCH_V2]
         
         # Both variants should have been assigned
         assert v1_count > 0
@@ -252,24 +151,19 @@ class TestABFrameworkIntegration:
         # Should be roughly balanced (50/50)
         assert abs(v1_count - v2_count) < 50  # Allow up to 50 difference
     
-    @patch('services.search_variants.get_search_service')
-    def test_end_to_end_v1_search_with_logging(self, mock_get_service, cleanup_ab):
+    def test_end_to_end_v1_search_with_logging(self, patched_search_service, cleanup_ab):
         """End-to-end test: Assign V1, execute search, log event."""
         # Setup mock
-        mock_result = Mock()
-        mock_result.product_id = "prod_001"
-        mock_result.title = "Test Product"
-        mock_result.description = "Description"
-        mock_result.color = "blue"
-        mock_result.category = "test"
-        mock_result.image_path = "/img.jpg"
-        mock_result.similarity = 0.9
-        mock_result.distance = 0.1
-        mock_result.debug_scores = None
+        mock_result = make_search_result(
+            title="Test Product",
+            description="Description",
+            category="test",
+            image_path="/img.jpg",
+            similarity=0.9,
+            distance=0.1
+        )
         
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [mock_result]
         
         manager = get_experiment_manager()
         
@@ -296,24 +190,21 @@ class TestABFrameworkIntegration:
         assert events[0].query == "test query"
         assert events[0].results_count == 1
     
-    @patch('services.search_variants.get_search_service')
-    def test_end_to_end_v2_search_with_logging(self, mock_get_service, cleanup_ab):
+    def test_end_to_end_v2_search_with_logging(self, patched_search_service, cleanup_ab):
         """End-to-end test: Assign V2, execute search, log event."""
         # Setup mock
-        mock_result = Mock()
-        mock_result.product_id = "prod_002"
-        mock_result.title = "Another Product"
-        mock_result.description = "Description 2"
-        mock_result.color = "red"
-        mock_result.category = "test"
-        mock_result.image_path = "/img2.jpg"
-        mock_result.similarity = 0.85
-        mock_result.distance = 0.15
-        mock_result.debug_scores = None
+        mock_result = make_search_result(
+            product_id="prod_002",
+            title="Another Product",
+            description="Description 2",
+            color="red",
+            category="test",
+            image_path="/img2.jpg",
+            similarity=0.85,
+            distance=0.15
+        )
         
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [mock_result]
         
         manager = get_experiment_manager()
         
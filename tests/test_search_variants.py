@@ -8,7 +8,6 @@ Tests verify:
 - Endpoint integration
 """
 import pytest
-from unittest.mock import Mock, patch, MagicMock
 from typing import List
 import time
 
@@ -20,42 +19,28 @@ from services.search_variants import (
 )
 from models.search import ProductResult
 from services.ab_testing import ExperimentVariant
+from tests.helpers import make_search_result
 
 
-# Mock data
-MOCK_SEARCH_RESULT = Mock()
-MOCK_SEARCH_RESULT.product_id = "prod_001"
-MOCK_SEARCH_RESULT.title = "Blue Running Shoes"
-MOCK_SEARCH_RESULT.description = "Comfortable running shoes"
-MOCK_SEARCH_RESULT.color = "blue"
-MOCK_SEARCH_RESULT.category = "footwear"
-MOCK_SEARCH_RESULT.image_path = "/images/shoes.jpg"
-MOCK_SEARCH_RESULT.similarity = 0.95
-MOCK_SEARCH_RESULT.distance = 0.05
-MOCK_SEARCH_RESULT.debug_scores = None
-
-MOCK_SEARCH_RESULT_2 = Mock()
-MOCK_SEARCH_RESULT_2.product_id = "prod_002"
-MOCK_SEARCH_RESULT_2.title = "Blue Sneakers"
-MOCK_SEARCH_RESULT_2.description = "Casual sneakers"
-MOCK_SEARCH_RESULT_2.color = "blue"
-MOCK_SEARCH_RESULT_2.category = "footwear"
-MOCK_SEARCH_RESULT_2.image_path = "/images/sneakers.jpg"
-MOCK_SEARCH_RESULT_2.similarity = 0.85
-MOCK_SEARCH_RESULT_2.distance = 0.15
-MOCK_SEARCH_RESULT_2.debug_scores = None
+# Search service results, built once
+MOCK_SEARCH_RESULT = make_search_result()
+MOCK_SEARCH_RESULT_2 = make_search_result(
+    product_id="prod_002",
+    title="Blue Sneakers",
+    description="Casual sneakers",
+    image_path="/images/sneakers.jpg",
+    similarity=0.85,
+    distance=0.15
+)
 
 
 class TestSearchVariantV1:
     """Tests for SearchVariantV1 (vector similarity only)."""
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_text_basic(self, mock_get_service):
+    def test_search_by_text_basic(self, patched_search_service):
         """Test basic text search with V1."""
         # Setup mock
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV1.search_by_text(
@@ -72,16 +57,13 @@ class TestSearchVariantV1:
         assert elapsed_ms >= 0  # Should be >= 0 (can be very small with mocks)
         
         # Verify service called with enable_reranking=False
-        mock_service.search_by_text.assert_called_once()
-        call_kwargs = mock_service.search_by_text.call_args[1]
+        patched_search_service.search_by_text.assert_called_once()
+        call_kwargs = patched_search_service.search_by_text.call_args[1]
         assert call_kwargs['enable_reranking'] is False
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_text_with_filters(self, mock_get_service):
+    def test_search_by_text_with_filters(self, patched_search_service):
         """Test text search with category and color filters."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV1.search_by_text(
@@ -93,16 +75,13 @@ class TestSearchVariantV1:
         
         # Assert
         assert len(results) == 1
-        call_kwargs = mock_service.search_by_text.call_args[1]
+        call_kwargs = patched_search_service.search_by_text.call_args[1]
         assert call_kwargs['category_filter'] == "footwear"
         assert call_kwargs['color_filter'] == "blue"
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_text_multiple_results(self, mock_get_service):
+    def test_search_by_text_multiple_results(self, patched_search_service):
         """Test text search returning multiple results."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT, MOCK_SEARCH_RESULT_2]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT, MOCK_SEARCH_RESULT_2]
         
         # Execute
         results, elapsed_ms = SearchVariantV1.search_by_text(
@@ -115,12 +94,9 @@ class TestSearchVariantV1:
         assert results[0].similarity == 0.95
         assert results[1].similarity == 0.85
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_image_basic(self, mock_get_service):
+    def test_search_by_image_basic(self, patched_search_service):
         """Test basic image search with V1."""
-        mock_service = Mock()
-        mock_service.search_by_image.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_image.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV1.search_by_image(
@@ -133,15 +109,12 @@ class TestSearchVariantV1:
         assert elapsed_ms >= 0  # Should be >= 0 (can be very small with mocks)
         
         # Verify service called with enable_reranking=False
-        call_kwargs = mock_service.search_by_image.call_args[1]
+        call_kwargs = patched_search_service.search_by_image.call_args[1]
         assert call_kwargs['enable_reranking'] is False
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_exception_handling(self, mock_get_service):
+    def test_search_exception_handling(self, patched_search_service):
         """Test exception handling in search_by_text."""
-        mock_service = Mock()
-        mock_service.search_by_text.side_effect = RuntimeError("Service error")
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.side_effect = RuntimeError("Service error")
         
         # Execute and assert
         with pytest.raises(Exception) as exc_info:
@@ -153,13 +126,10 @@ class TestSearchVariantV1:
 class TestSearchVariantV2:
     """Tests for SearchVariantV2 (vector + ranking engine)."""
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_text_with_reranking(self, mock_get_service):
+    def test_search_by_text_with_reranking(self, patched_search_service):
         """Test text search with V2 (re-ranking enabled)."""
         # Setup mock
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV2.search_by_text(
@@ -174,32 +144,24 @@ class TestSearchVariantV2:
         assert elapsed_ms >= 0  # Should be >= 0 (can be very small with mocks)
         
         # Verify service called with enable_reranking=True
-        call_kwargs = mock_service.search_by_text.call_args[1]
+        call_kwargs = patched_search_service.search_by_text.call_args[1]
         assert call_kwargs['enable_reranking'] is True
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_text_debug_scores(self, mock_get_service):
+    def test_search_by_text_debug_scores(self, patched_search_service):
         """Test text search with debug scoring enabled."""
-        mock_result = Mock()
-        mock_result.product_id = "prod_001"
-        mock_result.title = "Blue Shoes"
-        mock_result.description = "Description"
-        mock_result.color = "blue"
-        mock_result.category = "footwear"
-        mock_result.image_path = "/images/shoes.jpg"
-        mock_result.similarity = 0.95
-        mock_result.distance = 0.05
-        mock_result.debug_scores = {
-            "vector_score": 0.95,
-            "color_score": 1.0,
-            "category_score": 1.0,
-            "text_score": 0.8,
-            "final_score": 0.88
-        }
-        
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [mock_result]
-        mock_get_service.return_value = mock_service
+        mock_result = make_search_result(
+            title="Blue Shoes",
+            description="Description",
+            debug_scores={
+                "vector_score": 0.95,
+                "color_score": 1.0,
+                "category_score": 1.0,
+                "text_score": 0.8,
+                "final_score": 0.88
+            }
+        )
+        
+        patched_search_service.search_by_text.return_value = [mock_result]
         
         # Execute
         results, elapsed_ms = SearchVariantV2.search_by_text(
@@ -211,12 +173,9 @@ class TestSearchVariantV2:
         assert results[0].debug_scores is not None
         assert results[0].debug_scores["final_score"] == 0.88
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_image_with_reranking(self, mock_get_service):
+    def test_search_by_image_with_reranking(self, patched_search_service):
         """Test image search with V2 (re-ranking enabled)."""
-        mock_service = Mock()
-        mock_service.search_by_image.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_image.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV2.search_by_image(
@@ -228,15 +187,12 @@ class TestSearchVariantV2:
         assert len(results) == 1
         
         # Verify service called with enable_reranking=True
-        call_kwargs = mock_service.search_by_image.call_args[1]
+        call_kwargs = patched_search_service.search_by_image.call_args[1]
         assert call_kwargs['enable_reranking'] is True
     
-    @patch('services.search_variants.get_search_service')
-    def test_search_by_image_with_filters(self, mock_get_service):
+    def test_search_by_image_with_filters(self, patched_search_service):
         """Test image search with filters."""
-        mock_service = Mock()
-        mock_service.search_by_image.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_image.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV2.search_by_image(
@@ -247,7 +203,7 @@ class TestSearchVariantV2:
         )
         
         # Assert
-        call_kwargs = mock_service.search_by_image.call_args[1]
+        call_kwargs = patched_search_service.search_by_image.call_args[1]
         assert call_kwargs['category_filter'] == "footwear"
         assert call_kwargs['color_filter'] == "blue"
 
@@ -255,34 +211,28 @@ class TestSearchVariantV2:
 class TestVariantComparison:
     """Tests comparing V1 and V2 behavior."""
     
-    @patch('services.search_variants.get_search_service')
-    def test_v1_no_reranking_v2_with_reranking(self, mock_get_service):
+    def test_v1_no_reranking_v2_with_reranking(self, patched_search_service):
         """Test that V1 disables re-ranking while V2 enables it."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute V1
         SearchVariantV1.search_by_text(query_text="test")
-        v1_call = mock_service.search_by_text.call_args[1]['enable_reranking']
+        v1_call = patched_search_service.search_by_text.call_args[1]['enable_reranking']
         
         # Reset mock
-        mock_service.reset_mock()
+        patched_search_service.reset_mock()
         
         # Execute V2
         SearchVariantV2.search_by_text(query_text="test")
-        v2_call = mock_service.search_by_text.call_args[1]['enable_reranking']
+        v2_call = patched_search_service.search_by_text.call_args[1]['enable_reranking']
         
         # Assert
         assert v1_call is False
         assert v2_call is True
     
-    @patch('services.search_variants.get_search_service')
-    def test_timing_measured(self, mock_get_service):
+    def test_timing_measured(self, patched_search_service):
         """Test that search timing is measured correctly."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, elapsed_ms = SearchVariantV1.search_by_text(query_text="test")
@@ -323,12 +273,9 @@ class TestGetSearchVariant:
 class TestProductResultConversion:
     """Tests for converting search results to ProductResult."""
     
-    @patch('services.search_variants.get_search_service')
-    def test_result_fields_preserved(self, mock_get_service):
+    def test_result_fields_preserved(self, patched_search_service):
         """Test that all result fields are preserved in conversion."""
-        mock_service = Mock()
-        mock_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
-        mock_get_service.return_value = mock_service
+        patched_search_service.search_by_text.return_value = [MOCK_SEARCH_RESULT]
         
         # Execute
         results, _ = SearchVariantV1.search_by_text(query_text="test")
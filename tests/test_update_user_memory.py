@@ -5,7 +5,12 @@ import pytest
 from unittest.mock import MagicMock, patch
 from datetime import datetime
 
-from db.user_service import UserProfileService
+from db.user_service import UserProfileService, ASCENDING
+from models.user import MAX_PURCHASE_HISTORY
+
+
+# Fixed timestamp for fixture documents; naive UTC like the service writes
+_FIXTURE_NOW = datetime(2024, 1, 1)
 
 
 @pytest.fixture
@@ -37,15 +42,13 @@ def sample_user_profile():
         "preferred_colors": ["red", "black"],
         "preferred_categories": ["apparel"],
         "price_range": {"min": 20.0, "max": 80.0},
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "created_at": _FIXTURE_NOW,
+        "updated_at": _FIXTURE_NOW
     }
 
 
 def test_update_user_memory_adds_purchase(mock_service, sample_product, sample_user_profile):
     """Test that update_user_memory adds product to purchase history."""
-    # Mock get_user_profile and find_one_and_update
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = {
         **sample_user_profile,
         "past_purchases": sample_user_profile["past_purchases"] + [sample_product["title"]]
@@ -57,13 +60,14 @@ def test_update_user_memory_adds_purchase(mock_service, sample_product, sample_u
     assert result is not None
     mock_service.users.find_one_and_update.assert_called_once()
     call_args = mock_service.users.find_one_and_update.call_args
-    assert "$addToSet" in call_args[0][1]
-    assert call_args[0][1]["$addToSet"]["past_purchases"] == "Blue Casual Shirt"
+    assert call_args[0][1]["$push"]["past_purchases"] == {
+        "$each": ["Blue Casual Shirt"],
+        "$slice": -MAX_PURCHASE_HISTORY
+    }
 
 
 def test_update_user_memory_adds_color_preference(mock_service, sample_product, sample_user_profile):
     """Test that update_user_memory adds new color to preferences."""
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
     result = mock_service.update_user_memory("user123", sample_product, auto_update_preferences=True)
@@ -78,11 +82,10 @@ def test_update_user_memory_adds_color_preference(mock_service, sample_product,
 def test_update_user_memory_adds_category_preference(mock_service, sample_product, sample_user_profile):
     """Test that update_user_memory adds category if not already present."""
     # User doesn't have this category yet
-    profile_copy = sample_user_profile.copy()
-    profile_copy["preferred_categories"] = ["footwear"]
-    
-    mock_service.get_user_profile = MagicMock(return_value=profile_copy)
-    mock_service.users.find_one_and_update.return_value = profile_copy
+    mock_service.users.find_one_and_update.return_value = {
+        **sample_user_profile,
+        "preferred_categories": ["footwear"]
+    }
     
     result = mock_service.update_user_memory("user123", sample_product, auto_update_preferences=True)
     
@@ -93,30 +96,21 @@ def test_update_user_memory_adds_category_preference(mock_service, sample_produc
 
 
 def test_update_user_memory_expands_price_range(mock_service, sample_product, sample_user_profile):
-    """Test that update_user_memory expands price range when needed."""
-    # Product price (49.99) is within range, so no change
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
+    """Test that update_user_memory widens the price range atomically."""
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
-    result = mock_service.update_user_memory("user123", sample_product, auto_update_preferences=True)
-    
-    # Price range should not be updated since product is within range (20-80)
-    call_args = mock_service.users.find_one_and_update.call_args
-    # No price_range in $set if within range
-    
-    # Now test with expensive product
     expensive_product = {**sample_product, "price": 150.0}
     result = mock_service.update_user_memory("user123", expensive_product, auto_update_preferences=True)
     
-    # Price range should be updated
-    call_args = mock_service.users.find_one_and_update.call_args
-    if "price_range" in call_args[0][1]["$set"]:
-        assert call_args[0][1]["$set"]["price_range"]["max"] == 150.0
+    # $min/$max only move the bounds when the price falls outside them
+    update_ops = mock_service.users.find_one_and_update.call_args[0][1]
+    assert update_ops["$min"] == {"price_range.min": 150.0}
+    assert update_ops["$max"] == {"price_range.max": 150.0}
+    assert "$set" not in update_ops
 
 
 def test_update_user_memory_without_auto_preferences(mock_service, sample_product, sample_user_profile):
     """Test that auto_update_preferences=False doesn't update preferences."""
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
     result = mock_service.update_user_memory("user123", sample_product, auto_update_preferences=False)
@@ -126,39 +120,58 @@ def test_update_user_memory_without_auto_preferences(mock_service, sample_produc
     update_ops = call_args[0][1]
     
     # Should have purchase
-    assert "$addToSet" in update_ops
-    assert "past_purchases" in update_ops["$addToSet"]
+    assert "past_purchases" in update_ops["$push"]
     
     # Should NOT have preference updates
-    assert "preferred_colors" not in update_ops.get("$addToSet", {})
-    assert "preferred_categories" not in update_ops.get("$addToSet", {})
+    assert "$addToSet" not in update_ops
+    assert "$min" not in update_ops and "$max" not in update_ops
+    
+    # Recording a purchase needs no read of the existing profile
+    mock_service.users.find_one.assert_not_called()
+    mock_service.users.find_one_and_update.assert_called_once()
 
 
 def test_update_user_memory_creates_user_if_not_exists(mock_service, sample_product):
-    """Test that update_user_memory creates user if they don't exist."""
-    # Mock get_user_profile to return None (user doesn't exist)
-    mock_service.get_user_profile = MagicMock(return_value=None)
-    
-    # Mock create_user_profile
+    """Test that update_user_memory upserts a profile for a new user."""
     new_profile = {
         "user_id": "newuser",
-        "past_purchases": [],
-        "preferred_colors": [],
-        "preferred_categories": [],
+        "past_purchases": [sample_product["title"]],
+        "preferred_colors": ["blue"],
+        "preferred_categories": ["apparel"],
         "price_range": {"min": 0, "max": 1000},
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "created_at": _FIXTURE_NOW,
+        "updated_at": _FIXTURE_NOW
     }
-    mock_service.create_user_profile = MagicMock(return_value=new_profile)
-    mock_service.users.find_one_and_update.return_value = new_profile
+    # The plain update matches nothing, then the upsert creates the profile
+    mock_service.users.find_one_and_update.side_effect = [None, new_profile]
     
     result = mock_service.update_user_memory("newuser", sample_product)
     
-    # Verify user was created
-    mock_service.create_user_profile.assert_called_once_with("newuser")
+    assert result == new_profile
+    assert mock_service.users.find_one_and_update.call_count == 2
+    mock_service.users.find_one.assert_not_called()
+    mock_service.users.insert_one.assert_not_called()
+    
+    upsert_call = mock_service.users.find_one_and_update.call_args
+    assert upsert_call[1]["upsert"] is True
+    update_ops = upsert_call[0][1]
+    assert update_ops["$setOnInsert"]["price_range"] == {"min": 0, "max": 1000}
+    assert update_ops["$addToSet"]["preferred_colors"] == "blue"
+    assert update_ops["$push"]["past_purchases"]["$each"] == [sample_product["title"]]
+    # Defaults never target a path another operator already writes
+    written = update_ops["$addToSet"].keys() | update_ops["$push"].keys()
+    assert not update_ops["$setOnInsert"].keys() & written
+
+
+def test_update_user_memory_existing_user_single_round_trip(mock_service, sample_product, sample_user_profile):
+    """Test that an existing user is updated without a preceding read."""
+    mock_service.users.find_one_and_update.return_value = sample_user_profile
+    
+    mock_service.update_user_memory("user123", sample_product)
     
-    # Verify update was attempted
     mock_service.users.find_one_and_update.assert_called_once()
+    mock_service.users.find_one.assert_not_called()
+    assert "upsert" not in mock_service.users.find_one_and_update.call_args[1]
 
 
 def test_update_user_memory_missing_title_raises_error(mock_service):
@@ -190,7 +203,6 @@ def test_update_user_memory_handles_missing_optional_fields(mock_service, sample
         # No color, category, or price
     }
     
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
     result = mock_service.update_user_memory("user123", product_minimal, auto_update_preferences=True)
@@ -198,8 +210,8 @@ def test_update_user_memory_handles_missing_optional_fields(mock_service, sample
     # Should still work, just won't update preferences
     assert result is not None
     call_args = mock_service.users.find_one_and_update.call_args
-    assert "$addToSet" in call_args[0][1]
-    assert "past_purchases" in call_args[0][1]["$addToSet"]
+    assert "past_purchases" in call_args[0][1]["$push"]
+    assert "$addToSet" not in call_args[0][1]
 
 
 def test_update_user_memory_handles_empty_color_and_category(mock_service, sample_user_profile):
@@ -211,7 +223,6 @@ def test_update_user_memory_handles_empty_color_and_category(mock_service, sampl
         "price": 25.0
     }
     
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
     result = mock_service.update_user_memory("user123", product_empty, auto_update_preferences=True)
@@ -225,21 +236,22 @@ def test_update_user_memory_case_insensitive_matching(mock_service, sample_user_
     # User has "red" in lowercase
     product = {
         "title": "Red Shirt",
-        "color": "RED",  # Different case
+        "color": " RED ",  # Different case, stray whitespace
         "category": "APPAREL"  # Different case
     }
     
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
     result = mock_service.update_user_memory("user123", product, auto_update_preferences=True)
     
-    # Should recognize RED == red and not add duplicate
+    # Values are lowercased so $addToSet matches the stored "red"/"apparel"
     call_args = mock_service.users.find_one_and_update.call_args
     update_ops = call_args[0][1]
     
-    # Should still process, converting to lowercase
     assert result is not None
+    assert update_ops["$addToSet"]["preferred_colors"] == "red"
+    assert update_ops["$addToSet"]["preferred_categories"] == "apparel"
+    mock_service.users.find_one.assert_not_called()
 
 
 def test_update_user_memory_returns_updated_profile(mock_service, sample_product, sample_user_profile):
@@ -250,7 +262,6 @@ def test_update_user_memory_returns_updated_profile(mock_service, sample_product
         "preferred_colors": sample_user_profile["preferred_colors"] + ["blue"]
     }
     
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
     mock_service.users.find_one_and_update.return_value = updated_profile
     
     result = mock_service.update_user_memory("user123", sample_product)
@@ -260,16 +271,240 @@ def test_update_user_memory_returns_updated_profile(mock_service, sample_product
 
 
 def test_update_user_memory_updates_timestamp(mock_service, sample_product, sample_user_profile):
-    """Test that update_user_memory updates the updated_at timestamp."""
-    mock_service.get_user_profile = MagicMock(return_value=sample_user_profile)
+    """Test that update_user_memory has MongoDB stamp updated_at."""
     mock_service.users.find_one_and_update.return_value = sample_user_profile
     
     result = mock_service.update_user_memory("user123", sample_product)
     
     # Verify timestamp was updated
     call_args = mock_service.users.find_one_and_update.call_args
-    assert "$set" in call_args[0][1]
-    assert "updated_at" in call_args[0][1]["$set"]
+    assert call_args[0][1]["$currentDate"] == {"updated_at": True}
+    assert "$set" not in call_args[0][1]
+
+
+
+def test_past_purchases_capped_at_200(mock_service, sample_product, sample_user_profile):
+    """Test that purchase history writes keep only the most recent titles."""
+    mock_service.users.find_one_and_update.return_value = sample_user_profile
+    
+    mock_service.update_user_memory("user123", sample_product)
+    mock_service.add_purchase("user123", "Green Scarf")
+    
+    assert MAX_PURCHASE_HISTORY == 200
+    for call in mock_service.users.find_one_and_update.call_args_list:
+        assert call[0][1]["$push"]["past_purchases"]["$slice"] == -200
+    
+    created = mock_service.create_user_profile(
+        "heavy_user", past_purchases=[f"Product-{i}" for i in range(500)]
+    )
+    assert len(created["past_purchases"]) == 200
+    assert created["past_purchases"][-1] == "Product-499"
+
+
+@patch("db.user_service.MongoClient")
+def test_connect_creates_user_id_index(mock_client):
+    """Test that connect declares the unique user_id index."""
+    service = UserProfileService()
+    service.connect()
+    
+    service.users.create_index.assert_any_call(
+        [("user_id", ASCENDING)], unique=True, background=True
+    )
+
+
+class _DuplicateKey(Exception):
+    """Stand-in for pymongo's DuplicateKeyError."""
+
+
+@patch("db.user_service.DuplicateKeyError", _DuplicateKey)
+def test_create_user_profile_relies_on_unique_index(mock_service):
+    """Test that duplicates are rejected by the index, not a preceding read."""
+    mock_service.users.insert_one.side_effect = _DuplicateKey()
+    
+    with pytest.raises(ValueError, match="already exists"):
+        mock_service.create_user_profile("user123")
+    
+    mock_service.users.find_one.assert_not_called()
+
+
+def test_update_user_memory_nondurable_uses_w1(mock_service, sample_product, sample_user_profile):
+    """Test that durable=False writes through a w=1, unjournaled collection."""
+    fast_users = mock_service.users.with_options.return_value
+    fast_users.find_one_and_update.return_value = sample_user_profile
+    
+    with patch("db.user_service._FAST_WRITE_CONCERN") as fast_concern:
+        result = mock_service.update_user_memory("user123", sample_product, durable=False)
+    
+    assert result == sample_user_profile
+    mock_service.users.with_options.assert_called_once_with(write_concern=fast_concern)
+    fast_users.find_one_and_update.assert_called_once()
+    mock_service.users.find_one_and_update.assert_not_called()
+
+
+def test_update_user_memory_durable_by_default(mock_service, sample_product, sample_user_profile):
+    """Test that the default write concern is left untouched."""
+    mock_service.users.find_one_and_update.return_value = sample_user_profile
+    
+    mock_service.update_user_memory("user123", sample_product)
+    
+    mock_service.users.with_options.assert_not_called()
+
+
+def test_update_user_memory_bulk_single_roundtrip(mock_service, sample_product):
+    """Test that a batch of products is written with one unordered bulk_write."""
+    products = [
+        sample_product,
+        {"title": "Red Sneakers", "color": "Red", "category": "footwear", "price": 89.0},
+        {"title": "Black Belt"}
+    ]
+    mock_service.users.bulk_write.return_value.matched_count = len(products)
+    
+    recorded = mock_service.update_user_memory_bulk("user123", products)
+    
+    assert recorded == len(products)
+    mock_service.users.bulk_write.assert_called_once()
+    ops = mock_service.users.bulk_write.call_args[0][0]
+    assert len(ops) == len(products)
+    assert mock_service.users.bulk_write.call_args[1]["ordered"] is False
+    mock_service.users.find_one_and_update.assert_not_called()
+
+
+def test_update_user_memory_bulk_creates_user(mock_service, sample_product, sample_user_profile):
+    """Test that a batch for a new user creates the profile, then applies the rest."""
+    products = [sample_product, {"title": "Red Sneakers"}, {"title": "Black Belt"}]
+    mock_service.users.bulk_write.return_value.matched_count = 0
+    mock_service.users.find_one_and_update.side_effect = [None, sample_user_profile]
+    
+    recorded = mock_service.update_user_memory_bulk("new_user", products)
+    
+    assert recorded == 3
+    assert mock_service.users.find_one_and_update.call_args[1]["upsert"] is True
+    retry_ops = mock_service.users.bulk_write.call_args_list[1][0][0]
+    assert len(retry_ops) == 2
+
+
+def test_update_user_memory_bulk_requires_titles(mock_service, sample_product):
+    """Test that a batch with an untitled product is rejected before any write."""
+    with pytest.raises(ValueError):
+        mock_service.update_user_memory_bulk("user123", [sample_product, {"color": "red"}])
+    
+    mock_service.users.bulk_write.assert_not_called()
+
+
+def test_normalize_stored_preferences_rewrites_mixed_case(mock_service):
+    """Test that the migration lowercases and dedupes stored preferences."""
+    stored = {"preferred_colors": ["Blue", "blue", " Red"], "preferred_categories": ["Apparel"]}
+    mock_service.users.find.return_value = [{"_id": "oid1", **stored}]
+    mock_service.users.bulk_write.return_value.modified_count = 1
+    
+    with patch("db.user_service.UpdateOne") as mock_update_one:
+        modified = mock_service.normalize_stored_preferences()
+    
+    assert modified == 1
+    filter_doc, update = mock_update_one.call_args[0]
+    # Only applies if the arrays were not changed since they were read
+    assert filter_doc == {"_id": "oid1", **stored}
+    assert update["$set"] == {"preferred_colors": ["blue", "red"], "preferred_categories": ["apparel"]}
+    mock_service.users.bulk_write.assert_called_once()
+
+
+def test_normalize_stored_preferences_nothing_to_do(mock_service):
+    """Test that the migration sends no writes when every profile is normalized."""
+    mock_service.users.find.return_value = []
+    
+    assert mock_service.normalize_stored_preferences() == 0
+    mock_service.users.bulk_write.assert_not_called()
+
+
+def test_get_user_profile_is_not_cached(mock_service, sample_user_profile):
+    """Test that profile reads always go to MongoDB so edits are seen immediately."""
+    mock_service.users.find_one.return_value = dict(sample_user_profile)
+    
+    mock_service.get_user_profile("user123")
+    mock_service.get_user_profile("user123")
+    
+    assert mock_service.users.find_one.call_count == 2
+
+
+def test_get_user_profile_uses_projection(mock_service, sample_user_profile):
+    """Test that profile reads project only the fields callers use."""
+    mock_service.users.find_one.return_value = dict(sample_user_profile)
+    
+    mock_service.get_user_profile("user123")
+    
+    projection = mock_service.users.find_one.call_args[0][1]
+    assert {"user_id", "past_purchases", "preferred_colors",
+            "preferred_categories", "price_range"} <= projection.keys()
+    assert "created_at" not in projection
+
+
+def test_get_user_preferences_skips_purchases(mock_service):
+    """Test that preference reads leave out the purchase history."""
+    mock_service.users.find_one.return_value = {
+        "user_id": "user123",
+        "preferred_colors": ["red"],
+        "preferred_categories": [],
+        "price_range": {"min": 0, "max": 1000}
+    }
+    
+    prefs = mock_service.get_user_preferences("user123")
+    
+    assert prefs["preferred_colors"] == ["red"]
+    projection = mock_service.users.find_one.call_args[0][1]
+    assert "past_purchases" not in projection
+    assert projection["_id"] == 0
+
+
+def test_get_user_stats_uses_cache(mock_service, sample_user_profile):
+    """Test that repeated stats lookups are computed once and served from the cache."""
+    mock_service.users.find_one.return_value = dict(sample_user_profile)
+    
+    first = mock_service.get_user_stats("user123")
+    second = mock_service.get_user_stats("user123")
+    
+    assert first == second
+    assert first.purchase_count == 2
+    assert set(first.dominant_colors) == {"red", "black"}
+    mock_service.users.find_one.assert_called_once()
+
+
+def test_update_user_memory_invalidates_cache(mock_service, sample_product, sample_user_profile):
+    """Test that recording a purchase drops the cached stats."""
+    mock_service.users.find_one.return_value = dict(sample_user_profile)
+    mock_service.get_user_stats("user123")
+    
+    updated_profile = {
+        **sample_user_profile,
+        "past_purchases": sample_user_profile["past_purchases"] + [sample_product["title"]]
+    }
+    mock_service.users.find_one_and_update.return_value = updated_profile
+    mock_service.update_user_memory("user123", sample_product)
+    
+    mock_service.users.find_one.return_value = dict(updated_profile)
+    stats = mock_service.get_user_stats("user123")
+    assert stats.purchase_count == 3
+    assert "blue" in stats.dominant_colors
+
+
+def test_get_user_stats_missing_user(mock_service):
+    """Test that stats for an unknown user are None and not cached."""
+    mock_service.users.find_one.return_value = None
+    
+    assert mock_service.get_user_stats("ghost") is None
+    assert mock_service.get_user_stats("ghost") is None
+    assert mock_service.users.find_one.call_count == 2
+
+
+def test_stats_cache_expires_entries(sample_user_profile):
+    """Test that cached stats are recomputed once the TTL has passed."""
+    service = UserProfileService(cache_ttl=0)
+    service.users = MagicMock()
+    service.users.find_one.return_value = dict(sample_user_profile)
+    
+    service.get_user_stats("user123")
+    service.get_user_stats("user123")
+    
+    assert service.users.find_one.call_count == 2
 
 
 if __name__ == "__main__":
@@ -10,7 +10,7 @@ from datetime import datetime
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from models.user import UserProfile, UserProfileInDB, UserPreferences
+from models.user import UserProfile, UserProfileInDB, UserPreferences, UserStats
 
 
 class TestUserProfileModel:
@@ -90,6 +90,49 @@ class TestUserProfileModel:
             assert profile.price_range == pr
 
 
+class TestUserStatsModel:
+    """Test UserStats Pydantic model."""
+    
+    def test_create_stats(self):
+        """Test creating stats from analyzed purchase history."""
+        stats = UserStats(
+            user_id="USER-001",
+            purchase_count=3,
+            dominant_colors={"blue": 2, "black": 1},
+            style_keywords={"casual": 2},
+            product_types={"shoes": 1}
+        )
+        
+        assert stats.user_id == "USER-001"
+        assert stats.purchase_count == 3
+        assert next(iter(stats.dominant_colors)) == "blue"
+    
+    def test_stats_with_defaults(self):
+        """Test that aggregates default to empty."""
+        stats = UserStats(user_id="USER-002")
+        
+        assert stats.purchase_count == 0
+        assert stats.dominant_colors == {}
+        assert stats.style_keywords == {}
+        assert stats.product_types == {}
+        assert isinstance(stats.computed_at, datetime)
+    
+    def test_stats_are_immutable(self):
+        """Cached stats are shared, so fields cannot be reassigned."""
+        stats = UserStats(user_id="USER-003", purchase_count=1)
+        
+        with pytest.raises(Exception):
+            stats.purchase_count = 2
+    
+    def test_stats_json_serialization(self):
+        """Test stats can be serialized to JSON."""
+        stats = UserStats(user_id="USER-004", dominant_colors={"red": 1})
+        
+        json_data = stats.model_dump()
+        assert json_data["user_id"] == "USER-004"
+        assert json_data["dominant_colors"] == {"red": 1}
+
+
 class TestUserPreferencesModel:
     """Test UserPreferences Pydantic model for updates."""
     
@@ -182,17 +225,33 @@ class TestUserProfileValidation:
         with pytest.raises(Exception):
             UserProfile()
     
-    def test_duplicate_preferences_allowed(self):
-        """Test that duplicate colors/categories are allowed."""
+    def test_duplicate_preferences_collapsed(self):
+        """Test that colors/categories are lowercased and deduped; purchases are not."""
         profile = UserProfile(
             user_id="TEST-DUP",
-            preferred_colors=["blue", "blue", "blue"],
+            preferred_colors=["blue", "Blue", " BLUE ", "red"],
+            preferred_categories=["Apparel", "apparel", ""],
             past_purchases=["Item1", "Item1"]
         )
         
-        assert profile.preferred_colors.count("blue") == 3
+        assert profile.preferred_colors == ["blue", "red"]
+        assert profile.preferred_categories == ["apparel"]
         assert profile.past_purchases.count("Item1") == 2
     
+    def test_colors_are_interned(self):
+        """Equal normalized values share one string object across profiles."""
+        first = UserProfile(user_id="A", preferred_colors=["".join(["Bl", "ue"])])
+        second = UserProfile(user_id="B", preferred_colors=[" BLUE"])
+        
+        assert first.preferred_colors[0] is second.preferred_colors[0]
+    
+    def test_preferences_update_normalized(self):
+        """Test that preference updates are normalized the same way."""
+        prefs = UserPreferences(preferred_colors=["Navy", "navy"])
+        
+        assert prefs.preferred_colors == ["navy"]
+        assert prefs.preferred_categories is None
+    
     def test_large_purchase_history(self):
         """Test handling large purchase history."""
         purchases = [f"Product-{i}" for i in range(1000)]
@@ -202,6 +261,8 @@ class TestUserProfileValidation:
         )
         
         assert len(profile.past_purchases) == 1000
+        assert len(profile.recent_purchases) == 200
+        assert profile.recent_purchases[0] == "Product-999"
     
     def test_special_characters_in_text(self):
         """Test special characters in user data."""
@@ -229,8 +290,9 @@ class TestUserProfileComparison:
             "price_range": {"min": 10, "max": 100}
         }
         
-        profile1 = UserProfile(**data)
-        profile2 = UserProfile(**data)
+        # Trusted input, so skip validation
+        profile1 = UserProfile.model_construct(**data)
+        profile2 = UserProfile.model_construct(**data)
         
         # Both should have same user_id and preferences
         assert profile1.user_id == profile2.user_id